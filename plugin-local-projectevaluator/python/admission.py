@@ -0,0 +1,262 @@
+"""
+Admission control in front of model calls.
+
+At most `limit` Cortex calls run at once; further calls wait in per-course
+queues that are served round-robin, so one large course cannot starve the
+others. When the wait queue (or a course's share of it) is full, a call is
+rejected at once, and the caller answers 429 with a Retry-After estimate.
+
+The limit adapts (AIMD): every call that finishes within
+ADMISSION_LATENCY_TARGET raises it by 1/limit, so about one slot per round of
+calls. A slow or failed call multiplies it by ADMISSION_DECREASE_FACTOR, at
+most once per round, because calls already in flight still reflect the old load.
+"""
+import asyncio
+import math
+import os
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from typing import Optional, Tuple
+
+from resilience import CircuitOpenError
+from telemetry import (
+    ADMISSION_IN_FLIGHT,
+    ADMISSION_LIMIT,
+    ADMISSION_QUEUED,
+    ADMISSION_REJECTED,
+    get_logger,
+    record_span,
+)
+
+
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "true").lower() in ("1", "true", "yes")
+# Keep ADMISSION_MAX_IN_FLIGHT at or below SNOWFLAKE_POOL_MAX_SIZE
+ADMISSION_MAX_IN_FLIGHT = int(os.getenv("ADMISSION_MAX_IN_FLIGHT", "8"))
+ADMISSION_MIN_IN_FLIGHT = int(os.getenv("ADMISSION_MIN_IN_FLIGHT", "1"))
+ADMISSION_LATENCY_TARGET = float(os.getenv("ADMISSION_LATENCY_TARGET", "45"))  # seconds per call
+ADMISSION_DECREASE_FACTOR = float(os.getenv("ADMISSION_DECREASE_FACTOR", "0.75"))
+ADMISSION_QUEUE_SIZE = int(os.getenv("ADMISSION_QUEUE_SIZE", "64"))
+ADMISSION_QUEUE_PER_COURSE = int(os.getenv("ADMISSION_QUEUE_PER_COURSE", "32"))
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "120"))
+
+MAX_RETRY_AFTER = 300
+
+logger = get_logger("admission")
+
+# (fairness key, whether calls may be rejected) for model calls made by the current request
+_scope: ContextVar[Tuple[str, bool]] = ContextVar("admission_scope", default=("default", True))
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def course_key(course_id: Optional[int] = None, assignment_id: Optional[int] = None) -> str:
+    """Fairness key: the course if the caller sent one, else the assignment."""
+    if course_id is not None:
+        return f"course:{course_id}"
+    if assignment_id is not None:
+        return f"assignment:{assignment_id}"
+    return "default"
+
+
+@contextmanager
+def admission_scope(key: str, can_reject: bool = True):
+    """
+    Model calls made inside this block queue under `key`. Background jobs
+    and batches pass can_reject=False: they wait for a slot without a queue
+    bound or timeout, since their own worker counts already limit them.
+    """
+    token = _scope.set((key, can_reject))
+    try:
+        yield
+    finally:
+        _scope.reset(token)
+
+
+class AdmissionSlot:
+    """
+    Handed to the caller. mark_failed() counts the call as an error without
+    raising; a streaming caller sets `latency` to the time to first token, so
+    a slow reader does not look like a slow Cortex.
+    """
+
+    def __init__(self, sequence: int):
+        self.sequence = sequence
+        self.started = time.monotonic()
+        self.latency: Optional[float] = None
+        self.ok = True
+
+    def mark_failed(self):
+        self.ok = False
+
+
+class AdmissionController:
+    def __init__(
+        self,
+        max_limit: int = ADMISSION_MAX_IN_FLIGHT,
+        min_limit: int = ADMISSION_MIN_IN_FLIGHT,
+        latency_target: float = ADMISSION_LATENCY_TARGET,
+        decrease_factor: float = ADMISSION_DECREASE_FACTOR,
+        queue_size: int = ADMISSION_QUEUE_SIZE,
+        queue_per_key: int = ADMISSION_QUEUE_PER_COURSE,
+        queue_timeout: float = ADMISSION_QUEUE_TIMEOUT,
+        enabled: bool = ADMISSION_ENABLED,
+    ):
+        self.max_limit = max(1, max_limit)
+        self.min_limit = max(1, min(min_limit, self.max_limit))
+        self.latency_target = latency_target
+        self.decrease_factor = decrease_factor
+        self.queue_size = queue_size
+        self.queue_per_key = queue_per_key
+        self.queue_timeout = queue_timeout
+        self.enabled = enabled
+
+        self.limit = float(self.max_limit)
+        self.in_flight = 0
+        self._waiters: "OrderedDict[str, deque[asyncio.Future]]" = OrderedDict()
+        self._queued = 0
+        self._started = 0          # calls admitted so far; each slot remembers its number
+        self._decrease_epoch = 0   # value of _started at the last decrease
+        self._latency = latency_target  # moving average, for Retry-After
+        self.rejected = 0
+        ADMISSION_LIMIT.set(self.limit)
+
+    # -------------------------------------------------------------------------
+    # Queueing
+    # -------------------------------------------------------------------------
+
+    def _has_capacity(self) -> bool:
+        return self.in_flight < int(self.limit)
+
+    def retry_after(self) -> int:
+        """Seconds until a new call would likely get a slot."""
+        rounds = (self._queued + 1) / max(1, int(self.limit))
+        return max(1, min(MAX_RETRY_AFTER, math.ceil(self._latency * rounds)))
+
+    def _reject(self, reason: str, message: str) -> AdmissionRejected:
+        self.rejected += 1
+        ADMISSION_REJECTED.labels(reason).inc()
+        retry_after = self.retry_after()
+        logger.warning("Model call rejected", extra={"reason": reason, "retry_after": retry_after, **self.stats()})
+        return AdmissionRejected(message, retry_after)
+
+    def check(self, key: str):
+        """Raise AdmissionRejected now if a call under `key` would be rejected, before any work starts."""
+        if not self.enabled or self._has_capacity():
+            return
+        if self._queued >= self.queue_size:
+            raise self._reject("queue_full", "The evaluator is at capacity; please retry shortly.")
+        if len(self._waiters.get(key, ())) >= self.queue_per_key:
+            raise self._reject("course_queue_full", "Too many evaluations are already waiting for this course; please retry shortly.")
+
+    def _admit(self) -> AdmissionSlot:
+        self.in_flight += 1
+        self._started += 1
+        ADMISSION_IN_FLIGHT.set(self.in_flight)
+        return AdmissionSlot(self._started)
+
+    def _dispatch(self):
+        """Hand free slots to waiters, taking one from each course in turn."""
+        while self._waiters and self._has_capacity():
+            key, waiters = self._waiters.popitem(last=False)
+            future = waiters.popleft()
+            self._queued -= 1
+            if waiters:
+                self._waiters[key] = waiters  # back of the rotation
+            if not future.done():
+                future.set_result(self._admit())
+        ADMISSION_QUEUED.set(self._queued)
+
+    def _forget(self, key: str, future: asyncio.Future):
+        waiters = self._waiters.get(key)
+        if waiters is not None and future in waiters:
+            waiters.remove(future)
+            self._queued -= 1
+            if not waiters:
+                del self._waiters[key]
+            ADMISSION_QUEUED.set(self._queued)
+
+    async def acquire(self, key: str, can_reject: bool = True) -> AdmissionSlot:
+        if self._has_capacity() and not self._queued:
+            return self._admit()
+        if can_reject:
+            self.check(key)
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(key, deque()).append(future)
+        self._queued += 1
+        ADMISSION_QUEUED.set(self._queued)
+        waited = time.monotonic()
+        try:
+            slot = await asyncio.wait_for(future, self.queue_timeout if can_reject else None)
+        except asyncio.TimeoutError:
+            self._forget(key, future)
+            raise self._reject("queue_timeout", "Timed out waiting for capacity; please retry shortly.")
+        except asyncio.CancelledError:
+            self._forget(key, future)
+            if future.done() and not future.cancelled():
+                self.release(future.result(), None)  # granted just as the caller went away
+            raise
+        record_span("admission_wait", time.monotonic() - waited, key=key)
+        return slot
+
+    # -------------------------------------------------------------------------
+    # AIMD
+    # -------------------------------------------------------------------------
+
+    def release(self, slot: AdmissionSlot, ok: Optional[bool]):
+        """
+        Free the slot and adapt the limit. `ok` is None when the call was
+        cancelled or refused by an open circuit, which says nothing about
+        Cortex and leaves the limit alone.
+        """
+        self.in_flight -= 1
+        ADMISSION_IN_FLIGHT.set(self.in_flight)
+        latency = slot.latency if slot.latency is not None else time.monotonic() - slot.started
+        if ok is not None:
+            self._latency = 0.8 * self._latency + 0.2 * latency
+            if ok and latency <= self.latency_target:
+                self.limit = min(float(self.max_limit), self.limit + 1 / self.limit)
+            elif slot.sequence > self._decrease_epoch:
+                self.limit = max(float(self.min_limit), self.limit * self.decrease_factor)
+                self._decrease_epoch = self._started
+                logger.info("Lowered the model call limit", extra={
+                    "limit": round(self.limit, 2), "latency_s": round(latency, 2), "failed": not ok,
+                })
+            ADMISSION_LIMIT.set(self.limit)
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self):
+        """Hold a slot for one model call, using the key set by admission_scope()."""
+        if not self.enabled:
+            yield AdmissionSlot(0)
+            return
+        key, can_reject = _scope.get()
+        slot = await self.acquire(key, can_reject)
+        ok: Optional[bool] = None
+        try:
+            yield slot
+            ok = slot.ok
+        except CircuitOpenError:
+            # Refused without reaching Cortex, so it says nothing about its load
+            raise
+        except Exception:
+            ok = False
+            raise
+        finally:
+            self.release(slot, ok)
+
+    def stats(self) -> dict:
+        return {
+            "limit": round(self.limit, 2),
+            "in_flight": self.in_flight,
+            "queued": self._queued,
+            "courses_waiting": len(self._waiters),
+            "rejected": self.rejected,
+        }
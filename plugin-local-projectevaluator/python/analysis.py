@@ -0,0 +1,474 @@
+"""
+Static analysis of a submission before it is evaluated.
+
+Every source file is measured locally: lines of code, comment lines,
+function count and cyclomatic complexity (from `ast` for Python, from a
+comment- and string-aware scan for other languages). The per-language totals,
+the most complex functions and README/test presence go into the evaluation
+prompt as a short section of facts, so the model does not have to estimate
+them from raw text. Files recognized as boilerplate (generated code, framework
+scaffolding, minified or empty files) are reported to packing, which leaves
+them out of the prompt.
+
+Analysis is CPU-bound, so large submissions are split into batches of files
+that run on a process pool; small ones run on a worker thread, where
+starting a task costs less than the work.
+"""
+import ast
+import asyncio
+import json
+import multiprocessing
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+
+ANALYSIS_ENABLED = os.getenv("ANALYSIS_ENABLED", "true").lower() in ("1", "true", "yes")
+ANALYSIS_WORKERS = int(os.getenv("ANALYSIS_WORKERS", str(os.cpu_count() or 2)))
+ANALYSIS_BYTES_PER_TASK = int(os.getenv("ANALYSIS_BYTES_PER_TASK", str(512 * 1024)))
+# Submissions smaller than this are analyzed on a thread instead of the pool
+ANALYSIS_POOL_MIN_BYTES = int(os.getenv("ANALYSIS_POOL_MIN_BYTES", str(1024 * 1024)))
+ANALYSIS_TIMEOUT = float(os.getenv("ANALYSIS_TIMEOUT", "30"))
+ANALYSIS_DROP_BOILERPLATE = os.getenv("ANALYSIS_DROP_BOILERPLATE", "true").lower() in ("1", "true", "yes")
+
+# Functions at or above this complexity are listed by name
+HIGH_COMPLEXITY = 10
+MOST_COMPLEX_SHOWN = 5
+# Average characters per line above which a file is minified rather than written
+MINIFIED_LINE_LENGTH = 300
+
+LANGUAGES = {
+    'py': 'Python', 'ipynb': 'Python', 'js': 'JavaScript', 'jsx': 'JavaScript', 'mjs': 'JavaScript',
+    'cjs': 'JavaScript', 'ts': 'TypeScript', 'tsx': 'TypeScript', 'java': 'Java', 'kt': 'Kotlin',
+    'c': 'C', 'h': 'C', 'cpp': 'C++', 'hpp': 'C++', 'cc': 'C++', 'cs': 'C#', 'go': 'Go', 'rs': 'Rust',
+    'rb': 'Ruby', 'php': 'PHP', 'swift': 'Swift', 'scala': 'Scala', 'r': 'R', 'm': 'Objective-C',
+    'sql': 'SQL', 'html': 'HTML', 'css': 'CSS', 'scss': 'SCSS', 'vue': 'Vue', 'svelte': 'Svelte', 'sh': 'Shell',
+}
+
+_C_COMMENTS = r'//[^\n]*|/\*.*?\*/'
+_HASH_COMMENTS = r'#[^\n]*'
+_HTML_COMMENTS = r'<!--.*?-->'
+COMMENT_SYNTAX = {
+    'Python': _HASH_COMMENTS, 'Ruby': _HASH_COMMENTS, 'R': _HASH_COMMENTS, 'Shell': _HASH_COMMENTS,
+    'PHP': _C_COMMENTS + '|' + _HASH_COMMENTS, 'SQL': r'--[^\n]*|/\*.*?\*/',
+    'HTML': _HTML_COMMENTS, 'Vue': _HTML_COMMENTS + '|' + _C_COMMENTS, 'Svelte': _HTML_COMMENTS + '|' + _C_COMMENTS,
+    'CSS': r'/\*.*?\*/', 'SCSS': _C_COMMENTS,
+}
+_STRINGS = r'"(?:\\.|[^"\\\n])*"|\'(?:\\.|[^\'\\\n])*\''
+STRING_SYNTAX = {
+    'Python': r'"""[\s\S]*?"""|\'\'\'[\s\S]*?\'\'\'|' + _STRINGS,
+    'JavaScript': r'`(?:\\.|[^`\\])*`|' + _STRINGS,
+    'TypeScript': r'`(?:\\.|[^`\\])*`|' + _STRINGS,
+    'Vue': r'`(?:\\.|[^`\\])*`|' + _STRINGS,
+    'Svelte': r'`(?:\\.|[^`\\])*`|' + _STRINGS,
+    'Go': r'`[^`]*`|' + _STRINGS,
+}
+
+DECISION_PATTERN = re.compile(r'\b(?:if|for|while|case|catch|elif|elsif|except|when|foreach|guard|unless|until)\b|&&|\|\|')
+
+_C_FAMILY_FUNCTION = (
+    r'^[ \t]*(?:[\w:<>\[\],*&~]+[ \t]+)+[*&]?(?!(?:if|for|while|switch|catch|return|new|else)\b)'
+    r'[A-Za-z_~][\w:]*[ \t]*\([^;{}()]*(?:\([^;{}()]*\)[^;{}()]*)*\)[ \t\w,.]*\s*\{'
+)
+_JS_FUNCTION = (
+    r'\bfunction\b|=>|^[ \t]*(?:(?:async|static|public|private|protected|get|set)[ \t]+)*'
+    r'(?!(?:if|for|while|switch|catch|return)\b)[A-Za-z_$][\w$]*[ \t]*\([^;{}()]*\)[ \t]*(?::[^{;\n]+)?\{'
+)
+FUNCTION_SYNTAX = {
+    'JavaScript': _JS_FUNCTION, 'TypeScript': _JS_FUNCTION, 'Vue': _JS_FUNCTION, 'Svelte': _JS_FUNCTION,
+    'Java': _C_FAMILY_FUNCTION, 'C': _C_FAMILY_FUNCTION, 'C++': _C_FAMILY_FUNCTION, 'C#': _C_FAMILY_FUNCTION,
+    'Objective-C': _C_FAMILY_FUNCTION, 'Go': r'\bfunc\b', 'Rust': r'\bfn\b', 'Swift': r'\bfunc\b',
+    'Kotlin': r'\bfun\b', 'Scala': r'\bdef\b', 'Ruby': r'\bdef\b', 'PHP': r'\bfunction\b', 'R': r'\bfunction\b',
+    'Shell': r'^[ \t]*(?:function[ \t]+)?[\w-]+[ \t]*\(\)[ \t]*\{', 'SQL': r'(?i)\bcreate[ \t]+(?:or[ \t]+replace[ \t]+)?(?:function|procedure)\b',
+}
+
+# Header comments that code generators write; prose that merely mentions generation does not count
+GENERATED_MARKER = re.compile(
+    r'^[ \t]*(?:#|//|/\*+|\*|<!--|--)[ \t]*(?:'
+    r'.*@generated\b'
+    r'|Code generated .* DO NOT EDIT\.'
+    r'|Generated by Django \d'
+    r'|Generated by the protocol buffer compiler'
+    r')',
+    re.MULTILINE,
+)
+# How far into a file the generator header may start
+GENERATED_HEADER_CHARS = 500
+
+# Files that frameworks write into every new project, recognized by name and a line of their stock content
+SCAFFOLD_SIGNATURES = {
+    'manage.py': "Django's command-line utility",
+    'wsgi.py': 'WSGI config for',
+    'asgi.py': 'ASGI config for',
+    'setuptests.js': '@testing-library/jest-dom',
+    'setuptests.ts': '@testing-library/jest-dom',
+    'reportwebvitals.js': 'onPerfEntry',
+    'reportwebvitals.ts': 'onPerfEntry',
+    'serviceworker.js': 'register a service worker',
+    'app.test.js': 'renders learn react link',
+    'next-env.d.ts': 'should not be edited',
+    'vite-env.d.ts': 'vite/client',
+    'polyfills.ts': 'polyfills needed by Angular',
+    'karma.conf.js': 'Karma configuration file',
+}
+
+
+def _compile(language: str) -> Tuple[re.Pattern, Optional[re.Pattern]]:
+    comments = COMMENT_SYNTAX.get(language, _C_COMMENTS)
+    strings = STRING_SYNTAX.get(language, _STRINGS)
+    functions = FUNCTION_SYNTAX.get(language)
+    return (
+        re.compile(f'(?P<s>{strings})|(?P<c>{comments})', re.DOTALL),
+        re.compile(functions, re.MULTILINE) if functions else None,
+    )
+
+
+_SYNTAX = {language: _compile(language) for language in set(LANGUAGES.values())}
+
+
+def language_of(path: str) -> Optional[str]:
+    name = path.rsplit('/', 1)[-1].lower()
+    return LANGUAGES.get(name.rsplit('.', 1)[-1]) if '.' in name else None
+
+
+def is_readme(path: str) -> bool:
+    return path.rsplit('/', 1)[-1].lower().startswith('readme')
+
+
+def is_test_file(path: str) -> bool:
+    lowered = path.lower()
+    name = lowered.rsplit('/', 1)[-1]
+    return name.startswith('test') or '_test.' in name or '.test.' in name or '.spec.' in name or '/tests/' in f"/{lowered}"
+
+
+@dataclass
+class FileMetrics:
+    path: str
+    language: str
+    code_lines: int = 0
+    comment_lines: int = 0
+    blank_lines: int = 0
+    functions: int = 0
+    complexity: int = 0                                 # sum over functions; each starts at 1
+    complex_functions: List[Tuple[str, int]] = field(default_factory=list)  # (name, complexity), Python only
+    syntax_error: bool = False
+    boilerplate: Optional[str] = None                   # "generated", "scaffold", "minified" or "empty"
+
+
+# =============================================================================
+# PER-FILE ANALYSIS (runs in pool workers)
+# =============================================================================
+
+
+def _strip(content: str, language: str) -> str:
+    """`content` with comments blanked and string literals reduced to placeholders; line numbers are kept."""
+    pattern = _SYNTAX[language][0]
+
+    def replace(match):
+        text = match.group()
+        if match.lastgroup == "c":
+            return "\n" * text.count("\n")
+        return re.sub(r'[^\n]+', 's', text)
+    return pattern.sub(replace, content)
+
+
+def _count_lines(metrics: FileMetrics, content: str, stripped: str) -> None:
+    for original, code in zip(content.split("\n"), stripped.split("\n")):
+        if code.strip():
+            metrics.code_lines += 1
+        elif original.strip():
+            metrics.comment_lines += 1
+        else:
+            metrics.blank_lines += 1
+
+
+# Python's decision points: if/elif (statements, conditional expressions and
+# comprehension filters), loops and comprehension clauses, except, match cases,
+# and each and/or
+PYTHON_DECISION_PATTERN = re.compile(r'\b(?:if|elif|for|while|except|case|and|or)\b')
+_BLOCK_FIELDS = ("body", "orelse", "finalbody", "handlers", "cases")
+
+
+def _analyze_python(metrics: FileMetrics, content: str, stripped: str) -> bool:
+    """
+    Functions, complexity and docstring lines; False if the file does not
+    parse. The syntax tree gives function extents (statements only, never
+    expressions); complexity is the decision keywords within each extent,
+    counted once per line on `stripped`, less those of nested functions.
+    """
+    try:
+        tree = ast.parse(content)
+    except (SyntaxError, ValueError):
+        return False
+
+    decisions_before = [0]  # decisions_before[n]: decision keywords on lines 1..n
+    for line in stripped.split("\n"):
+        decisions_before.append(decisions_before[-1] + len(PYTHON_DECISION_PATTERN.findall(line)))
+
+    docstring_lines = 0
+    functions = []  # (qualified name, own decisions)
+    stack = [(tree, "", None)]
+    while stack:
+        node, prefix, owner = stack.pop()
+        body = getattr(node, "body", None)
+        if isinstance(node, (ast.Module, ast.ClassDef, ast.FunctionDef, ast.AsyncFunctionDef)) and body \
+                and isinstance(body[0], ast.Expr) and isinstance(body[0].value, ast.Constant) \
+                and isinstance(body[0].value.value, str):
+            docstring_lines += body[0].end_lineno - body[0].lineno + 1
+        for name in _BLOCK_FIELDS:
+            for child in getattr(node, name, None) or ():
+                if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                    inclusive = decisions_before[child.end_lineno] - decisions_before[child.lineno - 1]
+                    if owner is not None:
+                        functions[owner][1] -= inclusive
+                    functions.append([prefix + child.name, inclusive])
+                    stack.append((child, f"{prefix}{child.name}.", len(functions) - 1))
+                elif isinstance(child, ast.ClassDef):
+                    stack.append((child, f"{prefix}{child.name}.", owner))
+                else:
+                    stack.append((child, prefix, owner))
+
+    for name, decisions in functions:
+        complexity = 1 + decisions
+        metrics.functions += 1
+        metrics.complexity += complexity
+        if complexity >= HIGH_COMPLEXITY:
+            metrics.complex_functions.append((name, complexity))
+
+    # Docstrings are documentation, though the line scan sees string literals as code
+    docstring_lines = min(docstring_lines, metrics.code_lines)
+    metrics.code_lines -= docstring_lines
+    metrics.comment_lines += docstring_lines
+    metrics.complex_functions.sort(key=lambda item: item[1], reverse=True)
+    return True
+
+
+def _notebook_code(content: str) -> str:
+    """The code cells of a Jupyter notebook, one after another."""
+    try:
+        cells = json.loads(content).get("cells", [])
+    except (ValueError, AttributeError):
+        return ""
+    sources = []
+    for cell in cells:
+        if isinstance(cell, dict) and cell.get("cell_type") == "code":
+            source = cell.get("source", "")
+            sources.append("".join(source) if isinstance(source, list) else str(source))
+    # IPython magics and shell escapes are not Python
+    return "\n\n".join(re.sub(r'(?m)^[ \t]*[%!].*$', '', source) for source in sources)
+
+
+def _boilerplate(path: str, content: str, metrics: FileMetrics) -> Optional[str]:
+    name = path.rsplit('/', 1)[-1].lower()
+    if GENERATED_MARKER.search(content[:GENERATED_HEADER_CHARS]):
+        return "generated"
+    signature = SCAFFOLD_SIGNATURES.get(name)
+    if signature and signature in content[:2000]:
+        return "scaffold"
+    lines = metrics.code_lines + metrics.comment_lines + metrics.blank_lines
+    if metrics.code_lines and len(content) / lines > MINIFIED_LINE_LENGTH:
+        return "minified"
+    if metrics.code_lines == 0 and metrics.comment_lines <= 5:
+        return "empty"
+    return None
+
+
+def analyze_file(path: str, content: str) -> Optional[FileMetrics]:
+    """Metrics for one file; None for files in no known language."""
+    language = language_of(path)
+    if language is None:
+        return None
+    if path.lower().endswith('.ipynb'):
+        content = _notebook_code(content)
+
+    metrics = FileMetrics(path, language)
+    stripped = _strip(content, language)
+    _count_lines(metrics, content, stripped)
+    if language != "Python" or not _analyze_python(metrics, content, stripped):
+        metrics.syntax_error = language == "Python"
+        function_pattern = _SYNTAX[language][1]
+        metrics.functions = len(function_pattern.findall(stripped)) if function_pattern else 0
+        metrics.complexity = metrics.functions + len(DECISION_PATTERN.findall(stripped))
+    metrics.boilerplate = _boilerplate(path, content, metrics)
+    return metrics
+
+
+def analyze_files(items: List[Tuple[str, str]]) -> List[FileMetrics]:
+    """Pool task: a batch of (path, content) pairs."""
+    results = []
+    for path, content in items:
+        metrics = analyze_file(path, content)
+        if metrics is not None:
+            results.append(metrics)
+    return results
+
+
+# =============================================================================
+# SUBMISSION REPORT
+# =============================================================================
+
+
+@dataclass
+class AnalysisReport:
+    files: List[FileMetrics] = field(default_factory=list)
+    readme: Optional[str] = None
+    readme_lines: int = 0
+    test_files: int = 0
+
+    @property
+    def boilerplate(self) -> Dict[str, str]:
+        """Path -> reason, for the files packing may leave out."""
+        return {m.path: m.boilerplate for m in self.files if m.boilerplate}
+
+    def languages(self) -> Dict[str, dict]:
+        totals: Dict[str, dict] = {}
+        for m in self.files:
+            if m.boilerplate:
+                continue
+            entry = totals.setdefault(m.language, {"files": 0, "code_lines": 0, "comment_lines": 0, "functions": 0, "complexity": 0})
+            entry["files"] += 1
+            entry["code_lines"] += m.code_lines
+            entry["comment_lines"] += m.comment_lines
+            entry["functions"] += m.functions
+            entry["complexity"] += m.complexity
+        for entry in totals.values():
+            written = entry["code_lines"] + entry["comment_lines"]
+            entry["comment_density"] = round(entry["comment_lines"] / written, 3) if written else 0.0
+        return dict(sorted(totals.items(), key=lambda item: item[1]["code_lines"], reverse=True))
+
+    def most_complex(self) -> List[Tuple[str, int]]:
+        functions = [
+            (f"{m.path}:{name}", complexity)
+            for m in self.files if not m.boilerplate for name, complexity in m.complex_functions
+        ]
+        return sorted(functions, key=lambda item: item[1], reverse=True)[:MOST_COMPLEX_SHOWN]
+
+    def report(self) -> dict:
+        return {
+            "languages": self.languages(),
+            "most_complex_functions": [{"function": name, "complexity": c} for name, c in self.most_complex()],
+            "readme": self.readme,
+            "test_files": self.test_files,
+            "syntax_errors": [m.path for m in self.files if m.syntax_error],
+            "boilerplate": self.boilerplate,
+        }
+
+    def format_for_llm(self) -> str:
+        """The STATIC ANALYSIS section of the evaluation prompt."""
+        languages = self.languages()
+        if not languages and self.readme is None:
+            return ""
+        lines = ["--- STATIC ANALYSIS (measured locally over every file, including files not shown) ---"]
+        for language, entry in languages.items():
+            mean = entry["complexity"] / entry["functions"] if entry["functions"] else 0
+            lines.append(
+                f"{language}: {entry['code_lines']} code lines in {entry['files']} file{'s' if entry['files'] != 1 else ''}, "
+                f"comment density {entry['comment_density']:.0%}, {entry['functions']} functions"
+                + (f", mean cyclomatic complexity {mean:.1f}" if entry["functions"] else "")
+            )
+        most_complex = self.most_complex()
+        if most_complex:
+            lines.append("Most complex functions: " + ", ".join(f"{name} ({c})" for name, c in most_complex))
+        lines.append(f"README: {self.readme} ({self.readme_lines} lines)" if self.readme else "README: none")
+        lines.append(f"Test files: {self.test_files}")
+        syntax_errors = [m.path for m in self.files if m.syntax_error]
+        if syntax_errors:
+            lines.append("Files that do not parse: " + ", ".join(syntax_errors[:10]))
+        boilerplate = self.boilerplate
+        if boilerplate:
+            lines.append(f"Boilerplate files (generated, scaffolding, minified or empty): {len(boilerplate)}")
+        lines.append("--- END STATIC ANALYSIS ---\n")
+        return "\n".join(lines)
+
+
+# =============================================================================
+# PROCESS POOL STAGE
+# =============================================================================
+
+
+class AnalysisError(Exception):
+    pass
+
+
+class StaticAnalyzer:
+    def __init__(
+        self,
+        workers: int = ANALYSIS_WORKERS,
+        bytes_per_task: int = ANALYSIS_BYTES_PER_TASK,
+        pool_min_bytes: int = ANALYSIS_POOL_MIN_BYTES,
+        timeout: float = ANALYSIS_TIMEOUT,
+    ):
+        self.workers = max(1, workers)
+        self.bytes_per_task = max(1, bytes_per_task)
+        self.pool_min_bytes = pool_min_bytes
+        self.timeout = timeout
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn: forking a process that holds Snowflake/HTTP threads is unsafe
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._executor
+
+    def _batches(self, items: List[Tuple[str, str]], total: int) -> List[List[Tuple[str, str]]]:
+        # At least one batch per worker, so a mid-sized submission still spreads out
+        limit = min(self.bytes_per_task, max(1, total // self.workers))
+        batches, current, size = [], [], 0
+        for item in items:
+            if current and size + len(item[1]) > limit:
+                batches.append(current)
+                current, size = [], 0
+            current.append(item)
+            size += len(item[1])
+        if current:
+            batches.append(current)
+        return batches
+
+    async def _analyze(self, items: List[Tuple[str, str]], total: int) -> List[FileMetrics]:
+        if total < self.pool_min_bytes:
+            return await asyncio.to_thread(analyze_files, items)
+        loop = asyncio.get_running_loop()
+        results = await asyncio.gather(
+            *(loop.run_in_executor(self.executor, analyze_files, batch) for batch in self._batches(items, total))
+        )
+        return [metrics for batch in results for metrics in batch]
+
+    async def analyze(self, files) -> AnalysisReport:
+        """
+        Analyze a submission's files (anything with `path` and `content`).
+        Raises AnalysisError on timeout or when the pool cannot run the work;
+        work already handed to the pool finishes in the background after a timeout.
+        """
+        report = AnalysisReport()
+        items = []
+        for submission_file in files:
+            if is_readme(submission_file.path) and (
+                report.readme is None or submission_file.path.count('/') < report.readme.count('/')
+            ):
+                report.readme = submission_file.path
+                report.readme_lines = submission_file.content.count("\n") + 1
+            if language_of(submission_file.path) is not None:
+                items.append((submission_file.path, submission_file.content))
+                if is_test_file(submission_file.path):
+                    report.test_files += 1
+        total = sum(len(content) for _, content in items)
+        try:
+            report.files = await asyncio.wait_for(self._analyze(items, total), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            raise AnalysisError(f"analysis timed out after {self.timeout}s")
+        except (BrokenProcessPool, OSError, RuntimeError) as e:
+            # A broken pool is replaced on the next call; analysis is optional, evaluation goes on
+            self.shutdown()
+            raise AnalysisError(f"analysis worker failed: {e}")
+        return report
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
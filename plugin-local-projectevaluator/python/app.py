@@ -1,45 +1,105 @@
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-from pydantic import BaseModel
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from pydantic import BaseModel, model_validator
 from typing import List, Optional
 import uvicorn
 import os
 import base64
-import io
+import asyncio
 import re
 import snowflake.connector
 import zipfile
 import json # <-- Added for JSON parsing
-import requests # <-- Added for GitHub API
+import httpx
 import tarfile
-import io
+import tempfile
+import shutil
+import time
+import uuid
+import sqlite3
 from urllib.parse import urlparse
+from contextlib import asynccontextmanager
+from functools import lru_cache
 
 
 
 from dotenv import load_dotenv
 
+# Local modules read their settings from the environment at import time
+load_dotenv()
 
-# Document processing imports
-try:
-    import PyPDF2
-    PDF_AVAILABLE = True
-except ImportError:
-    PDF_AVAILABLE = False
+from analysis import ANALYSIS_DROP_BOILERPLATE, ANALYSIS_ENABLED, AnalysisError, AnalysisReport, StaticAnalyzer
+from admission import AdmissionController, AdmissionRejected, admission_scope, course_key
+from batch import BatchItem, BatchJob, BatchRunner
+from cache import (
+    EVAL_CACHE_MAX_BYTES,
+    EVAL_CACHE_MAX_ENTRIES,
+    EVAL_CACHE_PATH,
+    EVAL_CACHE_TTL,
+    SQLiteCache,
+    content_key,
+)
+from cortex import CORTEX_MODEL
+from documents import (
+    DOC_TEXT_CACHE_MAX_BYTES,
+    DOC_MAX_UPLOAD_BYTES,
+    DOC_TEXT_CACHE_PATH,
+    DOCUMENT_TYPES,
+    DocumentExtractor,
+    DocumentStore,
+    DocumentTooLarge,
+    document_hash,
+    document_text_key,
+    document_type_from_filename,
+    extract_text_sync,
+)
+from evaluation import EVAL_REPAIR_MODEL, EvaluationParseError, parse_or_repair
+from execution import TEST_EXECUTION_ENABLED, TEST_FILE_MAX_BYTES, TestRun, TestRunError, TestRunner, instructor_test_name
+from github_fetcher import GitHubError, GitHubFetcher, read_repository_tarball
+from incremental import INCREMENTAL_EVALUATION, SubmissionHistory, format_unchanged_for_llm
+from ingest import ARCHIVE_EXTENSIONS, MAX_UPLOAD_BYTES, ArchiveLimitError, SubmissionFile, ingest_archive
+from jobs import JOB_MAX_WAIT, JOB_UPLOAD_DIR, JobQueue, JobStore, public_job
+from llm import LLM_BACKEND, create_backend
+from mapreduce import MapReduceError, map_chunks, needs_map_reduce, split_into_chunks
+from packing import format_packed_for_llm, pack_files, pack_ingest_result
+from prompts import ASSIGNMENT_SECTION_CACHE_SIZE, LayeredPrompt
+from resilience import CircuitBreaker, CircuitOpenError, call_with_retries, call_with_retries_sync, record_outcome, retry_budget
+from similarity import SIMILARITY_ENABLED, SimilarityIndex
+from telemetry import (
+    CACHE_LOOKUPS,
+    METRICS_CONTENT_TYPE,
+    NEAR_DUPLICATES,
+    PROMPT_CHARS,
+    SKIPPED_FILES,
+    SUBMISSION_FILES,
+    TEST_RUNS,
+    RequestTelemetryMiddleware,
+    get_logger,
+    metrics_payload,
+    record_span,
+    request_elapsed,
+    span,
+)
 
 
-try:
-    import docx
-    DOCX_AVAILABLE = True
-except ImportError:
-    DOCX_AVAILABLE = False
+logger = get_logger("app")
 
 
-load_dotenv()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await llm_backend.start()
+    await job_queue.start()
+    yield
+    await job_queue.stop()
+    await batch_runner.shutdown()
+    await github_fetcher.close()
+    document_extractor.shutdown()
+    static_analyzer.shutdown()
+    await llm_backend.stop()
 
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 
 app.add_middleware(
@@ -50,6 +110,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Outermost, so the request id and timings cover everything else
+app.add_middleware(RequestTelemetryMiddleware)
+
 
 # =============================================================================
 # MODELS
@@ -58,14 +121,24 @@ app.add_middleware(
 
 class DocumentData(BaseModel):
     filename: str
-    content: str  # Base64 encoded string
-    type: str
+    content: Optional[str] = None  # Base64 encoded string
+    type: Optional[str] = None
+    document_id: Optional[str] = None  # Handle returned by POST /documents/, instead of content
+
+    @model_validator(mode="after")
+    def check_source(self):
+        if not self.content and not self.document_id:
+            raise ValueError("Either content or document_id is required")
+        if self.content and not self.type:
+            raise ValueError("type is required when content is provided")
+        return self
 
 
 class ProjectRequest(BaseModel):
     topics: str
     complexity: str
     documents: Optional[List[DocumentData]] = []
+    course_id: Optional[int] = None  # fairness key for admission control
 
 
 # =============================================================================
@@ -73,144 +146,103 @@ class ProjectRequest(BaseModel):
 # =============================================================================
 
 
-def clean_text(text: str, max_chars: int = 50000) -> str:
-    """Clean text for Snowflake SQL compatibility"""
+def clean_text(text: str, max_chars: Optional[int] = 50000) -> str:
+    """
+    Strip control characters and truncate. Prompts are sent to Cortex as bind
+    parameters, so quotes need no escaping and newlines/indentation are kept.
+    Pass max_chars=None to skip truncation.
+    """
     if not text or not text.strip():
         return ""
     
-    # Remove control characters and normalize whitespace
+    # Remove control characters (tabs and newlines are kept)
     text = re.sub(r'[\x00-\x08\x0b\x0c\x0e-\x1f\x7f-\x9f]', '', text)
-    text = re.sub(r'\s+', ' ', text)
     text = text.strip()
     
-    # Truncate if too long
-    if len(text) > max_chars:
-        truncate_pos = text.rfind('.', 0, max_chars - 50)
+    # Truncate if too long, preferably at a line break
+    if max_chars and len(text) > max_chars:
+        truncate_pos = text.rfind('\n', 0, max_chars - 50)
         if truncate_pos == -1:
             truncate_pos = max_chars - 50
-        text = text[:truncate_pos] + " [Content truncated...]"
+        text = text[:truncate_pos] + "\n[Content truncated...]"
     
-    # Escape single quotes for SQL
-    return text.replace("'", "''")
+    return text
 
 
 def extract_document_text(doc: DocumentData) -> str:
-    """Extract and clean text from a single document object"""
+    """Extract and clean text from a single document object (in-process)"""
     try:
-        raw_text = ""
         # The content is expected to be a base64 encoded string
         decoded_content = base64.b64decode(doc.content)
-
-
-        if doc.type == 'txt':
-            raw_text = decoded_content.decode('utf-8', errors='ignore')
-        
-        elif doc.type == 'pdf' and PDF_AVAILABLE:
-            pdf_reader = PyPDF2.PdfReader(io.BytesIO(decoded_content))
-            raw_text = "\n".join(page.extract_text() for page in pdf_reader.pages if page.extract_text())
-        
-        elif doc.type in ['doc', 'docx'] and DOCX_AVAILABLE:
-            document = docx.Document(io.BytesIO(decoded_content))
-            raw_text = "\n".join(p.text for p in document.paragraphs if p.text.strip())
-        
+        raw_text = extract_text_sync(doc.type, decoded_content)
         return clean_text(raw_text) if raw_text else f"[Could not extract text from {doc.filename}]"
     
     except Exception as e:
-        print(f"Error processing {doc.filename}: {e}")
+        logger.warning("Could not process document", extra={"document": doc.filename, "error": str(e)})
         return f"[Error processing {doc.filename}]"
 
 
-def format_zip_contents_for_llm(zip_file: zipfile.ZipFile, path_prefix: str = "") -> str:
+async def extract_documents_text(documents: List[DocumentData]) -> List[str]:
     """
-    Reads a zip file and formats its text-based contents into a single string
-    suitable for an LLM prompt. Handles nested zip files.
+    Extract and clean text from all documents, in parallel on the process pool.
+    Text is cached by a hash of the document bytes, so a syllabus that was
+    already parsed (or uploaded once via /documents/) is never parsed again.
+    Returns one entry per document, using the same placeholder messages as
+    extract_document_text() for failures.
     """
-    formatted_parts = []
-    skipped_files = []
-    
-    for item_info in zip_file.infolist():
-        # Construct the full path for display
-        full_filename = f"{path_prefix}{item_info.filename}"
-
-        # Skip directories and common metadata/cache files
-        if item_info.is_dir() or '__pycache__' in item_info.filename or '.DS_Store' in item_info.filename:
-            continue
+    with span("document_parse", documents=len(documents)) as attributes:
+        texts, hits = await _extract_documents_text(documents)
+        attributes["cache_hits"] = hits
+    return texts
+
+
+async def _extract_documents_text(documents: List[DocumentData]) -> tuple:
+    def resolve_all():
+        # (type, hash, bytes or stored path); workers read a stored document from disk themselves
+        resolved = []
+        for doc in documents:
+            if doc.document_id:
+                found = document_store.locate(doc.document_id)
+                if found is None:
+                    raise HTTPException(status_code=404, detail=f"Unknown document_id for {doc.filename}")
+                resolved.append((found[0], doc.document_id, found[1]))
+            else:
+                data = base64.b64decode(doc.content)
+                resolved.append((doc.type, document_hash(data), data))
+        return resolved
+
+    resolved = await asyncio.to_thread(resolve_all)
+    texts: List[Optional[str]] = [document_text_cache.get(document_text_key(t, digest)) for t, digest, _ in resolved]
+
+    misses = [i for i, text in enumerate(texts) if text is None]
+    if misses:
+        results = await document_extractor.extract_many([(resolved[i][0], resolved[i][2]) for i in misses])
+        for i, result in zip(misses, results):
+            doc = documents[i]
+            if isinstance(result, Exception):
+                logger.warning("Could not process document", extra={"document": doc.filename, "error": str(result)})
+                texts[i] = f"[Error processing {doc.filename}]"
+            elif result:
+                texts[i] = clean_text(result)
+                document_text_cache.set(document_text_key(resolved[i][0], resolved[i][1]), texts[i])
+            else:
+                texts[i] = f"[Could not extract text from {doc.filename}]"
+    hits = len(documents) - len(misses)
+    CACHE_LOOKUPS.labels("document_text", "hit").inc(hits)
+    CACHE_LOOKUPS.labels("document_text", "miss").inc(len(misses))
+    return texts, hits
 
-        try:
-            with zip_file.open(item_info) as file_in_zip:
-                content_bytes = file_in_zip.read()
-
-                # NEW: Check for and handle nested zip files
-                if item_info.filename.lower().endswith('.zip'):
-                    print(f"Found nested zip: {full_filename}. Processing recursively.")
-                    nested_zip_in_memory = io.BytesIO(content_bytes)
-                    with zipfile.ZipFile(nested_zip_in_memory, 'r') as nested_zip_ref:
-                        # Recursively call the function with a path prefix
-                        nested_content = format_zip_contents_for_llm(nested_zip_ref, path_prefix=f"{full_filename}/")
-                        formatted_parts.append(nested_content)
-                    continue
-
-                # Try decoding as UTF-8, if it fails, it's likely a binary file
-                content_str = content_bytes.decode('utf-8')
-                
-                formatted_parts.append(f"--- FILE: {full_filename} ---")
-                formatted_parts.append(content_str)
-                formatted_parts.append("--- END FILE ---\n")
-
-        except UnicodeDecodeError:
-            skipped_files.append(full_filename)
-            print(f"Skipping binary or non-UTF-8 file: {full_filename}")
-        except zipfile.BadZipFile:
-            skipped_files.append(full_filename)
-            print(f"Skipping corrupted or invalid zip file: {full_filename}")
-        except Exception as e:
-            skipped_files.append(full_filename)
-            print(f"Error reading {full_filename} from zip: {e}")
-
-    if skipped_files:
-        formatted_parts.append(f"NOTE: The following binary or unreadable files were skipped: {', '.join(skipped_files)}")
-
-    return "\n".join(formatted_parts)
-
-def format_tar_contents_for_llm(tar_bytes: bytes) -> str:
-    """
-    Reads a tar (or tar.gz) file as bytes and formats its text-based contents into a single string
-    suitable for an LLM prompt.
-    """
-    formatted_parts = []
-    skipped_files = []
-
-    tar_file_in_memory = io.BytesIO(tar_bytes)
-    with tarfile.open(fileobj=tar_file_in_memory) as tar:
-        for member in tar.getmembers():
-            # Skip directories and common metadata/cache files
-            if member.isdir() or member.name.endswith('.DS_Store') or '__pycache__' in member.name:
-                continue
-            try:
-                file_obj = tar.extractfile(member)
-                if file_obj is None:
-                    skipped_files.append(member.name)
-                    continue
-                content_bytes = file_obj.read()
-                content_str = content_bytes.decode('utf-8')
-                formatted_parts.append(f"--- FILE: {member.name} ---")
-                formatted_parts.append(content_str)
-                formatted_parts.append("--- END FILE ---\n")
-            except UnicodeDecodeError:
-                skipped_files.append(member.name)
-            except Exception as e:
-                skipped_files.append(member.name)
-    if skipped_files:
-        formatted_parts.append(f"NOTE: The following binary or unreadable files were skipped: {', '.join(skipped_files)}")
-    return "\n".join(formatted_parts)
 
 # =============================================================================
 # PROMPT BUILDERS
 # =============================================================================
 
 
-def build_project_prompt(topics: str, complexity: str, documents: Optional[List[DocumentData]] = []) -> str:
-    """Builds a prompt for generating a course project."""
+def build_project_prompt(topics: str, complexity: str, documents: Optional[List[DocumentData]] = [], document_texts: Optional[List[str]] = None) -> str:
+    """
+    Builds a prompt for generating a course project. Pass `document_texts`
+    (one per document) when the text has already been extracted.
+    """
     # (Your original build_prompt function, renamed for clarity)
     prompt_parts = [
         "**Role:** You are an expert instructional designer and curriculum developer. Your goal is to create a practical, hands-on project that bridges theory with real-world application.",
@@ -240,8 +272,9 @@ def build_project_prompt(topics: str, complexity: str, documents: Optional[List[
     if documents:
         doc_header = ["**REFERENCE COURSE CONTENT:**", "========================================", "Analyze the following course materials to ensure the project is perfectly aligned with the learning objectives.", ""]
         doc_body = []
-        for i, doc in enumerate(documents, 1):
-            doc_text = extract_document_text(doc)
+        if document_texts is None:
+            document_texts = [extract_document_text(doc) for doc in documents]
+        for i, (doc, doc_text) in enumerate(zip(documents, document_texts), 1):
             if "[Could not extract" not in doc_text and "[Error processing" not in doc_text:
                 doc_body.append(f"**Document {i}: {doc.filename}**")
                 doc_body.append(doc_text)
@@ -251,14 +284,35 @@ def build_project_prompt(topics: str, complexity: str, documents: Optional[List[
             prompt_parts = doc_header + doc_body + doc_footer + prompt_parts
 
 
+    # Each document is already truncated; cutting the whole prompt would drop the instructions
     full_prompt = "\n".join(prompt_parts)
-    return clean_text(full_prompt)
+    return clean_text(full_prompt, max_chars=None)
 
 
-def build_evaluation_prompt(project_criteria: str, submission_code: str) -> str:
-    """Builds a prompt for evaluating a student's project submission."""
-    # This prompt is updated to place greater emphasis on the problem statement.
-    prompt_template = f"""
+FILE_NOTES_INSTRUCTION = """
+**Also include** a top-level `"file_notes"` object in the JSON, mapping the path of every file shown in full to one or two sentences on what it implements and any problems in it. These notes stand in for the file when an unchanged copy is resubmitted.
+"""
+
+MAP_REDUCE_INSTRUCTION = """
+**Note:** This submission was too large to read at once. Instead of the code, you are given findings from reviewers who each read one part of it in full. Treat the findings as accurate and score the complete project from them.
+"""
+
+STATIC_ANALYSIS_INSTRUCTION = """
+**Note:** The STATIC ANALYSIS section was measured locally over every file in the submission. Treat its numbers as accurate, use them for language detection, code quality and documentation, and do not recount them.
+"""
+
+TEST_RESULTS_INSTRUCTION = """
+**Note:** The TEST RESULTS section comes from actually running the tests against this code. Ground the Functionality & Correctness score in it: failing tests are evidence of unmet requirements, and a run that crashed or timed out is evidence the code does not work as submitted. Refer to failing tests by name in areas_of_improvement.
+"""
+
+RESUBMISSION_INSTRUCTION = """
+**Note:** This is a resubmission. Only new or changed files are shown in full; files listed under UNCHANGED FILES are represented by notes from the previous review, which you should treat as accurate. Evaluate the complete project.
+"""
+
+
+# This prompt is updated to place greater emphasis on the problem statement.
+# Static, so it is cleaned once per process and starts every evaluation prompt.
+EVALUATION_SYSTEM_SECTION = clean_text("""
 **Role:** You are **Project Insight**, an AI-powered code analysis and evaluation expert. Your goal is to provide a comprehensive assessment of a student-submitted project against a specific problem statement.
 
 **Task:** Evaluate a student's project submission based on the provided **Problem Statement & Criteria**. Your evaluation must be fair, detailed, and directly measure the submission's success in meeting the specified requirements.
@@ -284,43 +338,88 @@ def build_evaluation_prompt(project_criteria: str, submission_code: str) -> str:
 
 **FINAL OUTPUT (return only this JSON object):**
 ```
-{{
+{
   "overall_score": <number>,
-  "scores": {{
+  "scores": {
     "code_quality": <number>,
     "functionality_correctness": <number>,
     "documentation": <number>
-  }},
-  "report": {{
+  },
+  "report": {
     "strengths": ["<A bullet list of the project's main strengths, with specific examples and file references that tie back to the problem statement's requirements>"],
     "areas_of_improvement": ["<A bullet list of weaknesses. For each item, include the file name, explain why it fails to meet a requirement or best practice, and provide a concrete, actionable fix.>"],
     "summary": "<A concise high-level paragraph describing project quality, its adherence to the problem statement, and recommended next steps.>"
-  }}
-}}
+  }
+}
 ```
+""", max_chars=None)
 
+
+@lru_cache(maxsize=ASSIGNMENT_SECTION_CACHE_SIZE)
+def evaluation_assignment_section(project_criteria: str) -> str:
+    """The criteria block, built once per assignment and shared by all its submissions."""
+    return clean_text(f"""
 **INPUT 1: PROBLEM STATEMENT & CRITERIA**
 ============================
 {project_criteria}
 ============================
-
+""", max_chars=None)
+
+
+def build_evaluation_prompt(
+    project_criteria: str,
+    submission_code: str,
+    file_notes: bool = False,
+    resubmission: bool = False,
+    map_reduce: bool = False,
+    static_analysis: bool = False,
+    test_results: bool = False,
+) -> LayeredPrompt:
+    """
+    Builds a prompt for evaluating a student's project submission. `file_notes`
+    asks for per-file notes (kept for incremental re-evaluation), `resubmission`
+    explains the unchanged-files section, `map_reduce` says the code has been
+    replaced by per-chunk findings, `static_analysis` says the code starts
+    with locally measured metrics and `test_results` that it starts with the
+    outcome of running tests. Only the submission section is built here;
+    the instructions and criteria sections are shared (see prompts.py).
+    """
+    extra_instructions = (
+        (STATIC_ANALYSIS_INSTRUCTION if static_analysis else "")
+        + (TEST_RESULTS_INSTRUCTION if test_results else "")
+        + (MAP_REDUCE_INSTRUCTION if map_reduce else "")
+        + (RESUBMISSION_INSTRUCTION if resubmission else "")
+        + (FILE_NOTES_INSTRUCTION if file_notes else "")
+    )
+    submission_section = f"""
 **INPUT 2: STUDENT'S SUBMITTED CODE**
 ============================
 {submission_code}
 ============================
-
+{extra_instructions}
 Now, please provide the evaluation based on the instructions and format above.
 """
-    return clean_text(prompt_template)
+    # The submission has already been packed to its token budget; truncating here
+    # would cut off student code and the closing instructions
+    return LayeredPrompt(
+        [EVALUATION_SYSTEM_SECTION, evaluation_assignment_section(project_criteria)],
+        clean_text(submission_section, max_chars=None),
+    )
 
 # =============================================================================
 # SNOWFLAKE CONNECTION
 # =============================================================================
 
 
+# Completions and connection setup each get a breaker: a login runs inside a
+# completion, and one breaker at both levels would see its own trial in flight
+llm_breaker = CircuitBreaker(LLM_BACKEND)
+connect_breaker = CircuitBreaker(f"{LLM_BACKEND}_connect")
+
+
 def get_snowflake_connection():
-    """Create Snowflake connection"""
-    return snowflake.connector.connect(
+    """Create Snowflake connection, retrying transient network errors"""
+    return call_with_retries_sync(lambda: snowflake.connector.connect(
         account=os.getenv("SNOWFLAKE_ACCOUNT"),
         user=os.getenv("SNOWFLAKE_USER"), 
         password=os.getenv("SNOWFLAKE_PASSWORD"),
@@ -328,281 +427,439 @@ def get_snowflake_connection():
         schema=os.getenv("SNOWFLAKE_SCHEMA"),
         role=os.getenv("SNOWFLAKE_ROLE"),
         warehouse=os.getenv("SNOWFLAKE_WAREHOUSE"),
-    )
+        paramstyle="qmark",  # server-side binding, see CortexClient
+    ), connect_breaker, "connect")
+
+
+# Shared by all endpoints: Snowflake Cortex (pooled sessions, completions run off
+# the event loop) or, with LLM_BACKEND=fake, a local stand-in for load testing
+llm_backend = create_backend(LLM_BACKEND, connect=get_snowflake_connection)
+
+# Cache keys name the model; a fake backend must never share entries with Cortex
+MODEL_KEY = CORTEX_MODEL if LLM_BACKEND == "snowflake" else f"{LLM_BACKEND}:{CORTEX_MODEL}"
+
+# Process pool for PDF/DOCX text extraction
+document_extractor = DocumentExtractor()
+
+# Process pool for per-file metrics of large submissions
+static_analyzer = StaticAnalyzer()
+
+# Sandboxed pytest runs, several submissions at a time
+test_runner = TestRunner()
+
+# Uploaded reference documents by content hash, and their cleaned text
+document_store = DocumentStore()
+document_text_cache = SQLiteCache(DOC_TEXT_CACHE_PATH, max_bytes=DOC_TEXT_CACHE_MAX_BYTES)
+
+# Per-student file hashes and notes for incremental re-evaluation
+submission_history = SubmissionHistory()
+
+# MinHash signatures of every submission per assignment, for near-duplicate reports
+similarity_index = SimilarityIndex()
+
+# Bounds in-flight model calls, with per-course wait queues and an adaptive limit
+admission = AdmissionController()
+
+# Pooled GitHub client with ETag / commit-SHA caching
+github_fetcher = GitHubFetcher()
+
+# Parsed evaluations keyed on (model, criteria, formatted submission)
+evaluation_cache = SQLiteCache(
+    EVAL_CACHE_PATH,
+    ttl=EVAL_CACHE_TTL,
+    max_entries=EVAL_CACHE_MAX_ENTRIES,
+    max_bytes=EVAL_CACHE_MAX_BYTES,
+)
 
 
 # =============================================================================
-# API ENDPOINTS
+# EVALUATION PIPELINES
 # =============================================================================
 
 
-@app.post("/generate-project/")
-async def generate_project(request: ProjectRequest):
-    """Endpoint to generate a new project description."""
+def too_busy(e: AdmissionRejected) -> HTTPException:
+    return HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+
+def upstream_unavailable(e: CircuitOpenError) -> HTTPException:
+    return HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+
+def check_admission(key: str):
+    """Answer 429 before reading the submission if its model calls would be rejected anyway."""
     try:
-        print(f"Processing: {request.topics} ({request.complexity}) with {len(request.documents)} documents")
-        
-        prompt = build_project_prompt(request.topics, request.complexity, request.documents)
-        
-        conn = get_snowflake_connection()
-        cursor = conn.cursor()
-        
-        sql = f"""
-        SELECT SNOWFLAKE.CORTEX.COMPLETE(
-            'claude-3-5-sonnet',
-            '{prompt}'
-        ) as response
-        """
-        
-        cursor.execute(sql)
-        result = cursor.fetchone()
-        
-        cursor.close()
-        conn.close()
-        
-        if result and result[0]:
-            return {
-                "project_description": result[0],
-                "documents_processed": len(request.documents),
-                "document_names": [doc.filename for doc in request.documents]
-            }
-        else:
-            raise HTTPException(status_code=500, detail="No response from Snowflake Cortex")
-            
+        admission.check(key)
+    except AdmissionRejected as e:
+        raise too_busy(e)
+
+
+async def complete(prompt: str, kind: str, model: Optional[str] = None) -> Optional[str]:
+    """
+    One model call, timed and counted by prompt kind (generate, evaluation,
+    map, repair). Waits for an admission slot first; raises 429 if rejected.
+    Transient errors are retried with the same prompt; raises 503 when the
+    circuit is open or retries run out.
+    """
+    PROMPT_CHARS.labels(kind).observe(len(prompt))
+    try:
+        async with admission.slot() as slot:
+            with span("llm_complete", kind=kind, prompt_chars=len(prompt)) as attributes:
+                response_text = await call_with_retries(lambda: llm_backend.complete(prompt, model), llm_breaker, kind)
+                attributes["response_chars"] = len(response_text or "")
+            if not response_text:
+                slot.mark_failed()
+    except AdmissionRejected as e:
+        raise too_busy(e)
+    except CircuitOpenError as e:
+        raise upstream_unavailable(e)
     except Exception as e:
-        print(f"Error in /generate-project/: {e}")
-        raise HTTPException(status_code=500, detail=f"Failed to generate project: {str(e)}")
+        if getattr(e, "retries_exhausted", False):
+            raise HTTPException(status_code=503, detail=f"Snowflake Cortex is unavailable: {e}")
+        raise
+    return response_text
 
 
-# =============================================================================
-# UPDATED ENDPOINT
-# =============================================================================
-@app.post("/evaluate-project/")
-async def evaluate_project(criteria: str = Form(...), file: UploadFile = File(...)):
+def record_ingest(source: str, ingest_result) -> None:
+    """Observe file and skip counts for an uploaded archive or GitHub tarball."""
+    SUBMISSION_FILES.labels(source).observe(len(ingest_result.files))
+    SKIPPED_FILES.labels(source).observe(len(ingest_result.skipped))
+
+
+async def analyze_submission(files: List[SubmissionFile]) -> Optional[AnalysisReport]:
+    """Static metrics for the prompt and the response; None when disabled or if analysis fails."""
+    if not ANALYSIS_ENABLED:
+        return None
+    try:
+        with span("static_analysis", files=len(files)) as attributes:
+            analysis = await static_analyzer.analyze(files)
+            attributes.update(analyzed=len(analysis.files), boilerplate=len(analysis.boilerplate))
+    except AnalysisError as e:
+        logger.warning("Static analysis skipped", extra={"error": str(e)})
+        return None
+    return analysis
+
+
+def dropped_boilerplate(analysis: Optional[AnalysisReport]) -> Optional[dict]:
+    return analysis.boilerplate if analysis is not None and ANALYSIS_DROP_BOILERPLATE else None
+
+
+def pack_submission(ingest_result, criteria: str, analysis: Optional[AnalysisReport]):
+    """Pack without boilerplate, unless boilerplate is all there is."""
+    packed = pack_ingest_result(ingest_result, criteria, boilerplate=dropped_boilerplate(analysis))
+    if not packed.files and packed.boilerplate:
+        packed = pack_ingest_result(ingest_result, criteria)
+    return packed
+
+
+async def run_submission_tests(files: List[SubmissionFile], tests: Optional[SubmissionFile]) -> Optional[TestRun]:
     """
-    Endpoint to evaluate a student's project.
-    Accepts project criteria and a zip file of the student's work.
-    Returns a structured JSON evaluation.
+    Instructor tests, or else the project's own, run in the sandbox. None when
+    disabled, for a submission with no Python or no tests, or if the sandbox fails.
     """
-    # 1. Validate input file
-    if not (file.filename.endswith('.zip') or file.filename.endswith('.tar') or file.filename.endswith('.tar.gz')):
-        raise HTTPException(status_code=400, detail="Invalid file type. Please upload a .zip or .tar(.gz) file.")
+    if not TEST_EXECUTION_ENABLED:
+        return None
+    try:
+        with span("test_execution", files=len(files), instructor_tests=tests is not None) as attributes:
+            test_run = await test_runner.run(files, tests)
+            if test_run is not None:
+                attributes.update(outcome=test_run.outcome, tests=len(test_run.cases), failed=test_run.count("failed"))
+    except TestRunError as e:
+        logger.warning("Test execution skipped", extra={"error": str(e)})
+        return None
+    if test_run is not None:
+        TEST_RUNS.labels(test_run.source, test_run.outcome).inc()
+    return test_run
+
+
+def local_sections(analysis: Optional[AnalysisReport], test_run: Optional[TestRun]) -> str:
+    """Locally measured facts that precede the code in the prompt (and key the cache)."""
+    return (analysis.format_for_llm() if analysis is not None else "") + (test_run.format_for_llm() if test_run is not None else "")
+
+
+def local_details(analysis: Optional[AnalysisReport], similarity: Optional[dict], test_run: Optional[TestRun] = None) -> dict:
+    """Response fields computed without the model."""
+    details = {}
+    if analysis is not None:
+        details["analysis"] = analysis.report()
+    if similarity is not None:
+        details["similarity"] = similarity
+    if test_run is not None:
+        details["tests"] = test_run.report()
+    return details
+
+
+async def find_similar_submissions(source: str, label: str, files: List[SubmissionFile], assignment_id, user_id) -> Optional[dict]:
+    """
+    Near-duplicate submissions to the same assignment, from the local index.
+    Indexes this one too when the student is known. None without an
+    assignment, for a submission too small to compare, or if the index fails.
+    """
+    if not SIMILARITY_ENABLED or assignment_id is None:
+        return None
+    try:
+        with span("similarity", files=len(files)) as attributes:
+            report = await asyncio.to_thread(similarity_index.check, assignment_id, user_id, label, files)
+            if report is not None:
+                attributes.update(candidates=report["candidates"], peers=len(report["peers"]))
+    except sqlite3.Error as e:
+        logger.warning("Similarity index unavailable", extra={"error": str(e)})
+        return None
+    if report and report["peers"]:
+        NEAR_DUPLICATES.labels(source).inc()
+        logger.info("Near-duplicate submissions", extra={
+            "assignment_id": assignment_id, "user_id": user_id, "peers": [peer["user_id"] for peer in report["peers"]],
+        })
+    return report
+
+
+def record_packing(packed) -> None:
+    logger.info("Packed submission", extra={
+        "files": len(packed.files),
+        "tokens_used": packed.tokens_used,
+        "token_budget": packed.token_budget,
+        "dropped": len(packed.dropped),
+    })
+
+
+async def parse_evaluation_response(response_text: str) -> dict:
+    """
+    Validated evaluation from the model output. Malformed JSON gets a cheap
+    repair call; if that fails too the request fails instead of inventing scores.
+    """
+    def repair(prompt: str):
+        return complete(prompt, "repair", EVAL_REPAIR_MODEL or CORTEX_MODEL)
 
     try:
-        print(f"Evaluating submission: {file.filename}")
-
-        # 2. Read and process the ZIP file in memory
-        formatted_code = ""
-        content_bytes = await file.read()
-        if file.filename.endswith('.zip'):
-            with zipfile.ZipFile(io.BytesIO(content_bytes), 'r') as zip_ref:
-                formatted_code = format_zip_contents_for_llm(zip_ref)
-        else:  # .tar or .tar.gz
-            formatted_code = format_tar_contents_for_llm(content_bytes)
-        
-        if not formatted_code.strip():
-            raise HTTPException(status_code=400, detail="Archive is empty or contains no readable text files.")
-
-        # 3. Build the evaluation prompt
-        prompt = build_evaluation_prompt(criteria, formatted_code)
-        print(f"Evaluation prompt length: {len(prompt)} characters")
-        
-        # 4. Execute Snowflake Cortex query
-        conn = get_snowflake_connection()
-        cursor = conn.cursor()
-        
-        sql = f"""
-        SELECT SNOWFLAKE.CORTEX.COMPLETE(
-            'claude-3-5-sonnet',
-            '{prompt}'
-        ) as response
-        """
-        
-        cursor.execute(sql)
-        result = cursor.fetchone()
-        
-        cursor.close()
-        conn.close()
-        
-        # 5. Parse the LLM response and return as JSON
-        if result and result[0]:
-            response_text = result[0]
-            print(f"Raw response from AI: {response_text[:500]}...")  # Debug log
-            
-            # Find the JSON block, even if there's other text
-            json_match = re.search(r'```json\s*(\{.*?\})\s*```', response_text, re.DOTALL)
-            if not json_match:
-                # As a fallback, find the first '{' and last '}'
-                start = response_text.find('{')
-                end = response_text.rfind('}')
-                if start != -1 and end != -1:
-                    json_str = response_text[start:end+1]
-                else:
-                    # If no JSON found, create a basic response
-                    print("No JSON found in response, creating fallback response")
-                    evaluation_json = {
-                        "overall_score": 75,
-                        "scores": {
-                            "code_quality": 25,
-                            "functionality_correctness": 35,
-                            "documentation": 15
-                        },
-                        "report": {
-                            "strengths": ["Code is submitted and appears functional"],
-                            "areas_of_improvement": ["Could not parse detailed AI analysis"],
-                            "summary": "Submission received and basic evaluation completed. Manual review recommended."
-                        }
-                    }
-                    return JSONResponse(content={"evaluation": evaluation_json})
-            else:
-                json_str = json_match.group(1)
-
-            try:
-                # Parse the extracted string into a dictionary
-                evaluation_json = json.loads(json_str)
-                print(f"Successfully parsed JSON: {evaluation_json}")  # Debug log
-                return JSONResponse(content={"evaluation": evaluation_json})
-            except json.JSONDecodeError as e:
-                # If parsing fails, the model's output was malformed
-                print(f"JSON parsing failed: {e}")
-                print(f"Attempted to parse: {json_str[:200]}...")
-                
-                # Create a fallback response
-                evaluation_json = {
-                    "overall_score": 70,
-                    "scores": {
-                        "code_quality": 24,
-                        "functionality_correctness": 32,
-                        "documentation": 14
-                    },
-                    "report": {
-                        "strengths": ["Submission received and processed"],
-                        "areas_of_improvement": ["AI response format issue - manual review recommended"],
-                        "summary": "Evaluation completed with parsing issues. The submission was analyzed but the detailed response could not be fully parsed."
-                    }
-                }
-                return JSONResponse(content={"evaluation": evaluation_json})
-        else:
-            raise HTTPException(status_code=500, detail="No response from Snowflake Cortex during evaluation.")
-            
-    except Exception as e:
-        print(f"Error in /evaluate-project/: {e}")
-        # Re-raise HTTPException to preserve status code and detail
-        if isinstance(e, HTTPException):
-            raise e
-        # Wrap other exceptions in a standard 500 error
-        raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {str(e)}")
+        # Includes the repair call, if one is needed (also timed as llm_complete)
+        with span("json_parse", response_chars=len(response_text)):
+            return await parse_or_repair(response_text, repair)
+    except EvaluationParseError as e:
+        raise HTTPException(status_code=502, detail=f"Could not parse the evaluation returned by Snowflake Cortex: {str(e)[:300]}")
+
+
+def evaluation_cache_key(criteria: str, formatted_code: str, files: List[SubmissionFile]) -> str:
+    """`formatted_code` covers what fits in one prompt; a map-reduce evaluation reads every file."""
+    parts = [MODEL_KEY, criteria, formatted_code]
+    if needs_map_reduce(files):
+        for submission_file in files:
+            parts += [submission_file.path, submission_file.content]
+    return content_key(*parts)
+
+
+async def run_evaluation(
+    criteria: str,
+    formatted_code: str,
+    files: List[SubmissionFile],
+    preamble: str = "",
+    assignment_id: Optional[int] = None,
+    user_id: Optional[int] = None,
+    label: str = "evaluation",
+    analysis: Optional[AnalysisReport] = None,
+    test_run: Optional[TestRun] = None,
+    skipped: Optional[List[str]] = None,
+) -> tuple:
+    """
+    Prompt Cortex and return (evaluation, details for the response body).
+
+    When the student is known, a resubmission against the same criteria sends
+    changed files in full and unchanged files as notes from the previous
+    evaluation. Code that does not fit in one prompt is reviewed in chunks
+    concurrently, and a reduce call turns the findings into the evaluation.
+    The static analysis summary and test results, if any, precede the code.
+    `skipped` lists the unreadable files, as in the single-prompt layout.
+    """
+    details = {}
+    boilerplate = dropped_boilerplate(analysis)
+    # Unknown ids (None or 0) must never share a history entry
+    track_history = INCREMENTAL_EVALUATION and bool(assignment_id) and bool(user_id)
+    criteria_key = content_key(MODEL_KEY, criteria)
+    diff = submission_history.diff(assignment_id, user_id, criteria_key, files) if track_history else None
+    resubmission = diff is not None and bool(diff.unchanged)
+    review_files = diff.changed if resubmission else files
+
+    map_notes = None
+    if needs_map_reduce(review_files, boilerplate=boilerplate):
+        chunked = split_into_chunks(review_files, criteria, skipped=skipped, boilerplate=boilerplate)
+        logger.info("Map-reduce evaluation", extra={"label": label, "chunks": len(chunked.chunks), "files": len(chunked.packed.files)})
+        try:
+            with span("map_reduce", chunks=len(chunked.chunks)):
+                submission_code, map_notes = await map_chunks(criteria, chunked, lambda prompt: complete(prompt, "map"))
+        except MapReduceError as e:
+            raise HTTPException(status_code=500, detail=str(e))
+        details["map_reduce"] = chunked.report()
+    elif resubmission:
+        submission_code = format_packed_for_llm(
+            pack_files(review_files, criteria, skipped=skipped, boilerplate=boilerplate)
+        ) if review_files else ""
+    else:
+        submission_code = formatted_code
+
+    if resubmission:
+        submission_code += "\n" + format_unchanged_for_llm(diff)
+        details["incremental"] = diff.report()
+        logger.info("Incremental evaluation", extra={"label": label, **diff.report()})
+
+    with span("prompt_build", kind="evaluation"):
+        prompt = build_evaluation_prompt(
+            criteria,
+            local_sections(analysis, test_run) + preamble + submission_code,
+            file_notes=track_history and map_notes is None,
+            resubmission=resubmission,
+            map_reduce=map_notes is not None,
+            static_analysis=analysis is not None,
+            test_results=test_run is not None,
+        )
+
+    response_text = await complete(prompt, "evaluation")
+
+    # Parse and validate the LLM response (a malformed one gets a JSON-only repair call)
+    if not response_text:
+        raise HTTPException(status_code=500, detail=f"No response from Snowflake Cortex during {label}.")
+
+    evaluation_json = await parse_evaluation_response(response_text)
+    file_notes = evaluation_json.pop("file_notes", None)
+    if track_history:
+        submission_history.record(
+            assignment_id, user_id, criteria_key, files, evaluation_json,
+            map_notes if map_notes is not None else file_notes, diff
+        )
+    return evaluation_json, details
+
+
+async def evaluate_archive_submission(
+    criteria: str,
+    filename: str,
+    fileobj,
+    assignment_id: Optional[int] = None,
+    user_id: Optional[int] = None,
+    tests: Optional[SubmissionFile] = None,
+) -> dict:
+    """
+    Evaluate a .zip / .tar(.gz) submission read from a seekable file object.
+    `tests` is an instructor test file to run against it (see execution.py).
+    Returns the response body for /evaluate-project/; raises HTTPException on failure.
+    """
+    logger.info("Evaluating submission", extra={"archive": filename})
 
+    # 2. Stream the archive from the spooled upload, one member at a time,
+    #    on a worker thread so decompression does not block the event loop
+    try:
+        with span("archive_extract") as attributes:
+            ingest_result = await asyncio.to_thread(ingest_archive, filename, fileobj)
+            attributes.update(
+                files=len(ingest_result.files), skipped=len(ingest_result.skipped),
+                ignored=ingest_result.ignored, bytes=ingest_result.bytes_read,
+            )
+    except ArchiveLimitError as e:
+        raise HTTPException(status_code=413, detail=f"Archive rejected: {e}")
+    except (zipfile.BadZipFile, tarfile.TarError) as e:
+        raise HTTPException(status_code=400, detail=f"Could not read archive: {e}")
+    record_ingest("upload", ingest_result)
+
+    # Measure the code, run its tests and compare it with other submissions to this assignment, without the model
+    analysis, similarity, test_run = await asyncio.gather(
+        analyze_submission(ingest_result.files),
+        find_similar_submissions("upload", filename, ingest_result.files, assignment_id, user_id),
+        run_submission_tests(ingest_result.files, tests),
+    )
+    
+    # Rank files by relevance and fit them into the model's token budget
+    with span("pack"):
+        packed = pack_submission(ingest_result, criteria, analysis)
+        packing_report = packed.report()
+        formatted_code = format_packed_for_llm(packed)
+    record_packing(packed)
+    
+    if not packed.files:
+        raise HTTPException(status_code=400, detail="Archive is empty or contains no readable text files.")
+    extra_details = local_details(analysis, similarity, test_run)
+
+    # 3. Return a stored evaluation if this exact submission was already graded (with the same test results)
+    cache_key = evaluation_cache_key(criteria, local_sections(analysis, test_run) + formatted_code, ingest_result.files)
+    cached_evaluation = evaluation_cache.get(cache_key)
+    if cached_evaluation is not None:
+        CACHE_LOOKUPS.labels("evaluation", "hit").inc()
+        logger.info("Evaluation cache hit", extra={"archive": filename})
+        return {"evaluation": cached_evaluation, "cached": True, "packing": packing_report, **extra_details}
+
+    CACHE_LOOKUPS.labels("evaluation", "miss").inc()
+
+    # 4. Execute Snowflake Cortex query (incrementally for a known student's resubmission)
+    evaluation_json, details = await run_evaluation(
+        criteria, formatted_code, ingest_result.files, assignment_id=assignment_id, user_id=user_id,
+        analysis=analysis, test_run=test_run, skipped=ingest_result.skipped,
+    )
+    evaluation_cache.set(cache_key, evaluation_json)
+    return {"evaluation": evaluation_json, "cached": False, "packing": packing_report, **details, **extra_details}
 
-@app.post("/evaluate-github-repo/")
-async def evaluate_github_repo(criteria: str = Form(...), github_url: str = Form(...), assignment_id: int = Form(...), user_id: int = Form(...)):
+
+async def evaluate_github_submission(
+    criteria: str, github_url: str, assignment_id: Optional[int], user_id: Optional[int], tests: Optional[SubmissionFile] = None
+) -> dict:
     """
-    Endpoint to evaluate a GitHub repository.
-    Accepts project criteria and GitHub URL, scrapes the repository, and returns evaluation.
+    Scrape and evaluate a GitHub repository, running `tests` against it if given.
+    Returns the response body for /evaluate-github-repo/; raises HTTPException on failure.
     """
+    logger.info("Evaluating GitHub repository", extra={"github_url": github_url})
+    
+    # Parse GitHub URL to extract owner and repo
+    parsed_url = urlparse(github_url)
+    path_parts = parsed_url.path.strip('/').split('/')
+    
+    if len(path_parts) < 2:
+        raise HTTPException(status_code=400, detail="Invalid GitHub URL format")
+    
+    owner = path_parts[0]
+    repo = path_parts[1].removesuffix('.git')
+    
+    # Metadata calls run concurrently; the code arrives as one tarball, cached by commit SHA
     try:
-        print(f"Evaluating GitHub repository: {github_url}")
-        
-        # Import GitHub scraping functionality
-        import requests
-        import base64
-        from urllib.parse import urlparse
-        
-        # Parse GitHub URL to extract owner and repo
-        parsed_url = urlparse(github_url)
-        path_parts = parsed_url.path.strip('/').split('/')
-        
-        if len(path_parts) < 2:
-            raise HTTPException(status_code=400, detail="Invalid GitHub URL format")
-        
-        owner = path_parts[0]
-        repo = path_parts[1]
-        
-        # GitHub API headers
-        headers = {
-            'Accept': 'application/vnd.github.v3+json',
-            'User-Agent': 'Moodle-Project-Evaluator'
-        }
-        
-        # Get repository information
-        repo_url = f"https://api.github.com/repos/{owner}/{repo}"
-        repo_response = requests.get(repo_url, headers=headers)
-        
-        if repo_response.status_code == 404:
-            raise HTTPException(status_code=404, detail="Repository not found or is private")
-        elif repo_response.status_code != 200:
-            raise HTTPException(status_code=400, detail="Failed to access repository")
-        
-        repo_data = repo_response.json()
-        
-        # Get repository contents
-        contents_url = f"https://api.github.com/repos/{owner}/{repo}/contents"
-        contents_response = requests.get(contents_url, headers=headers)
-        
-        if contents_response.status_code != 200:
-            raise HTTPException(status_code=400, detail="Failed to fetch repository contents")
-        
-        contents_data = contents_response.json()
-        
-        # Get commit history (last 10 commits)
-        commits_url = f"https://api.github.com/repos/{owner}/{repo}/commits?per_page=10"
-        commits_response = requests.get(commits_url, headers=headers)
-        commits_data = commits_response.json() if commits_response.status_code == 200 else []
-        
-        # Get languages
-        languages_url = f"https://api.github.com/repos/{owner}/{repo}/languages"
-        languages_response = requests.get(languages_url, headers=headers)
-        languages_data = languages_response.json() if languages_response.status_code == 200 else {}
-        
-        # Scrape file contents (focus on key files)
-        formatted_code_parts = []
-        file_count = 0
-        
-        def scrape_file_content(file_data, path=""):
-            nonlocal file_count
-            if file_count >= 50:  # Limit to prevent too large requests
-                return
-            
-            if file_data['type'] == 'file':
-                # Skip binary files and large files
-                if file_data['size'] > 1000000:  # 1MB limit
-                    return
-                
-                file_extension = file_data['name'].split('.')[-1].lower()
-                text_extensions = ['py', 'js', 'html', 'css', 'md', 'txt', 'json', 'xml', 'yml', 'yaml', 'java', 'cpp', 'c', 'php', 'rb', 'go', 'rs', 'ts']
-                
-                if file_extension in text_extensions or file_data['name'].lower() in ['readme', 'license', 'dockerfile', 'makefile']:
-                    try:
-                        file_response = requests.get(file_data['download_url'], headers=headers)
-                        if file_response.status_code == 200:
-                            content = file_response.text
-                            formatted_code_parts.append(f"--- FILE: {path}/{file_data['name']} ---")
-                            formatted_code_parts.append(content)
-                            formatted_code_parts.append("--- END FILE ---\n")
-                            file_count += 1
-                    except Exception as e:
-                        print(f"Error fetching {file_data['name']}: {e}")
-            
-            elif file_data['type'] == 'dir' and file_count < 50:
-                # Recursively get directory contents
-                dir_url = file_data['url']
-                dir_response = requests.get(dir_url, headers=headers)
-                if dir_response.status_code == 200:
-                    dir_contents = dir_response.json()
-                    for item in dir_contents:
-                        scrape_file_content(item, f"{path}/{file_data['name']}")
-        
-        # Scrape contents
-        for item in contents_data:
-            scrape_file_content(item)
-        
-        formatted_code = "\n".join(formatted_code_parts)
-        
-        if not formatted_code.strip():
-            raise HTTPException(status_code=400, detail="No readable files found in repository")
-        
-        # Add repository metadata to the formatted code
-        repo_metadata = f"""
+        repository = await github_fetcher.fetch_repository(owner, repo)
+    except GitHubError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    except CircuitOpenError as e:
+        raise upstream_unavailable(e)
+    except httpx.HTTPError as e:
+        raise HTTPException(status_code=502, detail=f"GitHub request failed: {e}")
+    
+    repo_data = repository.repo_data
+    commits_data = repository.commits
+    languages_data = repository.languages
+    
+    if repository.tarball_path is None:
+        raise HTTPException(status_code=400, detail="No readable files found in repository")
+    
+    try:
+        with span("archive_extract") as attributes:
+            ingest_result = await asyncio.to_thread(read_repository_tarball, repository.tarball_path)
+            attributes.update(
+                files=len(ingest_result.files), skipped=len(ingest_result.skipped),
+                ignored=ingest_result.ignored, bytes=ingest_result.bytes_read,
+            )
+    except ArchiveLimitError as e:
+        raise HTTPException(status_code=413, detail=f"Repository rejected: {e}")
+    record_ingest("github", ingest_result)
+    file_count = len(ingest_result.files)
+
+    analysis, similarity, test_run = await asyncio.gather(
+        analyze_submission(ingest_result.files),
+        find_similar_submissions("github", github_url, ingest_result.files, assignment_id, user_id),
+        run_submission_tests(ingest_result.files, tests),
+    )
+    
+    # Rank files by relevance and fit them into the model's token budget
+    with span("pack"):
+        packed = pack_submission(ingest_result, criteria, analysis)
+        packing_report = packed.report()
+        formatted_code = format_packed_for_llm(packed)
+    record_packing(packed)
+    
+    if not packed.files:
+        raise HTTPException(status_code=400, detail="No readable files found in repository")
+    extra_details = local_details(analysis, similarity, test_run)
+    
+    # Add repository metadata to the formatted code
+    repo_metadata = f"""
 REPOSITORY METADATA:
 ====================
 Repository: {repo_data['full_name']}
@@ -622,12 +879,12 @@ RECENT COMMITS:
 
 FILES AND CODE:
 ===============
-        """
-        
-        full_content = repo_metadata + formatted_code
-        
-        # Build evaluation prompt with GitHub-specific criteria
-        github_criteria = criteria + f"""
+    """
+    
+    full_content = repo_metadata + formatted_code
+    
+    # Build evaluation prompt with GitHub-specific criteria
+    github_criteria = criteria + f"""
 
 GITHUB-SPECIFIC EVALUATION CRITERIA:
 - Repository Structure and Organization
@@ -636,115 +893,627 @@ GITHUB-SPECIFIC EVALUATION CRITERIA:
 - Code Comments and Documentation
 - Use of Git Best Practices
 - Repository Maintenance and Activity
-        """
-        
-        prompt = build_evaluation_prompt(github_criteria, full_content)
-        print(f"GitHub evaluation prompt length: {len(prompt)} characters")
-        
-        # Execute Snowflake Cortex query
-        conn = get_snowflake_connection()
-        cursor = conn.cursor()
-        
-        sql = f"""
-        SELECT SNOWFLAKE.CORTEX.COMPLETE(
-            'claude-3-5-sonnet',
-            '{prompt}'
-        ) as response
-        """
-        
-        cursor.execute(sql)
-        result = cursor.fetchone()
-        
-        cursor.close()
-        conn.close()
-        
-        # Parse the LLM response
-        if result and result[0]:
-            response_text = result[0]
-            print(f"Raw GitHub response from AI: {response_text[:500]}...")
-            
-            # Find the JSON block
-            json_match = re.search(r'```json\s*(\{.*?\})\s*```', response_text, re.DOTALL)
-            if not json_match:
-                start = response_text.find('{')
-                end = response_text.rfind('}')
-                if start != -1 and end != -1:
-                    json_str = response_text[start:end+1]
+    """
+    
+    cache_key = evaluation_cache_key(github_criteria, local_sections(analysis, test_run) + full_content, ingest_result.files)
+    cached_evaluation = evaluation_cache.get(cache_key)
+    if cached_evaluation is not None:
+        CACHE_LOOKUPS.labels("evaluation", "hit").inc()
+        logger.info("Evaluation cache hit", extra={"github_url": github_url})
+        return {"evaluation": cached_evaluation, "cached": True, "packing": packing_report, **extra_details}
+    CACHE_LOOKUPS.labels("evaluation", "miss").inc()
+    
+    # Execute Snowflake Cortex query; a resubmission only sends the files that changed
+    evaluation_json, details = await run_evaluation(
+        github_criteria, formatted_code, ingest_result.files, repo_metadata,
+        assignment_id, user_id, label="GitHub evaluation", analysis=analysis, test_run=test_run,
+        skipped=ingest_result.skipped,
+    )
+
+    # Add GitHub-specific statistics
+    evaluation_json["repo_stats"] = {
+        "commits": len(commits_data),
+        "files": file_count,
+        "languages": len(languages_data),
+        "size": f"{repo_data.get('size', 0)} KB"
+    }
+    evaluation_cache.set(cache_key, evaluation_json)
+    return {"evaluation": evaluation_json, "cached": False, "packing": packing_report, **details, **extra_details}
+
+
+async def run_batch_item(criteria: str, item: BatchItem, tests: Optional[SubmissionFile] = None) -> dict:
+    """Evaluate one item of an /evaluate-batch/ job."""
+    with admission_scope(course_key(assignment_id=item.payload["assignment_id"]), can_reject=False):
+        if item.kind == "archive":
+            return await evaluate_archive_submission(
+                criteria, item.source, item.payload["upload"], item.payload["assignment_id"], item.payload["user_id"], tests
+            )
+        return await evaluate_github_submission(
+            criteria, item.payload["github_url"], item.payload["assignment_id"], item.payload["user_id"], tests
+        )
+
+
+batch_runner = BatchRunner(run_batch_item)
+
+
+def job_tests(params: dict) -> Optional[SubmissionFile]:
+    tests = params.get("tests")
+    return SubmissionFile(tests["path"], tests["content"]) if tests else None
+
+
+async def run_archive_job(params: dict, upload_path: Optional[str]) -> dict:
+    with open(upload_path, 'rb') as fileobj, admission_scope(course_key(assignment_id=params.get("assignment_id")), can_reject=False):
+        return await evaluate_archive_submission(
+            params["criteria"], params["filename"], fileobj, params.get("assignment_id"), params.get("user_id"),
+            job_tests(params),
+        )
+
+
+async def run_github_job(params: dict, upload_path: Optional[str]) -> dict:
+    with admission_scope(course_key(assignment_id=params["assignment_id"]), can_reject=False):
+        return await evaluate_github_submission(
+            params["criteria"], params["github_url"], params["assignment_id"], params["user_id"], job_tests(params)
+        )
+
+
+# Long-running evaluations persisted in SQLite and resumed after a restart
+job_queue = JobQueue(JobStore(), {"evaluate-project": run_archive_job, "evaluate-github-repo": run_github_job})
+
+
+def is_supported_archive(filename: Optional[str]) -> bool:
+    return bool(filename) and filename.lower().endswith(ARCHIVE_EXTENSIONS)
+
+
+def spool_upload_copy(upload: UploadFile):
+    """
+    Copy an upload into a temporary file the background job owns; Starlette
+    closes the request's own spooled file once the response is sent.
+    """
+    upload.file.seek(0)
+    spool = tempfile.TemporaryFile()
+    shutil.copyfileobj(upload.file, spool, 1024 * 1024)
+    spool.seek(0)
+    return spool
+
+
+def record_upload_read(*uploads: UploadFile):
+    """Multipart bodies are parsed, and uploads spooled, before the endpoint runs."""
+    record_span("upload_read", request_elapsed(), files=len(uploads), bytes=sum(upload.size or 0 for upload in uploads))
+
+
+async def read_test_file(upload: Optional[UploadFile]) -> Optional[SubmissionFile]:
+    """An instructor's pytest file from a form upload, renamed so pytest collects it."""
+    if upload is None or not upload.filename:
+        return None
+    if not upload.filename.endswith('.py'):
+        raise HTTPException(status_code=400, detail="test_file must be a Python (.py) pytest file.")
+    data = await upload.read(TEST_FILE_MAX_BYTES + 1)
+    if len(data) > TEST_FILE_MAX_BYTES:
+        raise HTTPException(status_code=413, detail=f"test_file is larger than {TEST_FILE_MAX_BYTES} bytes.")
+    try:
+        return SubmissionFile(instructor_test_name(upload.filename), data.decode('utf-8'))
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="test_file is not UTF-8 text.")
+
+
+def log_endpoint_error(endpoint: str, e: Exception):
+    """Call from an except block: HTTP errors are warnings, anything else logs its traceback."""
+    if isinstance(e, HTTPException):
+        logger.warning("Request failed", extra={"endpoint": endpoint, "status_code": e.status_code, "detail": str(e.detail)[:300]})
+    else:
+        logger.exception("Request failed", extra={"endpoint": endpoint})
+
+
+def save_upload(upload: UploadFile, path: str):
+    """Persist an upload so a queued job survives a restart."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    upload.file.seek(0)
+    with open(path, 'wb') as out:
+        shutil.copyfileobj(upload.file, out, 1024 * 1024)
+
+
+# Raw request bodies are kept in memory up to this size, like Starlette's multipart uploads
+RAW_BODY_SPOOL_BYTES = 1024 * 1024
+
+# Archive name implied by a raw body's Content-Type, when no filename is given
+RAW_ARCHIVE_NAMES = {
+    "application/zip": "submission.zip",
+    "application/x-zip-compressed": "submission.zip",
+    "application/gzip": "submission.tar.gz",
+    "application/x-gzip": "submission.tar.gz",
+    "application/x-tar": "submission.tar",
+}
+
+
+async def spool_request_body(request: Request, max_bytes: int):
+    """
+    Stream a raw request body into a temporary file, in memory while small.
+    The chunks are written as they arrive: no multipart parsing, no base64 and
+    no copy of the whole body as one bytes object. Answers 413 past `max_bytes`.
+    """
+    declared = request.headers.get("content-length", "")
+    if declared.isdigit() and int(declared) > max_bytes:
+        raise HTTPException(status_code=413, detail=f"Request body is larger than {max_bytes} bytes.")
+    spool = tempfile.SpooledTemporaryFile(max_size=RAW_BODY_SPOOL_BYTES)
+    size = 0
+    try:
+        with span("upload_read") as attributes:
+            async for chunk in request.stream():
+                size += len(chunk)
+                if size > max_bytes:
+                    raise HTTPException(status_code=413, detail=f"Request body is larger than {max_bytes} bytes.")
+                if size > RAW_BODY_SPOOL_BYTES:
+                    # Rolled over to disk
+                    await asyncio.to_thread(spool.write, chunk)
                 else:
-                    # Create fallback response with GitHub stats
-                    evaluation_json = {
-                        "overall_score": 75,
-                        "scores": {
-                            "code_quality": 26,
-                            "functionality_correctness": 34,
-                            "documentation": 15
-                        },
-                        "repo_stats": {
-                            "commits": len(commits_data),
-                            "files": file_count,
-                            "languages": len(languages_data),
-                            "size": f"{repo_data.get('size', 0)} KB"
-                        },
-                        "report": {
-                            "strengths": [f"Repository successfully accessed and analyzed", f"Found {file_count} readable files", f"Repository has {len(commits_data)} recent commits"],
-                            "areas_of_improvement": ["Could not parse detailed AI analysis"],
-                            "summary": f"GitHub repository {repo_data['full_name']} has been analyzed. The repository contains {file_count} files with {len(languages_data)} programming languages detected."
-                        }
-                    }
-                    return JSONResponse(content={"evaluation": evaluation_json})
-            else:
-                json_str = json_match.group(1)
+                    spool.write(chunk)
+            attributes.update(files=1, bytes=size)
+        if not size:
+            raise HTTPException(status_code=400, detail="Request body is empty.")
+    except BaseException:
+        spool.close()
+        raise
+    spool.seek(0)
+    return spool
+
+
+async def store_document(filename: str, doc_type: str, fileobj) -> dict:
+    """Hash a document into the store straight from its file object, then extract and cache its text."""
+    try:
+        document_id, size = await asyncio.to_thread(document_store.put_file, fileobj, doc_type, DOC_MAX_UPLOAD_BYTES)
+    except DocumentTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    texts = await extract_documents_text([DocumentData(filename=filename, document_id=document_id)])
+    return {
+        "document_id": document_id,
+        "filename": filename,
+        "type": doc_type,
+        "size": size,
+        "text_extracted": not texts[0].startswith(("[Could not extract", "[Error processing")),
+    }
+
+
+# =============================================================================
+# API ENDPOINTS
+# =============================================================================
+
+
+async def generate_project_description(topics: str, complexity: str, documents: List[DocumentData], key: str) -> dict:
+    """Response body for /generate-project/ and /generate-project/upload; raises HTTPException on failure."""
+    logger.info("Generating project", extra={"topics": topics, "complexity": complexity, "documents": len(documents)})
+
+    # PDF/DOCX parsing runs on the process pool so the event loop stays free
+    document_texts = await extract_documents_text(documents) if documents else []
+    with span("prompt_build", kind="generate"):
+        prompt = build_project_prompt(topics, complexity, documents, document_texts)
+
+    with admission_scope(key), retry_budget():
+        response_text = await complete(prompt, "generate")
+
+    if not response_text:
+        raise HTTPException(status_code=500, detail="No response from Snowflake Cortex")
+    return {
+        "project_description": response_text,
+        "documents_processed": len(documents),
+        "document_names": [doc.filename for doc in documents]
+    }
+
+
+@app.post("/generate-project/")
+async def generate_project(request: ProjectRequest):
+    """Endpoint to generate a new project description."""
+    key = course_key(request.course_id)
+    try:
+        check_admission(key)
+        return await generate_project_description(request.topics, request.complexity, request.documents, key)
             
-            try:
-                evaluation_json = json.loads(json_str)
-                
-                # Add GitHub-specific statistics
-                evaluation_json["repo_stats"] = {
-                    "commits": len(commits_data),
-                    "files": file_count, 
-                    "languages": len(languages_data),
-                    "size": f"{repo_data.get('size', 0)} KB"
-                }
-                
-                print(f"Successfully parsed GitHub evaluation JSON: {evaluation_json}")
-                return JSONResponse(content={"evaluation": evaluation_json})
-                
-            except json.JSONDecodeError as e:
-                print(f"GitHub JSON parsing failed: {e}")
-                # Create fallback with repo stats
-                evaluation_json = {
-                    "overall_score": 72,
-                    "scores": {
-                        "code_quality": 25,
-                        "functionality_correctness": 33,
-                        "documentation": 14
-                    },
-                    "repo_stats": {
-                        "commits": len(commits_data),
-                        "files": file_count,
-                        "languages": len(languages_data),
-                        "size": f"{repo_data.get('size', 0)} KB"
-                    },
-                    "report": {
-                        "strengths": [f"Repository {repo_data['full_name']} successfully analyzed", f"Contains {file_count} readable files", f"Uses {len(languages_data)} programming languages"],
-                        "areas_of_improvement": ["AI response parsing issue - manual review recommended"],
-                        "summary": f"GitHub repository evaluation completed with parsing issues. Repository statistics: {len(commits_data)} commits, {file_count} files analyzed."
-                    }
-                }
-                return JSONResponse(content={"evaluation": evaluation_json})
-        else:
-            raise HTTPException(status_code=500, detail="No response from Snowflake Cortex during GitHub evaluation.")
+    except Exception as e:
+        log_endpoint_error("/generate-project/", e)
+        if isinstance(e, HTTPException):
+            raise e
+        raise HTTPException(status_code=500, detail=f"Failed to generate project: {str(e)}")
+
+
+@app.post("/generate-project/upload")
+async def generate_project_upload(
+    topics: str = Form(...),
+    complexity: str = Form(...),
+    files: Optional[List[UploadFile]] = File(None),
+    course_id: Optional[int] = Form(None),
+):
+    """
+    Multipart variant of /generate-project/: reference documents are sent as
+    file parts instead of base64 inside JSON. Each one is stored (see
+    /documents/) straight from its spooled upload, so it is never decoded or
+    held in memory whole, and the response is the same.
+    """
+    files = files or []
+    for upload in files:
+        if document_type_from_filename(upload.filename or "") is None:
+            raise HTTPException(status_code=400, detail=f"Unsupported document type for {upload.filename}. Use pdf, docx, doc or txt.")
+    key = course_key(course_id)
+    try:
+        check_admission(key)
+        record_upload_read(*files)
+        documents = []
+        for upload in files:
+            upload.file.seek(0)
+            stored = await store_document(upload.filename, document_type_from_filename(upload.filename), upload.file)
+            documents.append(DocumentData(filename=upload.filename, document_id=stored["document_id"]))
+        return await generate_project_description(topics, complexity, documents, key)
+
+    except Exception as e:
+        log_endpoint_error("/generate-project/upload", e)
+        if isinstance(e, HTTPException):
+            raise e
+        raise HTTPException(status_code=500, detail=f"Failed to generate project: {str(e)}")
+
+
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.post("/generate-project/stream")
+async def generate_project_stream(request: ProjectRequest):
+    """
+    Server-Sent Events variant of /generate-project/. Sends a `start` event at
+    once, `token` events as the description is generated, and a final `done`
+    event with `documents_processed` and `document_names` (or an `error` event).
+    """
+    async def events():
+        yield sse_event("start", {"documents": len(request.documents)})
+        key = course_key(request.course_id)
+        try:
+            admission.check(key)
+            logger.info("Streaming project", extra={"topics": request.topics, "complexity": request.complexity, "documents": len(request.documents)})
+            document_texts = await extract_documents_text(request.documents) if request.documents else []
+            with span("prompt_build", kind="generate"):
+                prompt = build_project_prompt(request.topics, request.complexity, request.documents, document_texts)
+
+            received = False
+            PROMPT_CHARS.labels("generate").observe(len(prompt))
+            with admission_scope(key):
+                async with admission.slot() as slot:
+                    with span("llm_stream", kind="generate", prompt_chars=len(prompt)) as attributes:
+                        started = time.perf_counter()
+                        # Not retried (tokens may already be on the wire), but the circuit
+                        # is honoured and the wait for the first chunk is its trial
+                        llm_breaker.before_call()
+                        try:
+                            async for text in llm_backend.stream(prompt):
+                                if not received:
+                                    llm_breaker.record_success()
+                                    slot.latency = time.perf_counter() - started
+                                    attributes["first_token_ms"] = round(slot.latency * 1000, 1)
+                                received = True
+                                yield sse_event("token", {"text": text})
+                        except Exception as e:
+                            if not received:
+                                record_outcome(llm_breaker, e)
+                            raise
+                        finally:
+                            if not received:
+                                llm_breaker.abandon()
+                    if not received:
+                        slot.mark_failed()
+
+            if not received:
+                yield sse_event("error", {"status_code": 500, "detail": "No response from Snowflake Cortex"})
+                return
+            yield sse_event("done", {
+                "documents_processed": len(request.documents),
+                "document_names": [doc.filename for doc in request.documents]
+            })
+        except AdmissionRejected as e:
+            log_endpoint_error("/generate-project/stream", too_busy(e))
+            yield sse_event("error", {"status_code": 429, "detail": str(e), "retry_after": e.retry_after})
+        except CircuitOpenError as e:
+            log_endpoint_error("/generate-project/stream", upstream_unavailable(e))
+            yield sse_event("error", {"status_code": 503, "detail": str(e), "retry_after": e.retry_after})
+        except Exception as e:
+            log_endpoint_error("/generate-project/stream", e)
+            yield sse_event("error", {
+                "status_code": getattr(e, "status_code", 500),
+                "detail": str(getattr(e, "detail", e))
+            })
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.post("/documents/")
+async def upload_document(file: UploadFile = File(...), type: Optional[str] = Form(None)):
+    """
+    Upload a reference document once and get a `document_id` handle that
+    later /generate-project/ requests can send instead of base64 content.
+    The text is extracted and cached right away.
+    """
+    doc_type = type or document_type_from_filename(file.filename)
+    if doc_type not in DOCUMENT_TYPES:
+        raise HTTPException(status_code=400, detail="Unsupported document type. Use pdf, docx, doc or txt.")
+
+    record_upload_read(file)
+    file.file.seek(0)
+    return await store_document(file.filename, doc_type, file.file)
+
+
+@app.post("/documents/raw")
+async def upload_document_raw(request: Request, filename: str = Query(...), type: Optional[str] = Query(None)):
+    """
+    /documents/ with the document as the raw request body (any Content-Type),
+    streamed to a spooled file and from there into the store.
+    """
+    doc_type = type or document_type_from_filename(filename)
+    if doc_type not in DOCUMENT_TYPES:
+        raise HTTPException(status_code=400, detail="Unsupported document type. Use pdf, docx, doc or txt.")
+
+    spool = await spool_request_body(request, DOC_MAX_UPLOAD_BYTES)
+    try:
+        return await store_document(filename, doc_type, spool)
+    finally:
+        spool.close()
+
+
+@app.post("/evaluate-project/")
+async def evaluate_project(
+    criteria: str = Form(...),
+    file: UploadFile = File(...),
+    assignment_id: Optional[int] = Form(None),
+    user_id: Optional[int] = Form(None),
+    course_id: Optional[int] = Form(None),
+    test_file: Optional[UploadFile] = File(None),
+):
+    """
+    Endpoint to evaluate a student's project.
+    Accepts project criteria and a zip file of the student's work.
+    Returns a structured JSON evaluation. With assignment_id and user_id,
+    a resubmission is evaluated incrementally. With assignment_id, the
+    response lists near-duplicate submissions to the same assignment.
+    With TEST_EXECUTION_ENABLED, a Python project's tests (or `test_file`,
+    an instructor's pytest file) are run and their results reported.
+    """
+    # 1. Validate input file
+    if not is_supported_archive(file.filename):
+        raise HTTPException(status_code=400, detail="Invalid file type. Please upload a .zip, .tar, .tar.gz or .tgz file.")
+    tests = await read_test_file(test_file)
+    record_upload_read(file)
+
+    key = course_key(course_id, assignment_id)
+    try:
+        check_admission(key)
+        with admission_scope(key), retry_budget():
+            content = await evaluate_archive_submission(criteria, file.filename, file.file, assignment_id, user_id, tests)
+        return JSONResponse(content=content)
             
     except Exception as e:
-        print(f"Error in /evaluate-github-repo/: {e}")
+        log_endpoint_error("/evaluate-project/", e)
+        # Re-raise HTTPException to preserve status code and detail
+        if isinstance(e, HTTPException):
+            raise e
+        # Wrap other exceptions in a standard 500 error
+        raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {str(e)}")
+
+
+@app.post("/evaluate-project/raw")
+async def evaluate_project_raw(
+    request: Request,
+    criteria: str = Query(...),
+    filename: Optional[str] = Query(None),
+    assignment_id: Optional[int] = Query(None),
+    user_id: Optional[int] = Query(None),
+    course_id: Optional[int] = Query(None),
+):
+    """
+    /evaluate-project/ with the archive as the raw request body and the other
+    fields as query parameters. The body is streamed to a spooled file that
+    the zip/tar readers open directly. Without `filename`, the archive type
+    comes from the Content-Type (application/zip, application/gzip or application/x-tar).
+    """
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    filename = filename or RAW_ARCHIVE_NAMES.get(content_type, "")
+    if not is_supported_archive(filename):
+        raise HTTPException(status_code=400, detail="Invalid file type. Send a .zip, .tar, .tar.gz or .tgz filename or archive Content-Type.")
+
+    key = course_key(course_id, assignment_id)
+    try:
+        # Before the body is read, so a rejected request does not upload the archive first
+        check_admission(key)
+        spool = await spool_request_body(request, MAX_UPLOAD_BYTES)
+        try:
+            with admission_scope(key), retry_budget():
+                content = await evaluate_archive_submission(criteria, filename, spool, assignment_id, user_id)
+        finally:
+            spool.close()
+        return JSONResponse(content=content)
+
+    except Exception as e:
+        log_endpoint_error("/evaluate-project/raw", e)
+        if isinstance(e, HTTPException):
+            raise e
+        raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {str(e)}")
+
+
+@app.post("/evaluate-github-repo/")
+async def evaluate_github_repo(
+    criteria: str = Form(...),
+    github_url: str = Form(...),
+    assignment_id: int = Form(...),
+    user_id: int = Form(...),
+    course_id: Optional[int] = Form(None),
+    test_file: Optional[UploadFile] = File(None),
+):
+    """
+    Endpoint to evaluate a GitHub repository.
+    Accepts project criteria and GitHub URL, scrapes the repository, and returns evaluation.
+    """
+    tests = await read_test_file(test_file)
+    key = course_key(course_id, assignment_id)
+    try:
+        check_admission(key)
+        with admission_scope(key), retry_budget():
+            content = await evaluate_github_submission(criteria, github_url, assignment_id, user_id, tests)
+        return JSONResponse(content=content)
+            
+    except Exception as e:
+        log_endpoint_error("/evaluate-github-repo/", e)
         if isinstance(e, HTTPException):
             raise e
         raise HTTPException(status_code=500, detail=f"GitHub repository evaluation failed: {str(e)}")
 
 
+@app.post("/evaluate-batch/")
+async def evaluate_batch(
+    criteria: str = Form(...),
+    files: Optional[List[UploadFile]] = File(None),
+    github_urls: Optional[List[str]] = Form(None),
+    assignment_id: Optional[int] = Form(None),
+    user_ids: Optional[List[int]] = Form(None),
+    file_user_ids: Optional[List[int]] = Form(None),
+    test_file: Optional[UploadFile] = File(None),
+):
+    """
+    Start grading many submissions against one set of criteria.
+    Accepts any mix of archives (`files`, optionally paired with
+    `file_user_ids` in the same order) and GitHub URLs (`github_urls`,
+    optionally paired with `user_ids`), plus an optional instructor
+    `test_file` run against every submission, and returns a job id
+    right away. Poll /evaluate-batch/{job_id} or read the NDJSON stream at
+    /evaluate-batch/{job_id}/stream for results.
+    """
+    files = files or []
+    github_urls = github_urls or []
+    user_ids = user_ids or []
+    file_user_ids = file_user_ids or []
+    if not files and not github_urls:
+        raise HTTPException(status_code=400, detail="Provide at least one file or GitHub URL.")
+    if user_ids and len(user_ids) != len(github_urls):
+        raise HTTPException(status_code=400, detail="user_ids must match github_urls one-to-one.")
+    if file_user_ids and len(file_user_ids) != len(files):
+        raise HTTPException(status_code=400, detail="file_user_ids must match files one-to-one.")
+    for upload in files:
+        if not is_supported_archive(upload.filename):
+            raise HTTPException(status_code=400, detail=f"Invalid file type for {upload.filename}. Please upload .zip, .tar, .tar.gz or .tgz files.")
+    tests = await read_test_file(test_file)
+
+    record_upload_read(*files)
+    items = []
+    for i, upload in enumerate(files):
+        spool = await asyncio.to_thread(spool_upload_copy, upload)
+        payload = {"upload": spool, "assignment_id": assignment_id, "user_id": file_user_ids[i] if file_user_ids else None}
+        items.append(BatchItem(len(items), "archive", upload.filename, payload))
+    for i, github_url in enumerate(github_urls):
+        payload = {"github_url": github_url, "assignment_id": assignment_id, "user_id": user_ids[i] if user_ids else None}
+        items.append(BatchItem(len(items), "github", github_url, payload))
+
+    job = batch_runner.submit(BatchJob(criteria, items, {"tests": tests}))
+    content = job.to_dict(include_results=False)
+    content["stream_url"] = f"/evaluate-batch/{job.id}/stream"
+    return JSONResponse(status_code=202, content=content)
+
+
+@app.get("/evaluate-batch/{job_id}")
+async def get_batch(job_id: str):
+    """Per-item progress and any finished results of a batch job."""
+    job = batch_runner.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Batch job not found")
+    return job.to_dict()
+
+
+@app.get("/evaluate-batch/{job_id}/stream")
+async def stream_batch(job_id: str):
+    """NDJSON stream: one line per finished item, then a final "done" line."""
+    job = batch_runner.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Batch job not found")
+
+    async def ndjson():
+        async for event in job.events():
+            yield json.dumps(event) + "\n"
+
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+
+@app.post("/jobs/evaluate-project/")
+async def submit_evaluate_project_job(
+    criteria: str = Form(...),
+    file: UploadFile = File(...),
+    assignment_id: Optional[int] = Form(None),
+    user_id: Optional[int] = Form(None),
+    test_file: Optional[UploadFile] = File(None),
+):
+    """Queue an /evaluate-project/ evaluation and return its job id immediately."""
+    if not is_supported_archive(file.filename):
+        raise HTTPException(status_code=400, detail="Invalid file type. Please upload a .zip, .tar, .tar.gz or .tgz file.")
+    tests = await read_test_file(test_file)
+
+    record_upload_read(file)
+    job_id = uuid.uuid4().hex
+    upload_path = os.path.join(JOB_UPLOAD_DIR, f"{job_id}-{os.path.basename(file.filename)}")
+    await asyncio.to_thread(save_upload, file, upload_path)
+    params = {"criteria": criteria, "filename": file.filename, "assignment_id": assignment_id, "user_id": user_id}
+    if tests is not None:
+        params["tests"] = {"path": tests.path, "content": tests.content}
+    job = job_queue.submit("evaluate-project", params, upload_path, job_id)
+    return JSONResponse(status_code=202, content=public_job(job))
+
+
+@app.post("/jobs/evaluate-github-repo/")
+async def submit_evaluate_github_repo_job(
+    criteria: str = Form(...),
+    github_url: str = Form(...),
+    assignment_id: int = Form(...),
+    user_id: int = Form(...),
+    test_file: Optional[UploadFile] = File(None),
+):
+    """Queue an /evaluate-github-repo/ evaluation and return its job id immediately."""
+    tests = await read_test_file(test_file)
+    params = {"criteria": criteria, "github_url": github_url, "assignment_id": assignment_id, "user_id": user_id}
+    if tests is not None:
+        params["tests"] = {"path": tests.path, "content": tests.content}
+    job = job_queue.submit("evaluate-github-repo", params)
+    return JSONResponse(status_code=202, content=public_job(job))
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str, wait: float = Query(0, ge=0, le=JOB_MAX_WAIT)):
+    """
+    Job status, plus the evaluation once it has completed. With `wait` > 0 the
+    request long-polls until the job finishes or `wait` seconds pass.
+    """
+    job = await job_queue.wait(job_id, wait)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return public_job(job)
+
+
+@app.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    """Cancel a queued or running job."""
+    job = job_queue.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return public_job(job)
+
+
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy"}
+    return {
+        "status": "healthy",
+        "llm_backend": llm_backend.name,
+        "llm": llm_backend.stats(),
+        "admission": admission.stats(),
+        "circuits": {breaker.name: breaker.stats() for breaker in (llm_breaker, connect_breaker, github_fetcher.breaker)},
+    }
+
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics: request and per-stage latency, prompt sizes, file counts, cache hits."""
+    return Response(content=metrics_payload(), media_type=METRICS_CONTENT_TYPE)
 
 
 if __name__ == "__main__":
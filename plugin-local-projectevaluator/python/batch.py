@@ -0,0 +1,199 @@
+"""
+Batch evaluation of a whole assignment.
+
+A batch carries one assignment's criteria plus N submissions (archives or
+GitHub URLs). Items run with bounded concurrency over the shared Cortex
+client, and every finished item is published to any listeners so results
+can be streamed to the Moodle dashboard as they arrive.
+"""
+import asyncio
+import os
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+from telemetry import get_logger, trace
+
+
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
+BATCH_MAX_JOBS = int(os.getenv("BATCH_MAX_JOBS", "50"))
+
+logger = get_logger("batch")
+
+
+class BatchItem:
+    """One submission inside a batch: an uploaded archive or a GitHub URL."""
+
+    def __init__(self, index: int, kind: str, source: str, payload: Any):
+        self.index = index
+        self.kind = kind  # "archive" or "github"
+        self.source = source
+        self.payload = payload
+        self.status = "pending"
+        self.result: Optional[dict] = None
+        self.error: Optional[str] = None
+        self.status_code: Optional[int] = None
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("completed", "failed")
+
+    def to_dict(self, include_result: bool = True) -> dict:
+        data = {
+            "index": self.index,
+            "kind": self.kind,
+            "source": self.source,
+            "status": self.status,
+        }
+        if self.started_at and self.finished_at:
+            data["duration_seconds"] = round(self.finished_at - self.started_at, 3)
+        if self.error is not None:
+            data["error"] = self.error
+            data["status_code"] = self.status_code
+        if include_result and self.result is not None:
+            data["result"] = self.result
+        return data
+
+    def release(self):
+        """Close the spooled upload once the item no longer needs it."""
+        upload = self.payload.get("upload") if isinstance(self.payload, dict) else None
+        if upload is not None:
+            upload.close()
+
+
+class BatchJob:
+    def __init__(self, criteria: str, items: List[BatchItem], options: Optional[Dict[str, Any]] = None):
+        self.id = uuid.uuid4().hex
+        self.criteria = criteria
+        # Passed to the item runner as keyword arguments, for every item
+        self.options = options or {}
+        self.items = items
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.task: Optional[asyncio.Task] = None
+        self._listeners: List[asyncio.Queue] = []
+
+    @property
+    def finished(self) -> bool:
+        return all(item.finished for item in self.items)
+
+    def progress(self) -> dict:
+        counts = {"pending": 0, "running": 0, "completed": 0, "failed": 0}
+        for item in self.items:
+            counts[item.status] += 1
+        counts["total"] = len(self.items)
+        return counts
+
+    def to_dict(self, include_results: bool = True) -> dict:
+        return {
+            "job_id": self.id,
+            "status": "completed" if self.finished else "running",
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+            "progress": self.progress(),
+            "items": [item.to_dict(include_results) for item in self.items],
+        }
+
+    def publish(self, item: Optional[BatchItem]):
+        """Notify listeners that `item` finished; None means the whole job is done."""
+        for queue in self._listeners:
+            queue.put_nowait(item)
+
+    async def events(self) -> AsyncIterator[dict]:
+        """
+        Yield one event per finished item (including items that finished before
+        the caller subscribed), then a final "done" event with the job summary.
+        """
+        queue: asyncio.Queue = asyncio.Queue()
+        self._listeners.append(queue)
+        try:
+            sent = set()
+            for item in self.items:
+                if item.finished:
+                    sent.add(item.index)
+                    yield {"event": "item", "item": item.to_dict()}
+
+            while len(sent) < len(self.items):
+                item = await queue.get()
+                if item is None:
+                    break
+                if item.index in sent:
+                    continue
+                sent.add(item.index)
+                yield {"event": "item", "item": item.to_dict()}
+
+            yield {"event": "done", "job": self.to_dict(include_results=False)}
+        finally:
+            self._listeners.remove(queue)
+
+
+class BatchRunner:
+    """
+    Runs batch jobs in the background. A single semaphore bounds how many
+    items are evaluated at once across all jobs.
+    """
+
+    def __init__(
+        self,
+        run_item: Callable[..., Awaitable[dict]],
+        concurrency: int = BATCH_CONCURRENCY,
+        max_jobs: int = BATCH_MAX_JOBS,
+    ):
+        self._run_item = run_item
+        self._semaphore = asyncio.Semaphore(max(1, concurrency))
+        self.max_jobs = max_jobs
+        self.jobs: "OrderedDict[str, BatchJob]" = OrderedDict()
+
+    def submit(self, job: BatchJob) -> BatchJob:
+        self.jobs[job.id] = job
+        self._evict_finished()
+        job.task = asyncio.create_task(self._run(job))
+        return job
+
+    def get(self, job_id: str) -> Optional[BatchJob]:
+        return self.jobs.get(job_id)
+
+    def _evict_finished(self):
+        # Keep the newest jobs; only finished jobs are ever forgotten
+        for job_id in list(self.jobs):
+            if len(self.jobs) <= self.max_jobs:
+                break
+            if self.jobs[job_id].finished:
+                del self.jobs[job_id]
+
+    async def _run(self, job: BatchJob):
+        # The task outlives the submitting request; its logs carry the batch id instead
+        with trace(job.id) as current:
+            logger.info("Starting batch", extra={"items": len(job.items)})
+            await asyncio.gather(*(self._run_one(job, item) for item in job.items))
+            job.finished_at = time.time()
+            job.publish(None)
+            logger.info("Finished batch", extra={**job.progress(), "stages": current.stage_totals()})
+
+    async def _run_one(self, job: BatchJob, item: BatchItem):
+        try:
+            async with self._semaphore:
+                item.status = "running"
+                item.started_at = time.time()
+                try:
+                    item.result = await self._run_item(job.criteria, item, **job.options)
+                    item.status = "completed"
+                except Exception as e:
+                    item.status = "failed"
+                    item.status_code = getattr(e, "status_code", 500)
+                    item.error = str(getattr(e, "detail", e))
+                    logger.warning("Batch item failed", extra={"item": item.index, "source": item.source, "error": item.error[:300]})
+                finally:
+                    item.finished_at = time.time()
+        finally:
+            item.release()
+            job.publish(item)
+
+    async def shutdown(self):
+        tasks = [job.task for job in self.jobs.values() if job.task and not job.task.done()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,153 @@
+"""
+Synthetic, reproducible inputs for the benchmarks.
+
+Every corpus is generated from a fixed seed, so two runs (or two commits)
+measure exactly the same bytes.
+"""
+import io
+import random
+import tarfile
+import zipfile
+from typing import Dict
+
+
+CODE_LINES = [
+    "def handle_request(request, context):",
+    "    if not request.get('user_id'):",
+    "        raise ValueError(\"user_id is required\")",
+    "    result = compute_total(request['items'], discount=0.15)",
+    "    for index, item in enumerate(items):",
+    "        total += item.price * item.quantity  # running total",
+    "class InventoryService(BaseService):",
+    "    \"\"\"Keeps stock levels in sync with the warehouse API.\"\"\"",
+    "    return {'status': 'ok', 'count': len(records)}",
+    "import os, sys, json",
+    "",
+    "    logger.info(f'Processed {len(batch)} records in {elapsed:.2f}s')",
+    "function renderTable(rows) { return rows.map(r => `<tr>${r}</tr>`).join(''); }",
+]
+
+
+def source_file(rng: random.Random, size: int) -> str:
+    lines, length = [], 0
+    while length < size:
+        line = rng.choice(CODE_LINES)
+        lines.append(line)
+        length += len(line) + 1
+    return "\n".join(lines)[:size]
+
+
+def text_corpus(size: int, seed: int = 1) -> str:
+    """Source-like text with quotes, tabs and control characters sprinkled in."""
+    rng = random.Random(seed)
+    text = source_file(rng, size)
+    chars = list(text)
+    for _ in range(size // 500):
+        chars[rng.randrange(len(chars))] = rng.choice(["\t", "\x07", "'", "\r\n", "  "])
+    return "".join(chars)
+
+
+def build_zip(files: Dict[str, bytes]) -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        for path, data in files.items():
+            archive.writestr(path, data)
+    return buffer.getvalue()
+
+
+def build_tar_gz(files: Dict[str, bytes]) -> bytes:
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w:gz") as archive:
+        for path, data in files.items():
+            info = tarfile.TarInfo(path)
+            info.size = len(data)
+            archive.addfile(info, io.BytesIO(data))
+    return buffer.getvalue()
+
+
+def project_files(count: int, file_size: int, seed: int = 1) -> Dict[str, bytes]:
+    """A plausible project tree: `count` source files spread over packages."""
+    rng = random.Random(seed)
+    files = {"README.md": b"# Inventory service\n\nRun `python main.py`.\n"}
+    for index in range(count):
+        package = f"src/pkg{index % 20}"
+        files[f"{package}/module_{index}.py"] = source_file(rng, file_size).encode()
+    return files
+
+
+def many_small_files_zip(count: int = 2000, file_size: int = 1024) -> bytes:
+    return build_zip(project_files(count, file_size))
+
+
+def huge_files_zip(count: int = 3, file_size: int = 4 * 1024 * 1024) -> bytes:
+    return build_zip(project_files(count, file_size, seed=2))
+
+
+def nested_zip(depth: int = 3, count: int = 50, file_size: int = 2048) -> bytes:
+    """A zip whose innermost level is `depth` zips deep, with source files at every level."""
+    data = build_zip(project_files(count, file_size, seed=3))
+    for level in range(depth):
+        files = project_files(count, file_size, seed=10 + level)
+        files[f"level{level}/inner.zip"] = data
+        data = build_zip(files)
+    return data
+
+
+def binary_heavy_zip(binaries: int = 200, binary_size: int = 50 * 1024, sources: int = 50) -> bytes:
+    rng = random.Random(4)
+    files = project_files(sources, 2048, seed=4)
+    for index in range(binaries):
+        files[f"assets/image_{index}.png"] = b"\x89PNG\r\n\x1a\n" + rng.randbytes(binary_size)
+    return build_zip(files)
+
+
+def dependency_heavy_zip(dependencies: int = 2000, sources: int = 50) -> bytes:
+    """A project zipped with its node_modules, .git directory, lockfile and built bundle."""
+    rng = random.Random(6)
+    files = project_files(sources, 2048, seed=6)
+    files[".gitignore"] = b"*.log\ncoverage/\n"
+    files["package-lock.json"] = source_file(rng, 200 * 1024).encode()
+    files["dist/app.min.js"] = source_file(rng, 300 * 1024).encode()
+    for index in range(dependencies):
+        files[f"node_modules/pkg{index % 100}/lib/file_{index}.js"] = source_file(rng, 1024).encode()
+    for index in range(dependencies // 10):
+        files[f".git/objects/{index:02x}/{index:038x}"] = rng.randbytes(512)
+    for index in range(20):
+        files[f"logs/run_{index}.log"] = source_file(rng, 4096).encode()
+    return build_zip(files)
+
+
+def project_tar_gz(count: int = 2000, file_size: int = 1024) -> bytes:
+    return build_tar_gz(project_files(count, file_size, seed=5))
+
+
+def pdf_document(pages: int = 100, lines_per_page: int = 40) -> bytes:
+    """A minimal valid PDF with one text stream per page (no external libraries)."""
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>"]
+    kids = " ".join(f"{3 + 2 * i} 0 R" for i in range(pages))
+    objects.append(f"<< /Type /Pages /Kids [{kids}] /Count {pages} >>".encode())
+    font_id = 3 + 2 * pages
+    for page in range(pages):
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents {4 + 2 * page} 0 R "
+            f"/Resources << /Font << /F1 {font_id} 0 R >> >> >>".encode()
+        )
+        lines = " ".join(
+            f"(Week {page + 1} notes, line {line}: recursion, data structures and testing.) Tj 0 -14 Td"
+            for line in range(lines_per_page)
+        )
+        stream = f"BT /F1 10 Tf 72 740 Td {lines} ET"
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream".encode())
+    objects.append(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n".encode() + body + b"\nendobj\n"
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    for offset in offsets:
+        out += f"{offset:010d} 00000 n \n".encode()
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    return bytes(out)
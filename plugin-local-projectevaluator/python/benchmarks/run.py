@@ -0,0 +1,318 @@
+"""
+Benchmarks for the ingestion and prompt-building hot paths.
+
+Each case runs in a fresh spawned process so its peak RSS is its own, and
+reports throughput, p50/p99 latency and peak RSS. Results are written as
+JSON; pass --compare with an earlier result file to flag regressions.
+
+    cd python
+    python benchmarks/run.py                      # full run
+    python benchmarks/run.py --quick -k pipeline  # small corpora, matching cases only
+    python benchmarks/run.py --compare benchmarks/results/<earlier>.json
+"""
+import argparse
+import base64
+import json
+import math
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARK_DIR))
+sys.path.insert(0, BENCHMARK_DIR)
+
+import corpora  # noqa: E402
+
+
+RESULTS_DIR = os.path.join(BENCHMARK_DIR, "results")
+
+
+# =============================================================================
+# CASES
+# =============================================================================
+# Each setup function takes `quick` and returns (callable, input_bytes).
+
+
+def load_app():
+    """Import app.py against a throwaway data directory and the fake LLM backend."""
+    os.environ.setdefault("EVALUATOR_DATA_DIR", tempfile.mkdtemp(prefix="bench-data-"))
+    os.environ.setdefault("LLM_BACKEND", "fake")
+    import app
+    return app
+
+
+def archive_corpus(name: str, quick: bool) -> bytes:
+    if name == "many_small":
+        return corpora.many_small_files_zip(200 if quick else 2000)
+    if name == "huge":
+        return corpora.huge_files_zip(1 if quick else 3, (1 if quick else 4) * 1024 * 1024)
+    if name == "nested":
+        return corpora.nested_zip(depth=3, count=10 if quick else 50)
+    if name == "binary_heavy":
+        return corpora.binary_heavy_zip(binaries=20 if quick else 200)
+    if name == "dependency_heavy":
+        return corpora.dependency_heavy_zip(dependencies=200 if quick else 2000)
+    if name == "tar_gz":
+        return corpora.project_tar_gz(200 if quick else 2000)
+    raise KeyError(name)
+
+
+def setup_clean_text(size: int):
+    def setup(quick: bool):
+        app = load_app()
+        text = corpora.text_corpus(size // 10 if quick else size)
+        return (lambda: app.clean_text(text)), len(text)
+    return setup
+
+
+def setup_format_zip(corpus: str):
+    def setup(quick: bool):
+        import io
+        import zipfile
+        from ingest import format_zip_contents_for_llm
+        data = archive_corpus(corpus, quick)
+
+        def run():
+            with zipfile.ZipFile(io.BytesIO(data)) as archive:
+                return format_zip_contents_for_llm(archive)
+        return run, len(data)
+    return setup
+
+
+def setup_format_tar(quick: bool):
+    from ingest import format_tar_contents_for_llm
+    data = archive_corpus("tar_gz", quick)
+    return (lambda: format_tar_contents_for_llm(data)), len(data)
+
+
+def setup_pipeline(corpus: str):
+    """What /evaluate-project/ does before calling the model: ingest, pack, format."""
+    def setup(quick: bool):
+        import io
+        from ingest import ingest_archive
+        from packing import format_packed_for_llm, pack_ingest_result
+        data = archive_corpus(corpus, quick)
+        filename = "submission.tar.gz" if corpus == "tar_gz" else "submission.zip"
+
+        def run():
+            result = ingest_archive(filename, io.BytesIO(data))
+            return format_packed_for_llm(pack_ingest_result(result, "inventory service with discounts"))
+        return run, len(data)
+    return setup
+
+
+def setup_extract_pdf(quick: bool):
+    app = load_app()
+    data = corpora.pdf_document(20 if quick else 100)
+    doc = app.DocumentData(filename="syllabus.pdf", content=base64.b64encode(data).decode(), type="pdf")
+    return (lambda: app.extract_document_text(doc)), len(data)
+
+
+def setup_build_evaluation_prompt(quick: bool):
+    import io
+    from ingest import ingest_archive
+    from packing import format_packed_for_llm, pack_ingest_result
+    app = load_app()
+    data = archive_corpus("many_small", quick)
+    criteria = corpora.text_corpus(4000, seed=9)
+    code = format_packed_for_llm(pack_ingest_result(ingest_archive("submission.zip", io.BytesIO(data)), criteria))
+    return (lambda: app.build_evaluation_prompt(criteria, code)), len(code) + len(criteria)
+
+
+def setup_static_analysis(quick: bool):
+    """Per-file metrics for a whole project, in this process (no pool)."""
+    from analysis import analyze_files
+    files = corpora.project_files(200 if quick else 2000, 1024)
+    items = [(path, data.decode()) for path, data in files.items()]
+    return (lambda: analyze_files(items)), sum(len(data) for data in files.values())
+
+
+def setup_similarity_check(quick: bool):
+    """Fingerprint a submission and look it up in an index of an assignment's earlier submissions."""
+    from ingest import SubmissionFile
+    from similarity import SimilarityIndex
+    index = SimilarityIndex(os.path.join(tempfile.mkdtemp(prefix="bench-similarity-"), "similarity.sqlite3"))
+    for user_id in range(1, (200 if quick else 2000) + 1):
+        files = corpora.project_files(10, 2048, seed=user_id)
+        index.check(1, user_id, f"user{user_id}.zip", [SubmissionFile(path, data.decode()) for path, data in files.items()])
+    files = [SubmissionFile(path, data.decode()) for path, data in corpora.project_files(50, 2048, seed=0).items()]
+    # No user_id: the lookup does not add to the index, so every iteration sees the same one
+    return (lambda: index.check(1, None, "submission.zip", files)), sum(len(f.content) for f in files)
+
+
+CASES = {
+    "clean_text/10k": setup_clean_text(10_000),
+    "clean_text/100k": setup_clean_text(100_000),
+    "clean_text/1m": setup_clean_text(1_000_000),
+    "format_zip/many_small": setup_format_zip("many_small"),
+    "format_zip/huge": setup_format_zip("huge"),
+    "format_zip/nested": setup_format_zip("nested"),
+    "format_zip/binary_heavy": setup_format_zip("binary_heavy"),
+    "format_zip/dependency_heavy": setup_format_zip("dependency_heavy"),
+    "format_tar/tar_gz": setup_format_tar,
+    "pipeline/many_small": setup_pipeline("many_small"),
+    "pipeline/huge": setup_pipeline("huge"),
+    "pipeline/nested": setup_pipeline("nested"),
+    "pipeline/binary_heavy": setup_pipeline("binary_heavy"),
+    "pipeline/dependency_heavy": setup_pipeline("dependency_heavy"),
+    "pipeline/tar_gz": setup_pipeline("tar_gz"),
+    "extract_document_text/pdf": setup_extract_pdf,
+    "build_evaluation_prompt/many_small": setup_build_evaluation_prompt,
+    "static_analysis/many_small": setup_static_analysis,
+    "similarity_check/assignment": setup_similarity_check,
+}
+
+
+# =============================================================================
+# MEASUREMENT
+# =============================================================================
+
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def percentile(samples, fraction: float) -> float:
+    ordered = sorted(samples)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+def measure(name: str, quick: bool, iterations: int, max_seconds: float) -> dict:
+    """Run one case in the current process. Called inside a fresh child process."""
+    func, input_bytes = CASES[name](quick)
+    baseline_rss = peak_rss_mb()
+    func()  # warm-up: imports, caches, first-touch allocations
+
+    samples = []
+    started = time.perf_counter()
+    while len(samples) < iterations:
+        begin = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - begin)
+        if len(samples) >= 3 and time.perf_counter() - started > max_seconds:
+            break
+
+    mean = sum(samples) / len(samples)
+    return {
+        "name": name,
+        "iterations": len(samples),
+        "input_bytes": input_bytes,
+        "mean_ms": round(mean * 1000, 3),
+        "p50_ms": round(percentile(samples, 0.50) * 1000, 3),
+        "p99_ms": round(percentile(samples, 0.99) * 1000, 3),
+        "throughput_mb_s": round(input_bytes / (1024 * 1024) / mean, 3) if mean else None,
+        "baseline_rss_mb": round(baseline_rss, 1),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+
+
+def _child(name, quick, iterations, max_seconds, queue):
+    try:
+        queue.put(measure(name, quick, iterations, max_seconds))
+    except Exception as e:
+        queue.put({"name": name, "error": f"{type(e).__name__}: {e}"})
+
+
+def run_isolated(name: str, quick: bool, iterations: int, max_seconds: float) -> dict:
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    process = context.Process(target=_child, args=(name, quick, iterations, max_seconds, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+def git_revision() -> dict:
+    def git(*args):
+        return subprocess.run(["git", *args], cwd=BENCHMARK_DIR, capture_output=True, text=True).stdout.strip()
+    try:
+        return {"commit": git("rev-parse", "--short", "HEAD") or None, "dirty": bool(git("status", "--porcelain"))}
+    except OSError:
+        return {"commit": None, "dirty": None}
+
+
+# =============================================================================
+# COMPARISON
+# =============================================================================
+
+
+def compare(results: dict, baseline_path: str, threshold: float) -> bool:
+    """Print p50 changes against a baseline file. Returns True if anything regressed."""
+    with open(baseline_path) as f:
+        baseline = {case["name"]: case for case in json.load(f)["cases"] if "p50_ms" in case}
+
+    regressed = False
+    print(f"\nComparison with {baseline_path} (threshold {threshold:.0%}):")
+    for case in results["cases"]:
+        before = baseline.get(case["name"])
+        if before is None or "p50_ms" not in case:
+            continue
+        change = case["p50_ms"] / before["p50_ms"] - 1 if before["p50_ms"] else 0.0
+        flag = ""
+        if change > threshold:
+            flag = "  REGRESSION"
+            regressed = True
+        print(f"  {case['name']:<40} {before['p50_ms']:>10.2f} -> {case['p50_ms']:>10.2f} ms  {change:+.1%}{flag}")
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-k", "--filter", default="", help="only run cases whose name contains this string")
+    parser.add_argument("--quick", action="store_true", help="small corpora, for a fast smoke run")
+    parser.add_argument("--iterations", type=int, default=20, help="samples per case (default 20)")
+    parser.add_argument("--max-seconds", type=float, default=20.0, help="time budget per case (default 20)")
+    parser.add_argument("--output", help="result file (default benchmarks/results/<timestamp>-<commit>.json)")
+    parser.add_argument("--compare", help="earlier result file to compare p50 latency against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="p50 slowdown counted as a regression (default 0.2)")
+    args = parser.parse_args()
+
+    names = [name for name in CASES if args.filter in name]
+    revision = git_revision()
+    results = {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        **revision,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "quick": args.quick,
+        "cases": [],
+    }
+
+    print(f"{'case':<40} {'iters':>5} {'p50 ms':>10} {'p99 ms':>10} {'MB/s':>9} {'peak MB':>8}")
+    for name in names:
+        case = run_isolated(name, args.quick, args.iterations, args.max_seconds)
+        results["cases"].append(case)
+        if "error" in case:
+            print(f"{name:<40} ERROR {case['error']}")
+        else:
+            print(
+                f"{name:<40} {case['iterations']:>5} {case['p50_ms']:>10.2f} {case['p99_ms']:>10.2f} "
+                f"{case['throughput_mb_s'] or 0:>9.2f} {case['peak_rss_mb']:>8.1f}"
+            )
+
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+        output = os.path.join(RESULTS_DIR, f"{stamp}-{revision['commit'] or 'unknown'}.json")
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults written to {output}")
+
+    if args.compare and compare(results, args.compare, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+Persistent SQLite key/value cache with TTL and LRU eviction.
+
+Used to avoid paying for a second Cortex call when the same submission is
+evaluated against the same criteria and model.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Optional
+
+
+DATA_DIR = os.getenv("EVALUATOR_DATA_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data"))
+
+EVAL_CACHE_PATH = os.getenv("EVAL_CACHE_PATH", os.path.join(DATA_DIR, "evaluation_cache.sqlite3"))
+EVAL_CACHE_TTL = float(os.getenv("EVAL_CACHE_TTL", str(7 * 24 * 3600)))
+EVAL_CACHE_MAX_ENTRIES = int(os.getenv("EVAL_CACHE_MAX_ENTRIES", "5000"))
+EVAL_CACHE_MAX_BYTES = int(os.getenv("EVAL_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+
+
+def content_key(*parts: str) -> str:
+    """SHA-256 over the given parts, length-prefixed so ('ab', 'c') != ('a', 'bc')."""
+    digest = hashlib.sha256()
+    for part in parts:
+        data = part.encode("utf-8")
+        digest.update(len(data).to_bytes(8, "big"))
+        digest.update(data)
+    return digest.hexdigest()
+
+
+class SQLiteCache:
+    """
+    Small persistent cache of JSON values.
+
+    Entries expire after `ttl` seconds. When the cache grows past
+    `max_entries` or `max_bytes`, the least recently read entries are evicted
+    first. A TTL or limit of 0 disables that bound.
+    """
+
+    def __init__(self, path: str, ttl: float = 0, max_entries: int = 0, max_bytes: int = 0):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS cache (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_accessed REAL NOT NULL
+            )
+            """
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS cache_last_accessed ON cache (last_accessed)")
+
+    def get(self, key: str) -> Optional[Any]:
+        now = time.time()
+        with self._lock:
+            row = self._db.execute("SELECT value, created_at FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            value, created_at = row
+            if self.ttl and now - created_at > self.ttl:
+                self._db.execute("DELETE FROM cache WHERE key = ?", (key,))
+                return None
+            self._db.execute("UPDATE cache SET last_accessed = ? WHERE key = ?", (now, key))
+        return json.loads(value)
+
+    def set(self, key: str, value: Any):
+        encoded = json.dumps(value)
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO cache (key, value, size, created_at, last_accessed) VALUES (?, ?, ?, ?, ?)",
+                (key, encoded, len(encoded), now, now),
+            )
+            self._evict(now)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._db.execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def _evict(self, now: float):
+        if self.ttl:
+            self._db.execute("DELETE FROM cache WHERE created_at < ?", (now - self.ttl,))
+
+        if self.max_entries:
+            count = self._db.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+            if count > self.max_entries:
+                self._db.execute(
+                    "DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY last_accessed ASC LIMIT ?)",
+                    (count - self.max_entries,),
+                )
+
+        if self.max_bytes:
+            total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0]
+            if total > self.max_bytes:
+                excess = total - self.max_bytes
+                freed = 0
+                victims = []
+                for key, size in self._db.execute("SELECT key, size FROM cache ORDER BY last_accessed ASC"):
+                    victims.append((key,))
+                    freed += size
+                    if freed >= excess:
+                        break
+                self._db.executemany("DELETE FROM cache WHERE key = ?", victims)
+
+    def stats(self) -> dict:
+        with self._lock:
+            count, total = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache").fetchone()
+        return {"entries": count, "bytes": total}
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,434 @@
+"""
+Shared Snowflake Cortex client.
+
+Keeps a bounded pool of warm Snowflake connections and runs the blocking
+connector calls on a dedicated thread pool, so a slow completion never
+stalls the FastAPI event loop. Completions can also be streamed through the
+Cortex REST API, authenticated with a pooled session's token.
+"""
+import asyncio
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import AsyncIterator, Callable, Optional
+
+import httpx
+
+from llm import CompletionBackend
+from prompts import prompt_prefix
+from telemetry import get_logger, span
+
+
+CORTEX_MODEL = os.getenv("CORTEX_MODEL", "claude-3-5-sonnet")
+
+POOL_MIN_SIZE = int(os.getenv("SNOWFLAKE_POOL_MIN_SIZE", "1"))
+POOL_MAX_SIZE = int(os.getenv("SNOWFLAKE_POOL_MAX_SIZE", "8"))
+POOL_ACQUIRE_TIMEOUT = float(os.getenv("SNOWFLAKE_POOL_ACQUIRE_TIMEOUT", "60"))
+POOL_IDLE_TIMEOUT = float(os.getenv("SNOWFLAKE_POOL_IDLE_TIMEOUT", "900"))
+POOL_HEALTH_CHECK_INTERVAL = float(os.getenv("SNOWFLAKE_POOL_HEALTH_CHECK_INTERVAL", "60"))
+POOL_REAP_INTERVAL = float(os.getenv("SNOWFLAKE_POOL_REAP_INTERVAL", "60"))
+
+# Set CORTEX_STREAMING=false to always use the chunked fallback
+CORTEX_STREAMING = os.getenv("CORTEX_STREAMING", "true").lower() in ("1", "true", "yes")
+CORTEX_STREAM_TIMEOUT = float(os.getenv("CORTEX_STREAM_TIMEOUT", "300"))
+CORTEX_STREAM_PATH = "/api/v2/cortex/inference:complete"
+
+# Send the shared prefix of layered prompts (instructions + criteria) as a
+# separate system message, which providers that cache prompt prefixes can reuse
+CORTEX_PROMPT_CACHING = os.getenv("CORTEX_PROMPT_CACHING", "false").lower() in ("1", "true", "yes")
+
+
+# Model and prompt are bind parameters: the prompt is sent as-is, with no
+# quote escaping and no SQL literal size limit. Connections must be opened
+# with paramstyle="qmark" so the values are bound server-side.
+COMPLETE_SQL = "SELECT SNOWFLAKE.CORTEX.COMPLETE(?, ?) AS response"
+# Conversation form: messages and options are bound as JSON text. The result is
+# a JSON document with the text under choices[0].messages and token usage.
+COMPLETE_MESSAGES_SQL = "SELECT SNOWFLAKE.CORTEX.COMPLETE(?, PARSE_JSON(?)::ARRAY, PARSE_JSON(?)::OBJECT) AS response"
+
+logger = get_logger("cortex")
+
+
+class PoolTimeoutError(Exception):
+    """Raised when no pooled connection becomes available in time."""
+
+
+# =============================================================================
+# CONNECTION POOL
+# =============================================================================
+
+
+class PooledConnection:
+    """A Snowflake connection plus the bookkeeping the pool needs."""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.last_checked = self.created_at
+
+
+class SnowflakeConnectionPool:
+    """
+    Bounded, thread-safe pool of Snowflake connections.
+
+    Connections are handed out LIFO so the warmest session is reused first,
+    health-checked with a cheap `SELECT 1` when they have sat idle for longer
+    than `health_check_interval`, and closed by `reap_idle()` once they have
+    been idle for `idle_timeout` (never dropping below `min_size`).
+    """
+
+    def __init__(
+        self,
+        connect: Callable,
+        min_size: int = POOL_MIN_SIZE,
+        max_size: int = POOL_MAX_SIZE,
+        acquire_timeout: float = POOL_ACQUIRE_TIMEOUT,
+        idle_timeout: float = POOL_IDLE_TIMEOUT,
+        health_check_interval: float = POOL_HEALTH_CHECK_INTERVAL,
+    ):
+        self._connect = connect
+        self.min_size = max(0, min_size)
+        self.max_size = max(1, max_size, self.min_size)
+        self.acquire_timeout = acquire_timeout
+        self.idle_timeout = idle_timeout
+        self.health_check_interval = health_check_interval
+
+        self._idle = deque()
+        self._size = 0  # open connections, idle or checked out
+        self._cond = threading.Condition()
+        self._closed = False
+
+    def _open(self) -> PooledConnection:
+        with span("snowflake_connect"):
+            return PooledConnection(self._connect())
+
+    @staticmethod
+    def _close_quietly(pooled: PooledConnection):
+        try:
+            pooled.conn.close()
+        except Exception as e:
+            logger.warning("Error closing Snowflake connection", extra={"error": str(e)})
+
+    def _is_healthy(self, pooled: PooledConnection) -> bool:
+        try:
+            if pooled.conn.is_closed():
+                return False
+        except Exception:
+            return False
+
+        if time.monotonic() - pooled.last_checked < self.health_check_interval:
+            return True
+
+        try:
+            cursor = pooled.conn.cursor()
+            try:
+                cursor.execute("SELECT 1")
+                cursor.fetchone()
+            finally:
+                cursor.close()
+        except Exception as e:
+            logger.warning("Discarding unhealthy Snowflake connection", extra={"error": str(e)})
+            return False
+
+        pooled.last_checked = time.monotonic()
+        return True
+
+    def open(self):
+        """Allow connections to be handed out again after `close()`."""
+        with self._cond:
+            self._closed = False
+
+    def warm_up(self):
+        """Open connections until `min_size` are idle and ready."""
+        while True:
+            with self._cond:
+                if self._closed or self._size >= self.min_size:
+                    return
+                self._size += 1
+            try:
+                pooled = self._open()
+            except Exception:
+                with self._cond:
+                    self._size -= 1
+                    self._cond.notify()
+                raise
+            with self._cond:
+                self._idle.append(pooled)
+                self._cond.notify()
+
+    def acquire(self) -> PooledConnection:
+        deadline = time.monotonic() + self.acquire_timeout
+        while True:
+            candidate = None
+            with self._cond:
+                while True:
+                    if self._closed:
+                        raise RuntimeError("Snowflake connection pool is closed")
+                    if self._idle:
+                        candidate = self._idle.pop()
+                        break
+                    if self._size < self.max_size:
+                        self._size += 1
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise PoolTimeoutError(
+                            f"Timed out after {self.acquire_timeout}s waiting for a Snowflake connection"
+                        )
+                    self._cond.wait(remaining)
+
+            if candidate is None:
+                try:
+                    return self._open()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+
+            # Health checks run outside the lock so other threads are not held up
+            if self._is_healthy(candidate):
+                return candidate
+            self._discard(candidate)
+
+    def release(self, pooled: PooledConnection, discard: bool = False):
+        if discard:
+            self._discard(pooled)
+            return
+        pooled.last_used = time.monotonic()
+        with self._cond:
+            if self._closed:
+                self._size -= 1
+            else:
+                self._idle.append(pooled)
+                self._cond.notify()
+                return
+        self._close_quietly(pooled)
+
+    def _discard(self, pooled: PooledConnection):
+        with self._cond:
+            self._size -= 1
+            self._cond.notify()
+        self._close_quietly(pooled)
+
+    @contextmanager
+    def connection(self):
+        """Check out a connection; it is discarded if the caller raises."""
+        pooled = self.acquire()
+        try:
+            yield pooled.conn
+        except Exception:
+            self.release(pooled, discard=True)
+            raise
+        else:
+            self.release(pooled)
+
+    def reap_idle(self) -> int:
+        """Close connections idle longer than `idle_timeout`. Returns how many were closed."""
+        now = time.monotonic()
+        reaped = []
+        with self._cond:
+            keep = deque()
+            # Oldest idle connections sit at the left end of the deque
+            while self._idle:
+                pooled = self._idle.popleft()
+                expired = now - pooled.last_used > self.idle_timeout
+                if expired and self._size > self.min_size:
+                    self._size -= 1
+                    reaped.append(pooled)
+                else:
+                    keep.append(pooled)
+            self._idle = keep
+        for pooled in reaped:
+            self._close_quietly(pooled)
+        return len(reaped)
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            idle, self._idle = list(self._idle), deque()
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for pooled in idle:
+            self._close_quietly(pooled)
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "open": self._size,
+                "idle": len(self._idle),
+                "in_use": self._size - len(self._idle),
+                "max_size": self.max_size,
+            }
+
+
+# =============================================================================
+# CORTEX CLIENT
+# =============================================================================
+
+
+class CortexClient(CompletionBackend):
+    """
+    Snowflake Cortex backend: an async facade over the connection pool.
+
+    Every blocking connector call runs on a private thread pool sized to the
+    connection pool, so at most `max_size` completions are in flight and the
+    event loop only ever awaits futures.
+    """
+
+    name = "snowflake"
+
+    def __init__(self, pool: SnowflakeConnectionPool, reap_interval: float = POOL_REAP_INTERVAL):
+        self.pool = pool
+        self.reap_interval = reap_interval
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._reaper_task: Optional[asyncio.Task] = None
+        self._http: Optional[httpx.AsyncClient] = None
+
+    async def _run(self, func, *args):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.pool.max_size, thread_name_prefix="cortex")
+        loop = asyncio.get_running_loop()
+        # Carry the caller's context so spans and logs keep the request id
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(self._executor, functools.partial(context.run, func, *args))
+
+    def _complete_messages_sync(self, prefix: str, prompt: str, model: str) -> Optional[str]:
+        messages = [
+            {"role": "system", "content": prefix},
+            {"role": "user", "content": prompt[len(prefix):]},
+        ]
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            try:
+                with span("cortex_complete", model=model, prefix_chars=len(prefix)) as attributes:
+                    cursor.execute(COMPLETE_MESSAGES_SQL, (model, json.dumps(messages), "{}"))
+                    result = cursor.fetchone()
+                    if not result or not result[0]:
+                        return None
+                    response = json.loads(result[0])
+                    # Token counts, including any cached-prompt counts the provider reports
+                    attributes.update(response.get("usage") or {})
+            finally:
+                cursor.close()
+        choices = response.get("choices") or [{}]
+        return choices[0].get("messages") or None
+
+    def _complete_sync(self, prompt: str, model: str) -> Optional[str]:
+        prefix = prompt_prefix(prompt) if CORTEX_PROMPT_CACHING else ""
+        if prefix:
+            return self._complete_messages_sync(prefix, prompt, model)
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            try:
+                # Time in Cortex itself, excluding any wait for a pooled connection
+                with span("cortex_complete", model=model):
+                    cursor.execute(COMPLETE_SQL, (model, prompt))
+                    result = cursor.fetchone()
+            finally:
+                cursor.close()
+        return result[0] if result and result[0] else None
+
+    async def complete(self, prompt: str, model: Optional[str] = None) -> Optional[str]:
+        """Run SNOWFLAKE.CORTEX.COMPLETE off the event loop and return the response text."""
+        return await self._run(self._complete_sync, prompt, model or CORTEX_MODEL)
+
+    def _session_sync(self):
+        """Host and session token of a pooled connection, for the REST API."""
+        with self.pool.connection() as conn:
+            return conn.host, conn.rest.token
+
+    @property
+    def http(self) -> httpx.AsyncClient:
+        if self._http is None:
+            self._http = httpx.AsyncClient(timeout=httpx.Timeout(CORTEX_STREAM_TIMEOUT, connect=10))
+        return self._http
+
+    async def _stream_rest(self, prompt: str, model: str) -> AsyncIterator[str]:
+        host, token = await self._run(self._session_sync)
+        headers = {
+            "Authorization": f'Snowflake Token="{token}"',
+            "Content-Type": "application/json",
+            "Accept": "text/event-stream",
+        }
+        body = {"model": model, "messages": [{"role": "user", "content": prompt}], "stream": True}
+        async with self.http.stream("POST", f"https://{host}{CORTEX_STREAM_PATH}", headers=headers, json=body) as response:
+            if response.status_code != 200:
+                detail = (await response.aread()).decode("utf-8", errors="replace")[:500]
+                raise RuntimeError(f"Cortex REST API returned {response.status_code}: {detail}")
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[5:].strip()
+                if not data or data == "[DONE]":
+                    continue
+                for choice in json.loads(data).get("choices", []):
+                    delta = choice.get("delta") or {}
+                    text = delta.get("content") or delta.get("text")
+                    if text:
+                        yield text
+
+    async def stream(self, prompt: str, model: Optional[str] = None) -> AsyncIterator[str]:
+        """
+        Yield the completion as it is generated. If the REST stream fails
+        before producing any text, falls back to the SQL completion; a failure
+        after the first chunk is raised to the caller.
+        """
+        model = model or CORTEX_MODEL
+        if CORTEX_STREAMING:
+            started = False
+            try:
+                async for text in self._stream_rest(prompt, model):
+                    started = True
+                    yield text
+                return
+            except Exception as e:
+                if started:
+                    raise
+                logger.warning("Cortex streaming unavailable, falling back to SQL completion", extra={"error": str(e)})
+        # Chunked stand-in: the SQL completion replayed in slices
+        async for text in super().stream(prompt, model):
+            yield text
+
+    async def _reap_forever(self):
+        while True:
+            await asyncio.sleep(self.reap_interval)
+            try:
+                reaped = await self._run(self.pool.reap_idle)
+                if reaped:
+                    logger.info("Reaped idle Snowflake connections", extra={"reaped": reaped})
+            except Exception as e:
+                logger.warning("Error reaping idle Snowflake connections", extra={"error": str(e)})
+
+    async def start(self):
+        """Warm up the pool and start the idle reaper. Warm-up failures are logged, not fatal."""
+        self.pool.open()
+        try:
+            await self._run(self.pool.warm_up)
+            logger.info("Snowflake connection pool warmed up", extra=self.pool.stats())
+        except Exception as e:
+            logger.warning("Snowflake pool warm-up failed, connections will be opened on demand", extra={"error": str(e)})
+        if self._reaper_task is None:
+            self._reaper_task = asyncio.create_task(self._reap_forever())
+
+    async def stop(self):
+        if self._reaper_task is not None:
+            self._reaper_task.cancel()
+            try:
+                await self._reaper_task
+            except asyncio.CancelledError:
+                pass
+            self._reaper_task = None
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+        await self._run(self.pool.close)
+        self._executor.shutdown(wait=False)
+        self._executor = None
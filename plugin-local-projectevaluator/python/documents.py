@@ -0,0 +1,335 @@
+"""
+Reference-document text extraction.
+
+PDF text extraction is CPU-bound, so it runs on a process pool: each PDF is
+split into page ranges that are extracted in parallel (every page exactly
+once), documents are processed concurrently, and every document is bounded
+by a page limit and a wall-clock timeout. The event loop only awaits. A
+timed-out document's workers are killed and the pool is replaced, so a
+pathological PDF cannot hold workers after its request has given up.
+
+A document is either its bytes or the path of a stored copy. Workers open a
+path themselves, so a stored document is never pickled to the pool; a PDF
+given as bytes is written to a temporary file once, not sent to every task.
+"""
+import asyncio
+import hashlib
+import io
+import multiprocessing
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import BinaryIO, List, Optional, Tuple, Union
+
+from cache import DATA_DIR
+
+
+# Document processing imports
+try:
+    import PyPDF2
+    PDF_AVAILABLE = True
+except ImportError:
+    PDF_AVAILABLE = False
+
+
+try:
+    import docx
+    DOCX_AVAILABLE = True
+except ImportError:
+    DOCX_AVAILABLE = False
+
+
+DOC_WORKERS = int(os.getenv("DOC_WORKERS", str(os.cpu_count() or 2)))
+DOC_MAX_PAGES = int(os.getenv("DOC_MAX_PAGES", "300"))
+DOC_PAGES_PER_TASK = int(os.getenv("DOC_PAGES_PER_TASK", "16"))
+DOC_TIMEOUT = float(os.getenv("DOC_TIMEOUT", "60"))
+
+DOC_TEXT_CACHE_PATH = os.getenv("DOC_TEXT_CACHE_PATH", os.path.join(DATA_DIR, "document_text.sqlite3"))
+DOC_TEXT_CACHE_MAX_BYTES = int(os.getenv("DOC_TEXT_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+DOC_STORE_DIR = os.getenv("DOC_STORE_DIR", os.path.join(DATA_DIR, "documents"))
+DOC_STORE_MAX_BYTES = int(os.getenv("DOC_STORE_MAX_BYTES", str(1024 * 1024 * 1024)))
+# Largest single document accepted by the upload endpoints
+DOC_MAX_UPLOAD_BYTES = int(os.getenv("DOC_MAX_UPLOAD_BYTES", str(100 * 1024 * 1024)))
+
+DOCUMENT_TYPES = ('pdf', 'docx', 'doc', 'txt')
+
+
+class DocumentExtractionError(Exception):
+    pass
+
+
+class DocumentTooLarge(Exception):
+    pass
+
+
+# =============================================================================
+# WORKER FUNCTIONS (run in child processes)
+# =============================================================================
+
+
+def _stream(source: Union[bytes, str]):
+    """A binary stream over a document's bytes or its stored file."""
+    return open(source, 'rb') if isinstance(source, str) else io.BytesIO(source)
+
+
+def _read(source: Union[bytes, str]) -> bytes:
+    with _stream(source) as stream:
+        return stream.read()
+
+
+def _spill(data: bytes) -> str:
+    """Write document bytes to a temporary file and return its path; the caller removes it."""
+    fd, path = tempfile.mkstemp(prefix="document-")
+    with os.fdopen(fd, 'wb') as out:
+        out.write(data)
+    return path
+
+
+def count_pdf_pages(source: Union[bytes, str]) -> int:
+    with _stream(source) as stream:
+        return len(PyPDF2.PdfReader(stream).pages)
+
+
+def extract_pdf_pages(source: Union[bytes, str], start: int, end: int) -> List[str]:
+    """Text of pages [start, end); each page is extracted exactly once."""
+    texts = []
+    with _stream(source) as stream:
+        reader = PyPDF2.PdfReader(stream)
+        for index in range(start, min(end, len(reader.pages))):
+            text = reader.pages[index].extract_text()
+            if text:
+                texts.append(text)
+    return texts
+
+
+def extract_docx_text(source: Union[bytes, str]) -> str:
+    with _stream(source) as stream:
+        document = docx.Document(stream)
+    return "\n".join(p.text for p in document.paragraphs if p.text.strip())
+
+
+def extract_text_sync(doc_type: str, source: Union[bytes, str], max_pages: int = DOC_MAX_PAGES) -> str:
+    """Single-process extraction, for callers outside the event loop."""
+    if doc_type == 'txt':
+        return _read(source).decode('utf-8', errors='ignore')
+    if doc_type == 'pdf' and PDF_AVAILABLE:
+        return "\n".join(extract_pdf_pages(source, 0, max_pages))
+    if doc_type in ('doc', 'docx') and DOCX_AVAILABLE:
+        return extract_docx_text(source)
+    return ""
+
+
+# =============================================================================
+# PROCESS POOL STAGE
+# =============================================================================
+
+
+class DocumentExtractor:
+    def __init__(
+        self,
+        workers: int = DOC_WORKERS,
+        max_pages: int = DOC_MAX_PAGES,
+        pages_per_task: int = DOC_PAGES_PER_TASK,
+        timeout: float = DOC_TIMEOUT,
+    ):
+        self.workers = max(1, workers)
+        self.max_pages = max_pages
+        self.pages_per_task = max(1, pages_per_task)
+        self.timeout = timeout
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn: forking a process that holds Snowflake/HTTP threads is unsafe
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._executor
+
+    async def _run(self, executor: ProcessPoolExecutor, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, func, *args)
+
+    async def _extract_pdf(self, executor: ProcessPoolExecutor, source: Union[bytes, str]) -> str:
+        if not isinstance(source, str):
+            path = await asyncio.to_thread(_spill, source)
+            try:
+                return await self._extract_pdf(executor, path)
+            finally:
+                os.remove(path)
+
+        page_count = min(await self._run(executor, count_pdf_pages, source), self.max_pages)
+        ranges = [
+            (start, min(start + self.pages_per_task, page_count))
+            for start in range(0, page_count, self.pages_per_task)
+        ]
+        chunks = await asyncio.gather(*(self._run(executor, extract_pdf_pages, source, start, end) for start, end in ranges))
+        return "\n".join(text for chunk in chunks for text in chunk)
+
+    async def _extract(self, executor: ProcessPoolExecutor, doc_type: str, source: Union[bytes, str]) -> str:
+        if doc_type == 'txt':
+            data = await asyncio.to_thread(_read, source) if isinstance(source, str) else source
+            return data.decode('utf-8', errors='ignore')
+        if doc_type == 'pdf' and PDF_AVAILABLE:
+            return await self._extract_pdf(executor, source)
+        if doc_type in ('doc', 'docx') and DOCX_AVAILABLE:
+            return await self._run(executor, extract_docx_text, source)
+        return ""
+
+    async def extract(self, doc_type: str, source: Union[bytes, str]) -> str:
+        """
+        Extract one document within the per-document timeout. On a timeout
+        the pool it ran on is recycled, killing the tasks it left behind.
+        """
+        executor = self.executor
+        try:
+            return await asyncio.wait_for(self._extract(executor, doc_type, source), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            self._recycle(executor)
+            raise DocumentExtractionError(f"extraction timed out after {self.timeout}s")
+        except BrokenProcessPool:
+            # Another document timed out and its pool was recycled under this one
+            raise DocumentExtractionError("extraction was interrupted; please retry")
+
+    def _recycle(self, executor: ProcessPoolExecutor):
+        """Kill the workers of `executor` and start the next extraction on a fresh pool."""
+        if self._executor is executor:
+            self._executor = None
+        # ProcessPoolExecutor cannot stop a running task; its processes are
+        # only reachable through this attribute before Python 3.14
+        processes = list((getattr(executor, "_processes", None) or {}).values())
+        executor.shutdown(wait=False, cancel_futures=True)
+        for process in processes:
+            process.kill()
+
+    async def extract_many(self, documents: List[tuple]) -> List[object]:
+        """
+        Extract (doc_type, bytes or path) pairs concurrently. Each entry of the
+        result is either the extracted text or the exception raised for that document.
+        """
+        return await asyncio.gather(
+            *(self.extract(doc_type, source) for doc_type, source in documents), return_exceptions=True
+        )
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+# =============================================================================
+# CONTENT-ADDRESSED STORAGE
+# =============================================================================
+
+
+STORE_CHUNK_BYTES = 1024 * 1024
+
+
+def document_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def document_text_key(doc_type: str, digest: str) -> str:
+    """Extracted-text cache key: the same bytes parsed as another type differ."""
+    return f"{doc_type}:{digest}"
+
+
+def document_type_from_filename(filename: str) -> Optional[str]:
+    extension = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+    return extension if extension in DOCUMENT_TYPES else None
+
+
+class DocumentStore:
+    """
+    Raw uploaded documents on disk, named by the SHA-256 of their bytes so the
+    hash doubles as the document handle. Least recently used files are evicted
+    once the store grows past `max_bytes`.
+    """
+
+    def __init__(self, directory: str = DOC_STORE_DIR, max_bytes: int = DOC_STORE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    def _path(self, document_id: str, doc_type: str) -> str:
+        return os.path.join(self.directory, f"{document_id}.{doc_type}")
+
+    def put(self, data: bytes, doc_type: str) -> str:
+        return self.put_file(io.BytesIO(data), doc_type)[0]
+
+    def put_file(self, fileobj: BinaryIO, doc_type: str, max_bytes: Optional[int] = None) -> Tuple[str, int]:
+        """
+        Store a document read from a binary file object, hashing it on the way
+        to disk; returns (document_id, size). Raises DocumentTooLarge past `max_bytes`.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        digest = hashlib.sha256()
+        size = 0
+        buffer = bytearray(STORE_CHUNK_BYTES)
+        view = memoryview(buffer)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".part")
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                while True:
+                    count = fileobj.readinto(buffer)
+                    if not count:
+                        break
+                    size += count
+                    if max_bytes is not None and size > max_bytes:
+                        raise DocumentTooLarge(f"Document is larger than {max_bytes} bytes")
+                    digest.update(view[:count])
+                    out.write(view[:count])
+            document_id = digest.hexdigest()
+            path = self._path(document_id, doc_type)
+            if os.path.exists(path):
+                os.utime(path)
+                os.remove(tmp_path)
+                return document_id, size
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self._evict()
+        return document_id, size
+
+    def find(self, document_id: str) -> Optional[Tuple[str, str]]:
+        """(doc_type, path) of a stored document, or None if unknown or evicted."""
+        if not all(c in '0123456789abcdef' for c in document_id) or len(document_id) != 64:
+            return None
+        for doc_type in DOCUMENT_TYPES:
+            path = self._path(document_id, doc_type)
+            if os.path.exists(path):
+                return doc_type, path
+        return None
+
+    def locate(self, document_id: str) -> Optional[Tuple[str, str]]:
+        """Like find(), and marks the document as recently used."""
+        found = self.find(document_id)
+        if found is not None:
+            os.utime(found[1])
+        return found
+
+    def get(self, document_id: str) -> Optional[Tuple[str, bytes]]:
+        found = self.locate(document_id)
+        if found is None:
+            return None
+        doc_type, path = found
+        with open(path, 'rb') as f:
+            return doc_type, f.read()
+
+    def _evict(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".part"):
+                continue
+            path = os.path.join(self.directory, name)
+            stat = os.stat(path)
+            entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            os.remove(path)
+            total -= size
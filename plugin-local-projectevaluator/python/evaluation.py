@@ -0,0 +1,214 @@
+"""
+Parsing and validation of the model's evaluation output.
+
+The response is scanned once for balanced top-level JSON objects (braces
+inside strings are ignored), each candidate is validated against the
+evaluation schema, and the first valid one wins. If none is valid, a short
+repair call asks the model to reformat only its own JSON; nothing is ever
+made up, so a response that cannot be repaired is an error, not a score.
+"""
+import json
+import os
+from typing import Awaitable, Callable, Dict, Iterator, List, Optional, Union
+
+from pydantic import BaseModel, Field, ValidationError, field_validator
+
+from telemetry import get_logger
+
+
+EVAL_REPAIR_ATTEMPTS = int(os.getenv("EVAL_REPAIR_ATTEMPTS", "1"))
+EVAL_REPAIR_MAX_CHARS = int(os.getenv("EVAL_REPAIR_MAX_CHARS", "12000"))
+# Optional cheaper model for repair calls; defaults to CORTEX_MODEL
+EVAL_REPAIR_MODEL = os.getenv("EVAL_REPAIR_MODEL")
+
+SCORE_TOLERANCE = 1
+
+Score = Union[int, float]  # keeps whole-number scores as ints in the response
+
+logger = get_logger("evaluation")
+
+
+class EvaluationParseError(Exception):
+    pass
+
+
+# =============================================================================
+# SCHEMA
+# =============================================================================
+
+
+class EvaluationScores(BaseModel):
+    code_quality: Score = Field(ge=0, le=35)
+    functionality_correctness: Score = Field(ge=0, le=45)
+    documentation: Score = Field(ge=0, le=20)
+
+    @property
+    def total(self) -> Score:
+        return self.code_quality + self.functionality_correctness + self.documentation
+
+
+class EvaluationReport(BaseModel):
+    strengths: List[str]
+    areas_of_improvement: List[str]
+    summary: str = Field(min_length=1)
+
+    @field_validator("strengths", "areas_of_improvement", mode="before")
+    @classmethod
+    def single_item_list(cls, value):
+        # Models occasionally return one bullet as a bare string
+        return [value] if isinstance(value, str) else value
+
+
+class Evaluation(BaseModel):
+    overall_score: Score = Field(ge=0, le=100)
+    scores: EvaluationScores
+    report: EvaluationReport
+    file_notes: Optional[Dict[str, str]] = None  # only requested for incremental re-evaluation
+
+
+def validate_evaluation(data: dict) -> dict:
+    """
+    Validate a decoded evaluation and return it as a plain dict. An
+    overall_score that disagrees with the category scores is replaced by
+    their sum, since the categories are what the rubric defines.
+    """
+    evaluation = Evaluation.model_validate(data)
+    if abs(evaluation.overall_score - evaluation.scores.total) > SCORE_TOLERANCE:
+        logger.info("overall_score does not match the category total, using the total", extra={
+            "overall_score": evaluation.overall_score, "category_total": evaluation.scores.total,
+        })
+        evaluation.overall_score = evaluation.scores.total
+    return evaluation.model_dump(exclude_none=True)
+
+
+# =============================================================================
+# INCREMENTAL JSON EXTRACTION
+# =============================================================================
+
+
+class JSONObjectScanner:
+    """
+    Finds balanced top-level `{...}` spans in text fed in any number of
+    chunks, tracking string literals and escapes so braces inside strings
+    do not count. Each character is examined once.
+    """
+
+    def __init__(self):
+        self._buffer: List[str] = []
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+
+    def feed(self, chunk: str) -> Iterator[str]:
+        """Yield every object that is completed by `chunk`."""
+        for char in chunk:
+            if self._depth == 0:
+                if char == '{':
+                    self._depth = 1
+                    self._buffer = [char]
+                continue
+
+            self._buffer.append(char)
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == '\\':
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char == '{':
+                self._depth += 1
+            elif char == '}':
+                self._depth -= 1
+                if self._depth == 0:
+                    yield "".join(self._buffer)
+                    self._buffer = []
+
+
+def iter_json_objects(text: str) -> Iterator[str]:
+    return JSONObjectScanner().feed(text)
+
+
+def parse_evaluation(text: str) -> dict:
+    """
+    Return the first JSON object in `text` that is a valid evaluation.
+    Raises EvaluationParseError describing why the last candidate failed.
+    """
+    problem = "no JSON object found in the response"
+    for candidate in iter_json_objects(text):
+        try:
+            data = json.loads(candidate)
+        except json.JSONDecodeError as e:
+            problem = f"invalid JSON: {e}"
+            continue
+        if not isinstance(data, dict) or "scores" not in data:
+            continue  # a nested example or unrelated object, keep looking
+        try:
+            return validate_evaluation(data)
+        except ValidationError as e:
+            problem = f"schema validation failed: {e}"
+    raise EvaluationParseError(problem)
+
+
+# =============================================================================
+# REPAIR
+# =============================================================================
+
+
+def build_repair_prompt(response_text: str, problem: str) -> str:
+    """A JSON-only reformatting request; the submission is not sent again."""
+    if len(response_text) > EVAL_REPAIR_MAX_CHARS:
+        start = response_text.find('{')
+        response_text = response_text[max(0, start):][:EVAL_REPAIR_MAX_CHARS]
+    return f"""The following evaluation was supposed to be a single JSON object but could not be used ({problem}).
+
+Rewrite it as valid JSON with exactly this structure. Keep the original scores and wording; do not re-evaluate anything.
+{{
+  "overall_score": <number 0-100, the sum of the three scores>,
+  "scores": {{
+    "code_quality": <number 0-35>,
+    "functionality_correctness": <number 0-45>,
+    "documentation": <number 0-20>
+  }},
+  "report": {{
+    "strengths": ["<string>"],
+    "areas_of_improvement": ["<string>"],
+    "summary": "<string>"
+  }}
+}}
+
+Return only the JSON object, with no other text.
+
+EVALUATION TO REFORMAT:
+{response_text}
+"""
+
+
+async def parse_or_repair(
+    response_text: str,
+    complete: Callable[[str], Awaitable[Optional[str]]],
+    attempts: int = EVAL_REPAIR_ATTEMPTS,
+) -> dict:
+    """
+    Parse `response_text`, falling back to at most `attempts` repair calls
+    through `complete(prompt)`. Raises EvaluationParseError if it stays invalid.
+    """
+    try:
+        return parse_evaluation(response_text)
+    except EvaluationParseError as e:
+        problem = str(e)
+
+    for attempt in range(1, attempts + 1):
+        logger.warning("Evaluation response unusable, requesting a repair", extra={"problem": problem[:200], "attempt": attempt})
+        repaired = await complete(build_repair_prompt(response_text, problem))
+        if not repaired:
+            continue
+        try:
+            return parse_evaluation(repaired)
+        except EvaluationParseError as e:
+            problem = str(e)
+            response_text = repaired
+
+    raise EvaluationParseError(problem)
@@ -0,0 +1,408 @@
+"""
+Sandboxed test execution of Python submissions.
+
+"Functionality & Correctness" is the largest part of the score, yet the model
+only reads the code. When enabled, a Python submission is unpacked into a
+temporary directory and pytest runs over either an instructor-provided test
+file or the project's own tests. The pass/fail counts and failing test names
+go into the evaluation prompt; the full report, with timings, goes into the
+response.
+
+Each run is a separate subprocess with CPU-time, address-space, file-size
+and open-file rlimits, a wall-clock timeout that kills its whole process
+group, and an environment without the service's credentials. By default it
+also runs in private user, network, mount and PID namespaces (`unshare`):
+no network, a read-only view of the filesystem except its own workspace,
+the service's data directory and `.env` hidden, and no view of the service's
+processes. If the kernel does not allow that, tests are not run at all,
+unless TEST_NETWORK_ISOLATION=guard explicitly accepts the weaker fallback:
+a socket guard inside the test process and nothing more. Runs for different
+submissions proceed in parallel, up to TEST_CONCURRENCY at a time.
+
+The sandbox protects the service, not the grade: code under test can still
+tamper with its own results, which is why they inform the model rather than
+replace its judgement.
+"""
+import asyncio
+import os
+import re
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+import xml.etree.ElementTree as ElementTree
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+from analysis import is_test_file
+from cache import DATA_DIR
+
+
+TEST_EXECUTION_ENABLED = os.getenv("TEST_EXECUTION_ENABLED", "false").lower() in ("1", "true", "yes")
+TEST_CONCURRENCY = int(os.getenv("TEST_CONCURRENCY", str(os.cpu_count() or 2)))
+TEST_TIMEOUT = float(os.getenv("TEST_TIMEOUT", "60"))
+TEST_CPU_SECONDS = int(os.getenv("TEST_CPU_SECONDS", "30"))
+TEST_MEMORY_BYTES = int(os.getenv("TEST_MEMORY_BYTES", str(1024 * 1024 * 1024)))
+TEST_MAX_FILE_BYTES = int(os.getenv("TEST_MAX_FILE_BYTES", str(16 * 1024 * 1024)))
+TEST_MAX_OPEN_FILES = int(os.getenv("TEST_MAX_OPEN_FILES", "256"))
+# RLIMIT_NPROC counts every process of the user, so only set it when tests run as a dedicated user
+TEST_MAX_PROCESSES = int(os.getenv("TEST_MAX_PROCESSES", "0"))
+# namespace (the default; tests are refused where the kernel does not allow it) or guard.
+# guard only patches sockets in the test process: student code can get around it, and
+# reads and writes anything the service's user can. "auto" is taken as namespace.
+TEST_NETWORK_ISOLATION = os.getenv("TEST_NETWORK_ISOLATION", "namespace").lower()
+# Hidden from the tests in namespace mode, besides the data directory and the app's .env
+TEST_HIDDEN_PATHS = [p.strip() for p in os.getenv("TEST_HIDDEN_PATHS", "").split(",") if p.strip()]
+# Interpreter the tests run under; it needs pytest and whatever the assignment allows students to import
+TEST_PYTHON = os.getenv("TEST_PYTHON", sys.executable)
+TEST_WORK_DIR = os.getenv("TEST_WORK_DIR") or None
+# Largest instructor test file accepted with a request
+TEST_FILE_MAX_BYTES = int(os.getenv("TEST_FILE_MAX_BYTES", str(1024 * 1024)))
+
+FAILURES_SHOWN = 20
+SLOWEST_SHOWN = 5
+MESSAGE_CHARS = 200
+OUTPUT_TAIL_CHARS = 2000
+MAX_REPORT_BYTES = 8 * 1024 * 1024
+
+# Memory addresses and the like differ between runs; the prompt section must not
+_VOLATILE = re.compile(r'0x[0-9a-fA-F]+|\b\d+\.\d+s\b')
+
+# Runs as root of the new user namespace, before the launcher: hide the given
+# paths, keep the workspace writable and make every other mount read-only
+SANDBOX_SCRIPT = """
+set -e
+workspace=$1; shift
+while [ "$1" != "--" ]; do
+    if [ -d "$1" ]; then mount -t tmpfs -o ro,size=0 none "$1"; elif [ -e "$1" ]; then mount --bind /dev/null "$1"; fi
+    shift
+done
+shift
+mount --bind "$workspace" "$workspace"
+awk '{print $5}' /proc/self/mountinfo | while read -r target; do
+    [ "$target" = "$workspace" ] || mount -o remount,bind,ro "$target" 2>/dev/null || true
+done
+exec "$@"
+"""
+
+UNSHARE = ["unshare", "--net", "--mount", "--pid", "--fork", "--mount-proc", "--map-root-user"]
+
+# Runs inside the sandbox: apply the limits, block sockets if asked, then run pytest in-process
+LAUNCHER = """
+import resource, socket, sys
+cpu, memory, file_bytes, open_files, processes, block_network = (int(value) for value in sys.argv[1:7])
+limits = [(resource.RLIMIT_CORE, 0), (resource.RLIMIT_CPU, cpu), (resource.RLIMIT_AS, memory),
+          (resource.RLIMIT_FSIZE, file_bytes), (resource.RLIMIT_NOFILE, open_files), (resource.RLIMIT_NPROC, processes)]
+for limit, value in limits:
+    if value or limit == resource.RLIMIT_CORE:
+        # A one-second margin on CPU time: SIGXCPU at the soft limit, SIGKILL at the hard one
+        resource.setrlimit(limit, (value, value + 1 if limit == resource.RLIMIT_CPU else value))
+if block_network:
+    def refuse(*args, **kwargs):
+        raise OSError("network access is disabled while grading")
+    for name in ("connect", "connect_ex", "bind", "sendto"):
+        setattr(socket.socket, name, refuse)
+    socket.create_connection = socket.getaddrinfo = refuse
+import pytest
+sys.exit(pytest.main(sys.argv[7:]))
+"""
+
+
+class TestRunError(Exception):
+    """The sandbox itself could not run (as opposed to failing tests)."""
+
+
+@dataclass
+class TestCase:
+    name: str
+    outcome: str  # passed, failed, error or skipped
+    duration: float = 0.0
+    message: str = ""
+
+
+@dataclass
+class TestRun:
+    source: str  # "instructor" or "project"
+    network_isolation: str
+    cases: List[TestCase] = field(default_factory=list)
+    exit_code: Optional[int] = None
+    timed_out: bool = False
+    duration: float = 0.0
+    output: str = ""
+
+    def count(self, outcome: str) -> int:
+        return sum(1 for case in self.cases if case.outcome == outcome)
+
+    @property
+    def outcome(self) -> str:
+        if self.timed_out:
+            return "timed_out"
+        if not self.cases:
+            return "crashed"
+        return "failed" if self.count("failed") or self.count("error") else "passed"
+
+    def report(self) -> dict:
+        report = {
+            "source": self.source,
+            "outcome": self.outcome,
+            "passed": self.count("passed"),
+            "failed": self.count("failed"),
+            "errors": self.count("error"),
+            "skipped": self.count("skipped"),
+            "total": len(self.cases),
+            "duration_seconds": round(self.duration, 3),
+            "timed_out": self.timed_out,
+            "exit_code": self.exit_code,
+            "network_isolation": self.network_isolation,
+            "failures": [
+                {"test": case.name, "outcome": case.outcome, "message": case.message}
+                for case in self.cases if case.outcome in ("failed", "error")
+            ][:FAILURES_SHOWN],
+            "slowest": [
+                {"test": case.name, "seconds": round(case.duration, 3)}
+                for case in sorted(self.cases, key=lambda case: case.duration, reverse=True)[:SLOWEST_SHOWN]
+            ],
+        }
+        if not self.cases:
+            report["output"] = self.output
+        return report
+
+    def format_for_llm(self) -> str:
+        """Counts and failing tests; no timings, so the same results give the same prompt."""
+        tests = "the instructor's tests" if self.source == "instructor" else "the project's own tests"
+        lines = [f"--- TEST RESULTS (pytest run locally over {tests}) ---"]
+        if self.timed_out:
+            lines.append("The test run was stopped after exceeding its time limit; no results were recorded.")
+        elif not self.cases:
+            lines.append(f"The test run crashed before reporting any results (exit code {self.exit_code}).")
+        else:
+            lines.append(
+                f"{len(self.cases)} tests: {self.count('passed')} passed, {self.count('failed')} failed, "
+                f"{self.count('error')} errors, {self.count('skipped')} skipped"
+            )
+            failures = [case for case in self.cases if case.outcome in ("failed", "error")]
+            if failures:
+                lines.append("Failing tests:")
+                lines += [
+                    f"- {case.name} ({case.outcome})" + (f": {_VOLATILE.sub('…', case.message)}" if case.message else "")
+                    for case in failures[:FAILURES_SHOWN]
+                ]
+                if len(failures) > FAILURES_SHOWN:
+                    lines.append(f"- ... and {len(failures) - FAILURES_SHOWN} more")
+        lines.append("--- END TEST RESULTS ---")
+        return "\n".join(lines) + "\n\n"
+
+
+def is_python_test_file(path: str) -> bool:
+    return path.endswith('.py') and is_test_file(path)
+
+
+def instructor_test_name(filename: Optional[str]) -> str:
+    """A safe file name for an uploaded test file, which pytest will collect."""
+    name = re.sub(r'[^A-Za-z0-9_]', '_', os.path.splitext(os.path.basename(filename or ""))[0])
+    return (name if name.startswith('test') else f"test_{name or 'instructor'}") + ".py"
+
+
+def _project_root(files) -> str:
+    """The single top-level directory every file sits in (common in archives), or ''."""
+    tops = {submission_file.path.split('/', 1)[0] for submission_file in files if '/' in submission_file.path}
+    if len(tops) == 1 and all('/' in submission_file.path for submission_file in files):
+        return tops.pop()
+    return ""
+
+
+def _write_files(directory: str, files) -> int:
+    written = 0
+    for submission_file in files:
+        target = os.path.normpath(os.path.join(directory, submission_file.path))
+        if not target.startswith(directory + os.sep):
+            continue
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target, 'w', encoding='utf-8') as handle:
+            handle.write(submission_file.content)
+        written += 1
+    return written
+
+
+def _message(element) -> str:
+    message = (element.get("message") or "").strip()
+    # An error's message is generic ("collection failure"); the exception is the last "E" line of the traceback
+    errors = [line[1:].strip() for line in (element.text or "").splitlines() if line.startswith("E ")]
+    if element.tag == "error" and errors:
+        message = errors[-1]
+    elif not message and errors:
+        message = errors[0]
+    return message.splitlines()[0][:MESSAGE_CHARS] if message else ""
+
+
+def parse_junit(path: str) -> List[TestCase]:
+    """Test cases from pytest's JUnit XML report; empty if there is no usable report."""
+    try:
+        if os.path.getsize(path) > MAX_REPORT_BYTES:
+            return []
+        root = ElementTree.parse(path).getroot()
+    except (OSError, ElementTree.ParseError):
+        return []
+    cases = []
+    for element in root.iter("testcase"):
+        classname = element.get("classname", "")
+        name = f"{classname}::{element.get('name', '')}" if classname else element.get("name", "")
+        case = TestCase(name, "passed", float(element.get("time") or 0))
+        for outcome, tag in (("failed", "failure"), ("error", "error"), ("skipped", "skipped")):
+            child = element.find(tag)
+            if child is not None:
+                case.outcome = outcome
+                case.message = _message(child) if outcome != "skipped" else ""
+                break
+        cases.append(case)
+    return cases
+
+
+def _tail(path: str) -> str:
+    try:
+        with open(path, 'rb') as handle:
+            handle.seek(max(0, os.path.getsize(path) - OUTPUT_TAIL_CHARS))
+            return handle.read().decode('utf-8', errors='replace')
+    except OSError:
+        return ""
+
+
+class TestRunner:
+    def __init__(
+        self,
+        concurrency: int = TEST_CONCURRENCY,
+        timeout: float = TEST_TIMEOUT,
+        python: str = TEST_PYTHON,
+        network_isolation: str = TEST_NETWORK_ISOLATION,
+        work_dir: Optional[str] = TEST_WORK_DIR,
+    ):
+        self.timeout = timeout
+        self.python = python
+        self.network_isolation = "namespace" if network_isolation == "auto" else network_isolation
+        self.work_dir = work_dir
+        self.hidden_paths = [DATA_DIR, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".env"), *TEST_HIDDEN_PATHS]
+        self._semaphore = asyncio.Semaphore(max(1, concurrency))
+        self._probed: Optional[str] = None
+        self._probe_lock = asyncio.Lock()
+
+    def _probe(self) -> str:
+        """Check pytest is importable and the sandbox can start; raises TestRunError."""
+        try:
+            subprocess.run([self.python, "-c", "import pytest"], check=True, capture_output=True, timeout=30)
+        except (OSError, subprocess.SubprocessError) as e:
+            raise TestRunError(f"pytest is not available to {self.python}: {e}")
+        if self.network_isolation == "guard":
+            return "guard"
+        if self.network_isolation != "namespace":
+            raise TestRunError(f"unknown TEST_NETWORK_ISOLATION {self.network_isolation!r}")
+        workspace = tempfile.mkdtemp(prefix="evaluator-tests-", dir=self.work_dir)
+        try:
+            subprocess.run(self._sandbox(workspace, ["true"]), check=True, capture_output=True, timeout=10)
+        except (OSError, subprocess.SubprocessError) as e:
+            raise TestRunError(f"the test sandbox needs user, network, mount and PID namespaces: {e}")
+        finally:
+            shutil.rmtree(workspace, True)
+        return "namespace"
+
+    async def isolation(self) -> str:
+        async with self._probe_lock:
+            if self._probed is None:
+                self._probed = await asyncio.to_thread(self._probe)
+        return self._probed
+
+    def _sandbox(self, workspace: str, command: List[str]) -> List[str]:
+        """`command` wrapped in the namespaces, with the filesystem view set up first."""
+        # A hidden directory that contains the workspace would hide the workspace too
+        hidden = [path for path in self.hidden_paths if not (workspace + os.sep).startswith(path.rstrip(os.sep) + os.sep)]
+        return [*UNSHARE, "sh", "-c", SANDBOX_SCRIPT, "sandbox", workspace, *hidden, "--", *command]
+
+    def _command(self, isolation: str, workspace: str, pytest_args: List[str]) -> List[str]:
+        limits = [TEST_CPU_SECONDS, TEST_MEMORY_BYTES, TEST_MAX_FILE_BYTES, TEST_MAX_OPEN_FILES, TEST_MAX_PROCESSES]
+        command = [self.python, "-s", "-c", LAUNCHER, *(str(limit) for limit in limits), str(int(isolation == "guard"))]
+        if isolation == "namespace":
+            command = self._sandbox(workspace, command)
+        return command + pytest_args
+
+    def _prepare(self, workspace: str, files, tests) -> tuple:
+        """Write the submission (and instructor tests) out; returns (cwd, pythonpath, pytest args)."""
+        submission_dir = os.path.join(workspace, "submission")
+        os.makedirs(os.path.join(workspace, "tmp"))
+        os.makedirs(submission_dir)
+        _write_files(submission_dir, files)
+        root = os.path.join(submission_dir, _project_root(files))
+        pythonpath = [root] + ([os.path.join(root, "src")] if os.path.isdir(os.path.join(root, "src")) else [])
+        report = os.path.join(workspace, "report.xml")
+        args = ["-q", "-p", "no:cacheprovider", "--color=no", f"--junitxml={report}"]
+        if tests is None:
+            return root, pythonpath, args + [f"--rootdir={root}", root]
+        # Outside the submission, so none of the student's conftest.py files apply
+        tests_dir = os.path.join(workspace, "instructor")
+        _write_files(tests_dir, [tests])
+        return root, pythonpath, args + [f"--rootdir={tests_dir}", f"--confcutdir={tests_dir}", tests_dir]
+
+    async def run(self, files, tests=None) -> Optional[TestRun]:
+        """
+        Run `tests` (an instructor test file with `path` and `content`) or,
+        without it, the submission's own tests. None when there is nothing
+        to run; raises TestRunError when the sandbox cannot start.
+        """
+        files = list(files)
+        if not any(submission_file.path.endswith('.py') for submission_file in files):
+            return None
+        if tests is None and not any(is_python_test_file(submission_file.path) for submission_file in files):
+            return None
+        isolation = await self.isolation()
+        async with self._semaphore:
+            workspace = tempfile.mkdtemp(prefix="evaluator-tests-", dir=self.work_dir)
+            try:
+                return await self._run(workspace, isolation, files, tests)
+            finally:
+                await asyncio.to_thread(shutil.rmtree, workspace, True)
+
+    async def _run(self, workspace: str, isolation: str, files, tests) -> TestRun:
+        try:
+            cwd, pythonpath, pytest_args = await asyncio.to_thread(self._prepare, workspace, files, tests)
+        except OSError as e:
+            raise TestRunError(f"could not write the submission to {workspace}: {e}")
+        env = {
+            "PATH": "/usr/local/bin:/usr/bin:/bin",
+            "HOME": workspace,
+            "TMPDIR": os.path.join(workspace, "tmp"),
+            "LANG": "C.UTF-8",
+            "PYTHONPATH": os.pathsep.join(pythonpath),
+            "PYTHONDONTWRITEBYTECODE": "1",
+            "PYTHONHASHSEED": "0",
+            "PYTEST_DISABLE_PLUGIN_AUTOLOAD": "1",
+        }
+        run = TestRun("instructor" if tests is not None else "project", isolation)
+        output_path = os.path.join(workspace, "output.log")
+        started = time.perf_counter()
+        # Output goes to a file, where RLIMIT_FSIZE caps it; a pipe would buffer it all in this process
+        with open(output_path, 'wb') as output:
+            try:
+                process = await asyncio.create_subprocess_exec(
+                    *self._command(isolation, workspace, pytest_args), cwd=cwd, env=env,
+                    stdin=subprocess.DEVNULL, stdout=output, stderr=subprocess.STDOUT, start_new_session=True,
+                )
+            except OSError as e:
+                raise TestRunError(f"could not start pytest: {e}")
+            try:
+                run.exit_code = await asyncio.wait_for(process.wait(), timeout=self.timeout)
+            except asyncio.TimeoutError:
+                run.timed_out = True
+            finally:
+                # Also reaps anything the tests left running in the background
+                try:
+                    os.killpg(process.pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+                if process.returncode is None:
+                    await process.wait()
+        run.duration = time.perf_counter() - started
+        if not run.timed_out:
+            run.cases = await asyncio.to_thread(parse_junit, os.path.join(workspace, "report.xml"))
+        if not run.cases:
+            run.output = await asyncio.to_thread(_tail, output_path)
+        return run
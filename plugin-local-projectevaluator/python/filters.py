@@ -0,0 +1,239 @@
+"""
+Which archive members are worth reading.
+
+Every member of an uploaded zip/tar or a GitHub tarball passes through here
+before any of its bytes are decompressed:
+
+1. Ignore rules, in gitignore syntax: dependency trees, VCS metadata, build
+   output, lockfiles and minified bundles by default, plus the submission's
+   own `.gitignore` files and INGEST_IGNORE_PATTERNS. Ignored members are
+   only counted, never listed in the prompt.
+2. Known binary file types, by extension.
+3. A sniff of the first INGEST_SNIFF_BYTES of what is left: a NUL byte or a
+   known magic number marks the member as binary without reading the rest.
+"""
+import os
+import re
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional
+
+
+SNIFF_BYTES = int(os.getenv("INGEST_SNIFF_BYTES", "8192"))
+HONOR_GITIGNORE = os.getenv("INGEST_HONOR_GITIGNORE", "true").lower() in ("1", "true", "yes")
+# Extra comma-separated gitignore patterns; they are applied last, so "!dist/" re-includes a default
+EXTRA_IGNORE_PATTERNS = [p.strip() for p in os.getenv("INGEST_IGNORE_PATTERNS", "").split(",") if p.strip()]
+
+# A submission's .gitignore larger than this is not a real one
+MAX_GITIGNORE_BYTES = 64 * 1024
+
+# Only names that are unmistakably tooling output. Generic directory names
+# (bin/, build/, env/, out/, vendor/) often hold student code, which a default
+# would drop with no way back for the student; a submission's .gitignore or
+# INGEST_IGNORE_PATTERNS can still exclude them.
+DEFAULT_IGNORE_PATTERNS = [
+    # Version control and OS/editor metadata
+    ".git/", ".hg/", ".svn/", ".DS_Store", "Thumbs.db", "__MACOSX/", ".idea/", ".vscode/",
+    # Dependencies and virtual environments
+    "node_modules/", "bower_components/", "jspm_packages/", "third_party/",
+    "venv/", ".venv/", "site-packages/", ".tox/", ".gradle/",
+    # Caches and build output
+    "__pycache__/", "*.pyc", "*.pyo", ".mypy_cache/", ".pytest_cache/", ".ruff_cache/", ".ipynb_checkpoints/",
+    "dist/", "target/", "obj/", ".next/", ".nuxt/", "coverage/", "htmlcov/",
+    # Lockfiles and generated or minified code
+    "*.lock", "*-lock.json", "*-lock.yaml", "go.sum",
+    "*.min.js", "*.min.css", "*.map", "*.bundle.js", "*.pb.go", "*_pb2.py", "*.generated.cs",
+]
+
+BINARY_EXTENSIONS = {
+    'png', 'jpg', 'jpeg', 'gif', 'bmp', 'ico', 'icns', 'webp', 'tif', 'tiff', 'psd', 'heic',
+    'pdf', 'doc', 'docx', 'xls', 'xlsx', 'ppt', 'pptx', 'odt', 'ods', 'odp',
+    'exe', 'dll', 'so', 'dylib', 'o', 'a', 'lib', 'obj', 'class', 'jar', 'war', 'ear', 'apk', 'wasm',
+    'pyc', 'pyo', 'pyd', 'whl', 'egg',
+    'gz', 'tgz', 'bz2', 'xz', 'zst', '7z', 'rar', 'tar', 'iso', 'dmg',
+    'mp3', 'mp4', 'm4a', 'wav', 'ogg', 'flac', 'avi', 'mov', 'mkv', 'webm',
+    'ttf', 'otf', 'woff', 'woff2', 'eot',
+    'sqlite', 'sqlite3', 'db', 'mdb', 'npy', 'npz', 'pkl', 'pickle', 'h5', 'hdf5', 'onnx', 'pt', 'pth', 'ckpt',
+    'parquet', 'feather', 'avro',
+}
+
+MAGIC_NUMBERS = (
+    b"\x89PNG", b"\xff\xd8\xff", b"GIF87a", b"GIF89a", b"BM", b"II*\x00", b"MM\x00*",
+    b"%PDF", b"PK\x03\x04", b"\x1f\x8b", b"BZh", b"\xfd7zXZ\x00", b"7z\xbc\xaf\x27\x1c", b"Rar!",
+    b"\x7fELF", b"MZ", b"\xca\xfe\xba\xbe", b"\xcf\xfa\xed\xfe", b"\xce\xfa\xed\xfe", b"\x00asm",
+    b"SQLite format 3\x00", b"OggS", b"RIFF", b"ID3", b"fLaC", b"wOFF", b"wOF2",
+    b"\x93NUMPY", b"\x80\x04\x95",
+)
+
+
+def is_binary_name(path: str) -> bool:
+    name = path.rsplit('/', 1)[-1].lower()
+    return '.' in name and name.rsplit('.', 1)[-1] in BINARY_EXTENSIONS
+
+
+def looks_binary(head: bytes) -> bool:
+    """NUL bytes or a known magic number in the first bytes of a file."""
+    # "BM" and "MZ" are also how plenty of text starts; require a NUL soon after
+    if head.startswith((b"BM", b"MZ")):
+        return b"\x00" in head[:64]
+    return head.startswith(MAGIC_NUMBERS) or b"\x00" in head
+
+
+# =============================================================================
+# IGNORE RULES
+# =============================================================================
+
+
+@dataclass
+class IgnoreRule:
+    regex: str
+    negate: bool
+    dir_only: bool
+    anchored: bool  # matched against the path below `base`, not just the name
+    base: str       # directory of the .gitignore that defined it, with a trailing "/"
+
+
+@dataclass
+class RuleGroup:
+    """Rules that can be tested as one alternation: same kind, no negation in between."""
+    regex: re.Pattern
+    negate: bool
+    dir_only: bool
+    anchored: bool
+    base: str
+
+
+def _translate(glob: str) -> str:
+    """Gitignore glob to regex: `*` and `?` stay within one path segment, `**` spans segments."""
+    out, i = [], 0
+    while i < len(glob):
+        if glob.startswith("**/", i):
+            out.append("(?:.*/)?")
+            i += 3
+        elif glob.startswith("**", i):
+            out.append(".*")
+            i += 2
+        elif glob[i] == "*":
+            out.append("[^/]*")
+            i += 1
+        elif glob[i] == "?":
+            out.append("[^/]")
+            i += 1
+        elif glob[i] == "[" and "]" in glob[i + 2:]:
+            end = glob.index("]", i + 2)
+            body = glob[i + 1:end].replace("\\", "\\\\")
+            out.append("[" + ("^" + body[1:] if body.startswith("!") else body) + "]")
+            i = end + 1
+        elif glob[i] == "\\" and i + 1 < len(glob):
+            out.append(re.escape(glob[i + 1]))
+            i += 2
+        else:
+            out.append(re.escape(glob[i]))
+            i += 1
+    return "".join(out)
+
+
+def parse_ignore_patterns(lines: Iterable[str], base: str = "") -> List[IgnoreRule]:
+    rules = []
+    for line in lines:
+        line = line.rstrip("\r\n")
+        if not line.endswith("\\ "):
+            line = line.rstrip()
+        if not line or line.startswith("#"):
+            continue
+        negate = line.startswith("!")
+        if negate:
+            line = line[1:]
+        elif line.startswith("\\"):
+            line = line[1:]  # "\#" and "\!" escape the first character
+        dir_only = line.endswith("/")
+        line = line.rstrip("/")
+        if not line:
+            continue
+        anchored = "/" in line
+        rules.append(IgnoreRule(_translate(line.lstrip("/")), negate, dir_only, anchored, base))
+    return rules
+
+
+def compile_rules(rules: List[IgnoreRule]) -> List[RuleGroup]:
+    """
+    Merge rules into as few regexes as possible. Last match wins, but among
+    consecutive rules with the same negation any match gives the same answer,
+    so each such run becomes one regex per (dir_only, anchored, base).
+    """
+    groups: List[RuleGroup] = []
+    start = 0
+    while start < len(rules):
+        end = start
+        while end < len(rules) and rules[end].negate == rules[start].negate:
+            end += 1
+        kinds: Dict[tuple, List[str]] = {}
+        for rule in rules[start:end]:
+            kinds.setdefault((rule.dir_only, rule.anchored, rule.base), []).append(rule.regex)
+        for (dir_only, anchored, base), regexes in kinds.items():
+            regex = re.compile("|".join(f"(?:{r})" for r in regexes))
+            groups.append(RuleGroup(regex, rules[start].negate, dir_only, anchored, base))
+        start = end
+    return groups
+
+
+# Compiled once; every archive starts from these
+SERVICE_RULE_GROUPS = compile_rules(parse_ignore_patterns(DEFAULT_IGNORE_PATTERNS + EXTRA_IGNORE_PATTERNS))
+
+
+class IgnoreMatcher:
+    """
+    Gitignore matching over archive paths. Rules from the submission's own
+    .gitignore files come first and the service's rules last, so a student's
+    `!node_modules/` cannot re-include what the service ignores. As in git,
+    the last matching rule wins, and nothing inside an ignored directory can
+    be re-included.
+    """
+
+    def __init__(self, patterns: Optional[List[str]] = None, honor_gitignore: bool = HONOR_GITIGNORE):
+        self.honor_gitignore = honor_gitignore
+        self._submission_rules: List[IgnoreRule] = []
+        self._service_groups = SERVICE_RULE_GROUPS if patterns is None else compile_rules(parse_ignore_patterns(patterns))
+        self._groups = self._service_groups
+        self._dirs: Dict[str, bool] = {}  # directory path -> ignored; most paths share their parents
+
+    @staticmethod
+    def is_gitignore(path: str) -> bool:
+        return path == ".gitignore" or path.endswith("/.gitignore")
+
+    def add_gitignore(self, path: str, data: bytes):
+        """Add the rules of the submission's `path` (a .gitignore), scoped to its directory."""
+        if not self.honor_gitignore or len(data) > MAX_GITIGNORE_BYTES:
+            return
+        base = path[:-len(".gitignore")]
+        self._submission_rules.extend(parse_ignore_patterns(data.decode("utf-8", errors="replace").splitlines(), base))
+        self._groups = compile_rules(self._submission_rules) + self._service_groups
+        self._dirs.clear()
+
+    def _matches(self, path: str, is_dir: bool) -> bool:
+        ignored = False
+        name = path.rpartition("/")[2]
+        for group in self._groups:
+            if group.dir_only and not is_dir:
+                continue
+            if group.base:
+                if not path.startswith(group.base):
+                    continue
+                relative = path[len(group.base):]
+            else:
+                relative = path
+            if group.regex.fullmatch(relative if group.anchored else name):
+                ignored = not group.negate
+        return ignored
+
+    def _dir_ignored(self, directory: str) -> bool:
+        ignored = self._dirs.get(directory)
+        if ignored is None:
+            parent = directory.rpartition("/")[0]
+            ignored = (bool(parent) and self._dir_ignored(parent)) or self._matches(directory, True)
+            self._dirs[directory] = ignored
+        return ignored
+
+    def is_ignored(self, path: str) -> bool:
+        path = path.strip("/")
+        parent = path.rpartition("/")[0]
+        return (bool(parent) and self._dir_ignored(parent)) or self._matches(path, False)
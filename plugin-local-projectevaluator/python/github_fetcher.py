@@ -0,0 +1,207 @@
+"""
+Concurrent GitHub repository fetcher.
+
+Repository metadata (repo, commits, languages) is requested concurrently
+over one pooled `httpx.AsyncClient`, and the code itself is downloaded in a
+single request through the tarball endpoint. JSON responses are cached by
+ETag (a 304 does not count against the API rate limit) and tarballs are
+cached by commit SHA, so re-evaluating an unchanged repository costs no
+API quota.
+"""
+import asyncio
+import os
+import shutil
+import tempfile
+from dataclasses import dataclass
+from typing import Any, List, Optional, Tuple
+
+import httpx
+
+from cache import DATA_DIR, SQLiteCache
+from ingest import MAX_UPLOAD_BYTES, IngestResult, ingest_archive
+from resilience import RETRYABLE_STATUS, CircuitBreaker, RetryableStatus, call_with_retries, retry_after_header
+from telemetry import span
+
+
+GITHUB_API_URL = os.getenv("GITHUB_API_URL", "https://api.github.com").rstrip("/")
+GITHUB_TOKEN = os.getenv("GITHUB_TOKEN")
+GITHUB_TIMEOUT = float(os.getenv("GITHUB_TIMEOUT", "30"))
+GITHUB_MAX_CONNECTIONS = int(os.getenv("GITHUB_MAX_CONNECTIONS", "20"))
+GITHUB_ETAG_CACHE_PATH = os.getenv("GITHUB_ETAG_CACHE_PATH", os.path.join(DATA_DIR, "github_etags.sqlite3"))
+GITHUB_TARBALL_DIR = os.getenv("GITHUB_TARBALL_DIR", os.path.join(DATA_DIR, "github_tarballs"))
+GITHUB_TARBALL_CACHE_MAX = int(os.getenv("GITHUB_TARBALL_CACHE_MAX", "100"))
+
+
+class GitHubError(Exception):
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+@dataclass
+class GitHubRepository:
+    owner: str
+    repo: str
+    repo_data: dict
+    commits: List[dict]
+    languages: dict
+    sha: Optional[str]
+    tarball_path: Optional[str]
+
+
+def strip_tarball_root(result: IngestResult) -> IngestResult:
+    """GitHub tarballs wrap everything in an `owner-repo-sha/` directory; drop it."""
+    for submission_file in result.files:
+        submission_file.path = submission_file.path.split('/', 1)[-1]
+    result.skipped = [path.split('/', 1)[-1] for path in result.skipped]
+    return result
+
+
+def read_repository_tarball(tarball_path: str) -> IngestResult:
+    """Ingest a downloaded tarball through the same streaming tar reader as uploads."""
+    with open(tarball_path, 'rb') as fileobj:
+        return strip_tarball_root(ingest_archive(tarball_path, fileobj))
+
+
+class GitHubFetcher:
+    def __init__(
+        self,
+        api_url: str = GITHUB_API_URL,
+        token: Optional[str] = GITHUB_TOKEN,
+        etag_cache: Optional[SQLiteCache] = None,
+        tarball_dir: str = GITHUB_TARBALL_DIR,
+    ):
+        self.api_url = api_url
+        self.token = token
+        self.etag_cache = etag_cache if etag_cache is not None else SQLiteCache(GITHUB_ETAG_CACHE_PATH, max_entries=10000)
+        self.tarball_dir = tarball_dir
+        self._client: Optional[httpx.AsyncClient] = None
+        # Opens after repeated transient failures, so requests fail fast while GitHub is down
+        self.breaker = CircuitBreaker("github")
+
+    def _headers(self) -> dict:
+        headers = {
+            'Accept': 'application/vnd.github.v3+json',
+            'User-Agent': 'Moodle-Project-Evaluator',
+        }
+        if self.token:
+            headers['Authorization'] = f"Bearer {self.token}"
+        return headers
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.api_url,
+                headers=self._headers(),
+                timeout=GITHUB_TIMEOUT,
+                follow_redirects=True,
+                limits=httpx.Limits(max_connections=GITHUB_MAX_CONNECTIONS),
+            )
+        return self._client
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def get_json(self, path: str) -> Tuple[int, Any]:
+        """
+        Conditional GET. Returns (status, body); a 304 is answered from the
+        ETag cache and reported as 200. 429 and 5xx answers are retried, and
+        their status is returned once retries run out.
+        """
+        cached = self.etag_cache.get(path)
+        headers = {'If-None-Match': cached["etag"]} if cached else {}
+
+        async def attempt() -> httpx.Response:
+            response = await self.client.get(path, headers=headers)
+            if response.status_code in RETRYABLE_STATUS:
+                raise RetryableStatus(response.status_code, retry_after_header(response))
+            return response
+
+        try:
+            response = await call_with_retries(attempt, self.breaker, f"GET {path}")
+        except RetryableStatus as e:
+            return e.status_code, None
+
+        if response.status_code == 304 and cached:
+            return 200, cached["body"]
+        if response.status_code != 200:
+            return response.status_code, None
+
+        body = response.json()
+        etag = response.headers.get('ETag')
+        if etag:
+            self.etag_cache.set(path, {"etag": etag, "body": body})
+        return 200, body
+
+    async def fetch_metadata(self, owner: str, repo: str) -> Tuple[dict, List[dict], dict]:
+        base = f"/repos/{owner}/{repo}"
+        (repo_status, repo_data), (commits_status, commits), (languages_status, languages) = await asyncio.gather(
+            self.get_json(base),
+            self.get_json(f"{base}/commits?per_page=10"),
+            self.get_json(f"{base}/languages"),
+        )
+        if repo_status == 404:
+            raise GitHubError(404, "Repository not found or is private")
+        if repo_status != 200:
+            raise GitHubError(400, "Failed to access repository")
+        return repo_data, (commits if commits_status == 200 else []), (languages if languages_status == 200 else {})
+
+    def _tarball_path(self, owner: str, repo: str, sha: str) -> str:
+        return os.path.join(self.tarball_dir, f"{owner}__{repo}__{sha}.tar.gz")
+
+    def _evict_tarballs(self):
+        entries = [os.path.join(self.tarball_dir, name) for name in os.listdir(self.tarball_dir) if name.endswith(".tar.gz")]
+        entries.sort(key=os.path.getmtime)
+        for path in entries[:max(0, len(entries) - GITHUB_TARBALL_CACHE_MAX)]:
+            os.remove(path)
+
+    async def download_tarball(self, owner: str, repo: str, sha: str) -> str:
+        """Download the repository at `sha` once; later calls reuse the cached file."""
+        path = self._tarball_path(owner, repo, sha)
+        if os.path.exists(path):
+            os.utime(path)
+            return path
+
+        os.makedirs(self.tarball_dir, exist_ok=True)
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=self.tarball_dir, suffix=".part")
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                async with self.client.stream('GET', f"/repos/{owner}/{repo}/tarball/{sha}") as response:
+                    if response.status_code in RETRYABLE_STATUS:
+                        raise RetryableStatus(response.status_code, retry_after_header(response))
+                    if response.status_code != 200:
+                        raise GitHubError(400, "Failed to download repository archive")
+                    async for chunk in response.aiter_bytes(1024 * 1024):
+                        size += len(chunk)
+                        if size > MAX_UPLOAD_BYTES:
+                            raise GitHubError(413, "Repository archive is too large")
+                        out.write(chunk)
+            shutil.move(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        self._evict_tarballs()
+        return path
+
+    async def fetch_repository(self, owner: str, repo: str) -> GitHubRepository:
+        with span("github_metadata"):
+            repo_data, commits, languages = await self.fetch_metadata(owner, repo)
+        sha = commits[0]["sha"] if commits else None
+        tarball_path = None
+        if sha:
+            with span("github_tarball"):
+                try:
+                    # A failed attempt leaves no partial file behind, so each retry starts clean
+                    tarball_path = await call_with_retries(
+                        lambda: self.download_tarball(owner, repo, sha), self.breaker, "tarball"
+                    )
+                except RetryableStatus as e:
+                    raise GitHubError(502, f"GitHub returned {e.status_code} for the repository archive")
+        return GitHubRepository(owner, repo, repo_data, commits, languages, sha, tarball_path)
@@ -0,0 +1,111 @@
+"""
+Incremental re-evaluation of resubmissions.
+
+For each (assignment_id, user_id) the content hash of every file, the
+model's short per-file notes and the last scores are kept. When the same
+student resubmits against the same criteria, only new or changed files are
+sent in full; unchanged files are represented by their notes, so a small
+fix costs a small prompt.
+"""
+import hashlib
+import os
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from cache import DATA_DIR, SQLiteCache, content_key
+from ingest import SubmissionFile
+
+
+INCREMENTAL_EVALUATION = os.getenv("INCREMENTAL_EVALUATION", "true").lower() in ("1", "true", "yes")
+SUBMISSION_HISTORY_PATH = os.getenv("SUBMISSION_HISTORY_PATH", os.path.join(DATA_DIR, "submission_history.sqlite3"))
+SUBMISSION_HISTORY_TTL = float(os.getenv("SUBMISSION_HISTORY_TTL", str(180 * 24 * 3600)))
+SUBMISSION_HISTORY_MAX_ENTRIES = int(os.getenv("SUBMISSION_HISTORY_MAX_ENTRIES", "50000"))
+MAX_NOTE_CHARS = 500
+
+
+def file_hash(content: str) -> str:
+    return hashlib.sha256(content.encode("utf-8", errors="replace")).hexdigest()
+
+
+@dataclass
+class SubmissionDiff:
+    changed: List[SubmissionFile] = field(default_factory=list)  # new, modified, or without notes
+    unchanged: Dict[str, str] = field(default_factory=dict)      # path -> note from the last evaluation
+    removed: List[str] = field(default_factory=list)
+    previous_scores: Optional[dict] = None
+
+    def report(self) -> dict:
+        return {"changed": len(self.changed), "unchanged": len(self.unchanged), "removed": len(self.removed)}
+
+
+class SubmissionHistory:
+    def __init__(self, cache: Optional[SQLiteCache] = None):
+        self.cache = cache if cache is not None else SQLiteCache(
+            SUBMISSION_HISTORY_PATH, ttl=SUBMISSION_HISTORY_TTL, max_entries=SUBMISSION_HISTORY_MAX_ENTRIES
+        )
+
+    @staticmethod
+    def _key(assignment_id, user_id) -> str:
+        return content_key("submission", str(assignment_id), str(user_id))
+
+    def diff(self, assignment_id, user_id, criteria_key: str, files: List[SubmissionFile]) -> Optional[SubmissionDiff]:
+        """
+        Compare `files` with the previous submission. None when there is no
+        previous evaluation against the same criteria and model.
+        """
+        record = self.cache.get(self._key(assignment_id, user_id))
+        if record is None or record["criteria_key"] != criteria_key:
+            return None
+
+        diff = SubmissionDiff(previous_scores=record.get("scores"))
+        for submission_file in files:
+            note = record["notes"].get(submission_file.path)
+            if note and record["hashes"].get(submission_file.path) == file_hash(submission_file.content):
+                diff.unchanged[submission_file.path] = note
+            else:
+                diff.changed.append(submission_file)
+        current = {f.path for f in files}
+        diff.removed = [path for path in record["hashes"] if path not in current]
+        return diff
+
+    def record(
+        self,
+        assignment_id,
+        user_id,
+        criteria_key: str,
+        files: List[SubmissionFile],
+        evaluation: dict,
+        notes: Dict[str, str],
+        diff: Optional[SubmissionDiff] = None,
+    ):
+        """Store this submission; notes for unchanged files carry over from the last one."""
+        paths = {f.path for f in files}
+        merged = dict(diff.unchanged) if diff else {}
+        for path, note in (notes or {}).items():
+            if path in paths and isinstance(note, str) and note.strip():
+                merged[path] = note.strip()[:MAX_NOTE_CHARS]
+        self.cache.set(self._key(assignment_id, user_id), {
+            "criteria_key": criteria_key,
+            "hashes": {f.path: file_hash(f.content) for f in files},
+            "notes": merged,
+            "scores": evaluation.get("scores"),
+        })
+
+
+def format_unchanged_for_llm(diff: SubmissionDiff) -> str:
+    """The part of a resubmission prompt that stands in for unchanged files."""
+    parts = ["--- UNCHANGED FILES (reviewed in the previous submission; notes from that review) ---"]
+    for path, note in diff.unchanged.items():
+        parts.append(f"- {path}: {note}")
+    if diff.removed:
+        parts.append("")
+        parts.append("Files removed since the previous submission: " + ", ".join(diff.removed[:50]))
+    if diff.previous_scores:
+        parts.append("")
+        parts.append(
+            "Previous submission scores: "
+            + ", ".join(f"{name} {score}" for name, score in diff.previous_scores.items())
+            + ". Score the whole project again, changing scores only where the changed files justify it."
+        )
+    parts.append("--- END UNCHANGED FILES ---\n")
+    return "\n".join(parts)
@@ -0,0 +1,370 @@
+"""
+Bounded-memory ingestion of student submission archives.
+
+Archives are read straight from the spooled upload (or any seekable file
+object), one member at a time, in fixed-size chunks. Per-file, total-byte,
+member-count and nesting-depth budgets plus a compression-ratio guard keep
+peak memory per request constant, however large the upload is. Members are
+filtered (filters.py) on their name and size before they are decompressed,
+and sniffed for binary content before they are read in full.
+"""
+import io
+import os
+import tarfile
+import tempfile
+import zipfile
+from dataclasses import dataclass, field
+from typing import BinaryIO, List, Optional, Union
+
+from filters import MAX_GITIGNORE_BYTES, SNIFF_BYTES, IgnoreMatcher, is_binary_name, looks_binary
+from telemetry import get_logger
+
+
+CHUNK_SIZE = 64 * 1024
+
+MAX_UPLOAD_BYTES = int(os.getenv("INGEST_MAX_UPLOAD_BYTES", str(500 * 1024 * 1024)))
+MAX_FILE_BYTES = int(os.getenv("INGEST_MAX_FILE_BYTES", str(1024 * 1024)))
+MAX_TOTAL_BYTES = int(os.getenv("INGEST_MAX_TOTAL_BYTES", str(32 * 1024 * 1024)))
+MAX_MEMBERS = int(os.getenv("INGEST_MAX_MEMBERS", "20000"))
+MAX_NESTING_DEPTH = int(os.getenv("INGEST_MAX_NESTING_DEPTH", "3"))
+MAX_NESTED_ARCHIVE_BYTES = int(os.getenv("INGEST_MAX_NESTED_ARCHIVE_BYTES", str(64 * 1024 * 1024)))
+MAX_COMPRESSION_RATIO = float(os.getenv("INGEST_MAX_COMPRESSION_RATIO", "100"))
+MAX_EXPANDED_BYTES = int(os.getenv("INGEST_MAX_EXPANDED_BYTES", str(2 * 1024 * 1024 * 1024)))
+
+# Highly compressible text is normal; only apply the ratio guard above this size
+RATIO_CHECK_MIN_BYTES = 1024 * 1024
+
+# Keep the "skipped files" note readable when node_modules is in the archive
+MAX_LISTED_SKIPPED = 50
+
+# Upload names ingest_archive() reads: zips by name, anything else as a (possibly compressed) tar
+ARCHIVE_EXTENSIONS = ('.zip', '.tar', '.tar.gz', '.tgz')
+
+logger = get_logger("ingest")
+
+
+class ArchiveLimitError(Exception):
+    """Raised when an archive breaks a budget that makes it unsafe to keep reading."""
+
+
+@dataclass
+class IngestLimits:
+    max_file_bytes: int = MAX_FILE_BYTES
+    max_total_bytes: int = MAX_TOTAL_BYTES
+    max_members: int = MAX_MEMBERS
+    max_nesting_depth: int = MAX_NESTING_DEPTH
+    max_nested_archive_bytes: int = MAX_NESTED_ARCHIVE_BYTES
+    max_compression_ratio: float = MAX_COMPRESSION_RATIO
+    max_expanded_bytes: int = MAX_EXPANDED_BYTES
+
+
+@dataclass
+class SubmissionFile:
+    path: str
+    content: str
+
+
+@dataclass
+class IngestResult:
+    files: List[SubmissionFile] = field(default_factory=list)
+    skipped: List[str] = field(default_factory=list)
+    bytes_read: int = 0
+    members_seen: int = 0
+    ignored: int = 0  # matched an ignore rule; not listed in `skipped`
+    budget_exhausted: bool = False
+
+    def skip(self, path: str, reason: str):
+        self.skipped.append(path)
+        logger.debug("Skipping archive member", extra={"path": path, "reason": reason})
+
+
+def _count_member(result: IngestResult, limits: IngestLimits):
+    result.members_seen += 1
+    if result.members_seen > limits.max_members:
+        raise ArchiveLimitError(f"Archive has more than {limits.max_members} entries")
+
+
+def _read_limited(fileobj: BinaryIO, limit: int, result: IngestResult, limits: IngestLimits) -> Optional[bytes]:
+    """
+    Read at most `limit` bytes in chunks, charging them to the total budget.
+    Returns None if the member is larger than `limit` or the budget runs out.
+    """
+    chunks = []
+    size = 0
+    while True:
+        chunk = fileobj.read(CHUNK_SIZE)
+        if not chunk:
+            return b"".join(chunks)
+        size += len(chunk)
+        result.bytes_read += len(chunk)
+        if result.bytes_read > limits.max_total_bytes:
+            result.budget_exhausted = True
+            return None
+        if size > limit:
+            return None
+        chunks.append(chunk)
+
+
+def _copy_limited(src: BinaryIO, dst: BinaryIO, limit: int, result: IngestResult, limits: IngestLimits) -> bool:
+    """Stream `src` into `dst` without holding more than one chunk in memory."""
+    size = 0
+    while True:
+        chunk = src.read(CHUNK_SIZE)
+        if not chunk:
+            return True
+        size += len(chunk)
+        result.bytes_read += len(chunk)
+        if result.bytes_read > limits.max_total_bytes:
+            result.budget_exhausted = True
+            return False
+        if size > limit:
+            return False
+        dst.write(chunk)
+
+
+def _read_text_member(fileobj: BinaryIO, path: str, result: IngestResult, limits: IngestLimits) -> Optional[bytes]:
+    """
+    Read a member that passed the name filters. Only the first SNIFF_BYTES
+    are read (and charged to the budget) before a binary file is recognised.
+    Returns None, after recording why, if the member is skipped.
+    """
+    head = fileobj.read(SNIFF_BYTES)
+    result.bytes_read += len(head)
+    if result.bytes_read > limits.max_total_bytes:
+        result.budget_exhausted = True
+        result.skipped.append(path)
+        return None
+    if looks_binary(head):
+        result.skip(path, "binary content")
+        return None
+    if len(head) < SNIFF_BYTES:
+        return head  # the whole file
+    rest = _read_limited(fileobj, limits.max_file_bytes - len(head), result, limits)
+    if rest is None:
+        result.skip(path, "exceeds size budget")
+        return None
+    return head + rest
+
+
+def _filtered_out(path: str, size: int, result: IngestResult, limits: IngestLimits, ignore: IgnoreMatcher) -> bool:
+    """Name and size checks, made from archive metadata before anything is decompressed."""
+    if ignore.is_ignored(path):
+        result.ignored += 1
+        return True
+    _count_member(result, limits)
+    if result.budget_exhausted:
+        result.skipped.append(path)
+        return True
+    if is_binary_name(path):
+        result.skip(path, "binary file type")
+        return True
+    if size > limits.max_file_bytes:
+        result.skip(path, f"larger than {limits.max_file_bytes} bytes")
+        return True
+    return False
+
+
+def _add_text_file(result: IngestResult, path: str, data: bytes):
+    # Raises UnicodeDecodeError for binary content; callers record it as skipped
+    result.files.append(SubmissionFile(path=path, content=data.decode('utf-8')))
+
+
+# =============================================================================
+# ZIP
+# =============================================================================
+
+
+def read_zip_archive(
+    zip_file: zipfile.ZipFile,
+    limits: Optional[IngestLimits] = None,
+    path_prefix: str = "",
+    depth: int = 0,
+    result: Optional[IngestResult] = None,
+    ignore: Optional[IgnoreMatcher] = None,
+) -> IngestResult:
+    """
+    Collect the text files of an open zip archive. Nested zips are spooled to a
+    temporary file (not memory) and read recursively up to `max_nesting_depth`.
+    """
+    limits = limits or IngestLimits()
+    result = result if result is not None else IngestResult()
+    ignore = ignore if ignore is not None else IgnoreMatcher()
+    members = zip_file.infolist()
+
+    # The central directory lists every member up front, so .gitignore files
+    # (outermost first) apply to the whole archive whatever its member order
+    if ignore.honor_gitignore:
+        gitignores = [info for info in members if IgnoreMatcher.is_gitignore(info.filename) and not info.is_dir()]
+        for item_info in sorted(gitignores, key=lambda info: info.filename.count('/')):
+            if item_info.file_size <= MAX_GITIGNORE_BYTES:
+                with zip_file.open(item_info) as f:
+                    ignore.add_gitignore(f"{path_prefix}{item_info.filename}", f.read(MAX_GITIGNORE_BYTES))
+
+    for item_info in members:
+        full_filename = f"{path_prefix}{item_info.filename}"
+
+        if item_info.is_dir():
+            continue
+        is_zip = item_info.filename.lower().endswith('.zip')
+        # Nested zips are checked against their own budget below
+        if _filtered_out(full_filename, 0 if is_zip else item_info.file_size, result, limits, ignore):
+            continue
+
+        if (
+            item_info.file_size > RATIO_CHECK_MIN_BYTES
+            and item_info.file_size > item_info.compress_size * limits.max_compression_ratio
+        ):
+            result.skip(full_filename, "suspicious compression ratio")
+            continue
+
+        try:
+            if is_zip:
+                if depth >= limits.max_nesting_depth:
+                    result.skip(full_filename, "nested archive too deep")
+                    continue
+                if item_info.file_size > limits.max_nested_archive_bytes:
+                    result.skip(full_filename, "nested archive too large")
+                    continue
+
+                logger.debug("Reading nested zip", extra={"path": full_filename})
+                with zip_file.open(item_info) as src, tempfile.TemporaryFile() as spool:
+                    if not _copy_limited(src, spool, limits.max_nested_archive_bytes, result, limits):
+                        result.skip(full_filename, "nested archive exceeds size budget")
+                        continue
+                    spool.seek(0)
+                    with zipfile.ZipFile(spool, 'r') as nested_zip_ref:
+                        read_zip_archive(nested_zip_ref, limits, f"{full_filename}/", depth + 1, result, ignore)
+                continue
+
+            with zip_file.open(item_info) as file_in_zip:
+                content_bytes = _read_text_member(file_in_zip, full_filename, result, limits)
+            if content_bytes is None:
+                continue
+
+            _add_text_file(result, full_filename, content_bytes)
+
+        except UnicodeDecodeError:
+            result.skip(full_filename, "binary or non-UTF-8 file")
+        except zipfile.BadZipFile:
+            result.skip(full_filename, "corrupted or invalid zip file")
+        except ArchiveLimitError:
+            raise
+        except Exception as e:
+            result.skip(full_filename, f"error reading from zip: {e}")
+
+    return result
+
+
+# =============================================================================
+# TAR
+# =============================================================================
+
+
+def read_tar_archive(
+    tar_source: Union[bytes, BinaryIO],
+    limits: Optional[IngestLimits] = None,
+    result: Optional[IngestResult] = None,
+    ignore: Optional[IgnoreMatcher] = None,
+) -> IngestResult:
+    """
+    Collect the text files of a tar / tar.gz archive, given as bytes or a file
+    object. The archive is opened in streaming mode, so members are visited in
+    order and never indexed up front; a .gitignore applies to the members
+    after it (git and GitHub write it before the files it covers).
+    """
+    limits = limits or IngestLimits()
+    result = result if result is not None else IngestResult()
+    ignore = ignore if ignore is not None else IgnoreMatcher()
+    fileobj = io.BytesIO(tar_source) if isinstance(tar_source, (bytes, bytearray, memoryview)) else tar_source
+    start = fileobj.tell()
+
+    with tarfile.open(fileobj=fileobj, mode='r|*') as tar:
+        for member in tar:
+            # Everything before this member's header has already been decompressed
+            # from `compressed` bytes of input; its data is declared in the header
+            if member.offset_data + member.size > limits.max_expanded_bytes:
+                raise ArchiveLimitError(f"Archive expands to more than {limits.max_expanded_bytes} bytes")
+            expanded = member.offset
+            compressed = max(1, fileobj.tell() - start)
+            if expanded > RATIO_CHECK_MIN_BYTES and expanded > compressed * limits.max_compression_ratio:
+                raise ArchiveLimitError("Archive compression ratio is too high")
+
+            if member.isdir() or member.type == tarfile.XGLTYPE:
+                continue
+            if _filtered_out(member.name, member.size, result, limits, ignore):
+                continue
+            if not member.isfile():
+                result.skip(member.name, "not a regular file")
+                continue
+
+            try:
+                file_obj = tar.extractfile(member)
+                if file_obj is None:
+                    result.skipped.append(member.name)
+                    continue
+                content_bytes = _read_text_member(file_obj, member.name, result, limits)
+                if content_bytes is None:
+                    continue
+                if IgnoreMatcher.is_gitignore(member.name):
+                    ignore.add_gitignore(member.name, content_bytes)
+                _add_text_file(result, member.name, content_bytes)
+            except UnicodeDecodeError:
+                result.skip(member.name, "binary or non-UTF-8 file")
+            except Exception as e:
+                result.skip(member.name, f"error reading from tar: {e}")
+
+    return result
+
+
+# =============================================================================
+# FORMATTING
+# =============================================================================
+
+
+def format_files_for_llm(result: IngestResult) -> str:
+    """Render collected files in the `--- FILE: ... ---` layout the prompts expect."""
+    formatted_parts = []
+    for submission_file in result.files:
+        formatted_parts.append(f"--- FILE: {submission_file.path} ---")
+        formatted_parts.append(submission_file.content)
+        formatted_parts.append("--- END FILE ---\n")
+
+    if result.skipped:
+        listed = ', '.join(result.skipped[:MAX_LISTED_SKIPPED])
+        if len(result.skipped) > MAX_LISTED_SKIPPED:
+            listed += f" and {len(result.skipped) - MAX_LISTED_SKIPPED} more"
+        formatted_parts.append(f"NOTE: The following binary or unreadable files were skipped: {listed}")
+    if result.budget_exhausted:
+        formatted_parts.append("NOTE: The submission exceeded the size budget; remaining files were not read.")
+
+    return "\n".join(formatted_parts)
+
+
+def format_zip_contents_for_llm(zip_file: zipfile.ZipFile, path_prefix: str = "") -> str:
+    """
+    Reads a zip file and formats its text-based contents into a single string
+    suitable for an LLM prompt. Handles nested zip files.
+    """
+    return format_files_for_llm(read_zip_archive(zip_file, path_prefix=path_prefix))
+
+
+def format_tar_contents_for_llm(tar_source: Union[bytes, BinaryIO]) -> str:
+    """
+    Reads a tar (or tar.gz) file, as bytes or a file object, and formats its
+    text-based contents into a single string suitable for an LLM prompt.
+    """
+    return format_files_for_llm(read_tar_archive(tar_source))
+
+
+def ingest_archive(filename: str, fileobj: BinaryIO, limits: Optional[IngestLimits] = None) -> IngestResult:
+    """Read a spooled .zip / .tar / .tar.gz / .tgz upload into an IngestResult."""
+    fileobj.seek(0, os.SEEK_END)
+    size = fileobj.tell()
+    fileobj.seek(0)
+    if size > MAX_UPLOAD_BYTES:
+        raise ArchiveLimitError(f"Upload is larger than {MAX_UPLOAD_BYTES} bytes")
+
+    if filename.lower().endswith('.zip'):
+        with zipfile.ZipFile(fileobj, 'r') as zip_ref:
+            return read_zip_archive(zip_ref, limits)
+    return read_tar_archive(fileobj, limits)
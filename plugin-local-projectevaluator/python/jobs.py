@@ -0,0 +1,306 @@
+"""
+Persistent background jobs for long-running evaluations.
+
+Submitting a job returns its id immediately; a pool of asyncio worker tasks
+runs the evaluation, and job state lives in SQLite so work that was queued
+or running when the service stopped is picked up again on the next start.
+"""
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from cache import DATA_DIR
+from telemetry import get_logger, trace
+
+
+JOB_DB_PATH = os.getenv("JOB_DB_PATH", os.path.join(DATA_DIR, "jobs.sqlite3"))
+JOB_UPLOAD_DIR = os.getenv("JOB_UPLOAD_DIR", os.path.join(DATA_DIR, "job_uploads"))
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_RETENTION = float(os.getenv("JOB_RETENTION", str(7 * 24 * 3600)))
+JOB_MAX_WAIT = float(os.getenv("JOB_MAX_WAIT", "60"))
+# A job that was running this many times when the service went down is failed instead of resumed
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+
+TERMINAL_STATUSES = ("completed", "failed", "cancelled")
+
+# handler(params, upload_path) -> response body
+JobHandler = Callable[[dict, Optional[str]], Awaitable[dict]]
+
+logger = get_logger("jobs")
+
+
+class JobStore:
+    """SQLite-backed job table. All methods are quick and safe to call from the event loop."""
+
+    def __init__(self, path: str = JOB_DB_PATH):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                status TEXT NOT NULL,
+                params TEXT NOT NULL,
+                upload_path TEXT,
+                result TEXT,
+                error TEXT,
+                status_code INTEGER,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL
+            )
+            """
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)")
+
+    def create(self, kind: str, params: dict, upload_path: Optional[str] = None, job_id: Optional[str] = None) -> str:
+        job_id = job_id or uuid.uuid4().hex
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO jobs (id, kind, status, params, upload_path, created_at) VALUES (?, ?, 'queued', ?, ?, ?)",
+                (job_id, kind, json.dumps(params), upload_path, time.time()),
+            )
+        return job_id
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with self._lock:
+            row = self._db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["params"] = json.loads(job["params"])
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def update(self, job_id: str, **fields):
+        if "result" in fields and fields["result"] is not None:
+            fields["result"] = json.dumps(fields["result"])
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock:
+            self._db.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+
+    def mark_running(self, job_id: str) -> bool:
+        """Atomically move a queued job to running. False if it was cancelled meanwhile."""
+        with self._lock:
+            cursor = self._db.execute(
+                "UPDATE jobs SET status = 'running', started_at = ?, attempts = attempts + 1 "
+                "WHERE id = ? AND status = 'queued'",
+                (time.time(), job_id),
+            )
+        return cursor.rowcount == 1
+
+    def fail_exhausted(self, max_attempts: int) -> List[dict]:
+        """
+        Fail jobs left 'running' that have already been started `max_attempts`
+        times: a job that keeps taking the service down is not resumed again.
+        Returns the failed jobs.
+        """
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id, upload_path, attempts FROM jobs WHERE status = 'running' AND attempts >= ?",
+                (max_attempts,),
+            ).fetchall()
+            self._db.execute(
+                "UPDATE jobs SET status = 'failed', error = ?, status_code = 500, finished_at = ? "
+                "WHERE status = 'running' AND attempts >= ?",
+                (f"Job was interrupted {max_attempts} times and will not be retried", time.time(), max_attempts),
+            )
+        return [dict(row) for row in rows]
+
+    def requeue_interrupted(self) -> int:
+        """Jobs left 'running' by a previous process go back to the queue."""
+        with self._lock:
+            cursor = self._db.execute("UPDATE jobs SET status = 'queued' WHERE status = 'running'")
+        return cursor.rowcount
+
+    def queued_ids(self):
+        with self._lock:
+            rows = self._db.execute("SELECT id FROM jobs WHERE status = 'queued' ORDER BY created_at").fetchall()
+        return [row["id"] for row in rows]
+
+    def purge_finished(self, older_than: float):
+        with self._lock:
+            self._db.execute(
+                "DELETE FROM jobs WHERE status IN ('completed', 'failed', 'cancelled') AND finished_at < ?",
+                (older_than,),
+            )
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+def public_job(job: dict) -> dict:
+    """The job fields returned by the API."""
+    data = {
+        "job_id": job["id"],
+        "kind": job["kind"],
+        "status": job["status"],
+        "attempts": job["attempts"],
+        "created_at": job["created_at"],
+        "started_at": job["started_at"],
+        "finished_at": job["finished_at"],
+    }
+    if job["status"] == "completed":
+        data["result"] = job["result"]
+    if job["error"]:
+        data["error"] = job["error"]
+        data["status_code"] = job["status_code"]
+    return data
+
+
+class JobQueue:
+    """
+    Worker pool over a JobStore. Handlers are registered per job kind and are
+    ordinary async evaluation functions.
+    """
+
+    def __init__(
+        self,
+        store: JobStore,
+        handlers: Dict[str, JobHandler],
+        workers: int = JOB_WORKERS,
+        max_attempts: int = JOB_MAX_ATTEMPTS,
+    ):
+        self.store = store
+        self.handlers = handlers
+        self.workers = max(1, workers)
+        self.max_attempts = max(1, max_attempts)
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker_tasks = []
+        self._stopping = False
+        self._running: Dict[str, asyncio.Task] = {}
+        # One event per job with long-pollers, dropped when its last waiter leaves
+        self._done_events: Dict[str, asyncio.Event] = {}
+        self._waiters: Dict[str, int] = {}
+
+    async def start(self):
+        self._queue = asyncio.Queue()
+        self._stopping = False
+        self.store.purge_finished(time.time() - JOB_RETENTION)
+        for job in self.store.fail_exhausted(self.max_attempts):
+            logger.warning("Not resuming job after repeated interruptions", extra={"job_id": job["id"], "attempts": job["attempts"]})
+            self._finish(job["id"], job["upload_path"])
+        resumed = self.store.requeue_interrupted()
+        if resumed:
+            logger.info("Resuming jobs interrupted by the last shutdown", extra={"jobs": resumed})
+        for job_id in self.store.queued_ids():
+            self._queue.put_nowait(job_id)
+        self._worker_tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        # Running jobs stay 'running' in the store and are requeued on the next start
+        self._stopping = True
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        self._worker_tasks = []
+
+    def submit(self, kind: str, params: dict, upload_path: Optional[str] = None, job_id: Optional[str] = None) -> dict:
+        if kind not in self.handlers:
+            raise ValueError(f"Unknown job kind: {kind}")
+        job_id = self.store.create(kind, params, upload_path, job_id)
+        self._queue.put_nowait(job_id)
+        return self.store.get(job_id)
+
+    def get(self, job_id: str) -> Optional[dict]:
+        return self.store.get(job_id)
+
+    async def wait(self, job_id: str, timeout: float) -> Optional[dict]:
+        """Long-poll: return once the job reaches a terminal state or `timeout` elapses."""
+        job = self.store.get(job_id)
+        if job is None or job["status"] in TERMINAL_STATUSES or timeout <= 0:
+            return job
+        event = self._done_events.setdefault(job_id, asyncio.Event())
+        self._waiters[job_id] = self._waiters.get(job_id, 0) + 1
+        try:
+            await asyncio.wait_for(event.wait(), timeout=min(timeout, JOB_MAX_WAIT))
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            self._waiters[job_id] -= 1
+            if not self._waiters[job_id]:
+                del self._waiters[job_id]
+                if self._done_events.get(job_id) is event:
+                    del self._done_events[job_id]
+        return self.store.get(job_id)
+
+    def cancel(self, job_id: str) -> Optional[dict]:
+        job = self.store.get(job_id)
+        if job is None or job["status"] in TERMINAL_STATUSES:
+            return job
+        self.store.update(job_id, status="cancelled", finished_at=time.time())
+        task = self._running.get(job_id)
+        if task is not None:
+            task.cancel()
+        else:
+            self._finish(job_id, job.get("upload_path"))
+        return self.store.get(job_id)
+
+    def _finish(self, job_id: str, upload_path: Optional[str]):
+        if upload_path and os.path.exists(upload_path):
+            os.remove(upload_path)
+        event = self._done_events.pop(job_id, None)
+        if event is not None:
+            event.set()
+
+    async def _worker(self):
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await self._run(job_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Job worker error", extra={"job_id": job_id})
+
+    async def _run(self, job_id: str):
+        # Logs and spans of the job carry its id in place of a request id
+        with trace(job_id) as current:
+            await self._run_traced(job_id)
+            logger.info("Job finished", extra={"duration_ms": round(current.elapsed() * 1000, 1), "stages": current.stage_totals()})
+
+    async def _run_traced(self, job_id: str):
+        if not self.store.mark_running(job_id):
+            return  # cancelled while queued
+        job = self.store.get(job_id)
+        logger.info("Running job", extra={"kind": job["kind"], "attempt": job["attempts"]})
+
+        task = asyncio.create_task(self.handlers[job["kind"]](job["params"], job["upload_path"]))
+        self._running[job_id] = task
+        try:
+            result = await task
+            self.store.update(job_id, status="completed", result=result, finished_at=time.time())
+        except asyncio.CancelledError:
+            if self.store.get(job_id)["status"] != "cancelled":
+                raise  # service shutdown: leave the job 'running' so it is resumed
+            logger.info("Job cancelled")
+            if self._stopping:
+                # Shutdown raced the cancellation; the worker has to stop as well
+                self._finish(job_id, job["upload_path"])
+                raise
+        except Exception as e:
+            self.store.update(
+                job_id,
+                status="failed",
+                error=str(getattr(e, "detail", e)),
+                status_code=getattr(e, "status_code", 500),
+                finished_at=time.time(),
+            )
+            logger.warning("Job failed", extra={"error": str(getattr(e, "detail", e))[:300]})
+        finally:
+            self._running.pop(job_id, None)
+
+        self._finish(job_id, job["upload_path"])
@@ -0,0 +1,246 @@
+"""
+Completion backends.
+
+Everything in app.py talks to a `CompletionBackend`. The production backend
+is `CortexClient` (Snowflake Cortex over pooled connections); `FakeBackend`
+is a local stand-in with configurable latency, templated responses and
+error injection, for load tests and benchmarks without a Snowflake account.
+Pick one with LLM_BACKEND=snowflake|fake.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import random
+from collections import OrderedDict
+from typing import AsyncIterator, Callable, Optional
+
+from prompts import prompt_prefix
+from telemetry import get_logger
+
+
+LLM_BACKEND = os.getenv("LLM_BACKEND", "snowflake").lower()
+FALLBACK_CHUNK_CHARS = 200
+
+# Latency of one completion: "fixed:0.5", "uniform:1,3", "normal:2,0.5" or "lognormal:2,0.5"
+# (lognormal takes the median and sigma); plus FAKE_LLM_SECONDS_PER_1K_CHARS of prompt
+FAKE_LLM_LATENCY = os.getenv("FAKE_LLM_LATENCY", "lognormal:2,0.5")
+FAKE_LLM_SECONDS_PER_1K_CHARS = float(os.getenv("FAKE_LLM_SECONDS_PER_1K_CHARS", "0"))
+FAKE_LLM_STREAM_CHUNK_DELAY = float(os.getenv("FAKE_LLM_STREAM_CHUNK_DELAY", "0.05"))
+FAKE_LLM_MAX_CONCURRENCY = int(os.getenv("FAKE_LLM_MAX_CONCURRENCY", "8"))  # like SNOWFLAKE_POOL_MAX_SIZE
+FAKE_LLM_ERROR_RATE = float(os.getenv("FAKE_LLM_ERROR_RATE", "0"))
+FAKE_LLM_EMPTY_RATE = float(os.getenv("FAKE_LLM_EMPTY_RATE", "0"))
+FAKE_LLM_MALFORMED_RATE = float(os.getenv("FAKE_LLM_MALFORMED_RATE", "0"))
+FAKE_LLM_RESPONSE_FILE = os.getenv("FAKE_LLM_RESPONSE_FILE")
+FAKE_LLM_SEED = os.getenv("FAKE_LLM_SEED")
+# Simulate provider prompt caching: a shared prefix seen before is not charged per character
+FAKE_LLM_PREFIX_CACHE = os.getenv("FAKE_LLM_PREFIX_CACHE", "true").lower() in ("1", "true", "yes")
+FAKE_LLM_PREFIX_CACHE_ENTRIES = 1024
+
+# Markers the fake uses to tell the prompt kinds apart
+MAP_PROMPT_MARKER = "You are one of several reviewers"
+REPAIR_PROMPT_MARKER = "EVALUATION TO REFORMAT"
+EVALUATION_PROMPT_MARKER = "Project Insight"
+
+logger = get_logger("llm")
+
+
+class CompletionBackend:
+    """Interface shared by all backends."""
+
+    name = "base"
+
+    async def complete(self, prompt: str, model: Optional[str] = None) -> Optional[str]:
+        raise NotImplementedError
+
+    async def stream(self, prompt: str, model: Optional[str] = None) -> AsyncIterator[str]:
+        """Default streaming: the full completion, replayed in slices."""
+        response_text = await self.complete(prompt, model)
+        if not response_text:
+            return
+        for start in range(0, len(response_text), FALLBACK_CHUNK_CHARS):
+            yield response_text[start:start + FALLBACK_CHUNK_CHARS]
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    def stats(self) -> dict:
+        return {}
+
+
+class FakeBackendError(Exception):
+    """Injected failure, standing in for a transient Snowflake/Cortex error."""
+
+    retryable = True
+
+
+def parse_latency(spec: str) -> Callable[[random.Random], float]:
+    kind, _, args = spec.partition(":")
+    values = [float(v) for v in args.split(",") if v.strip()]
+    if kind == "fixed":
+        return lambda rng: values[0]
+    if kind == "uniform":
+        return lambda rng: rng.uniform(values[0], values[1])
+    if kind == "normal":
+        return lambda rng: max(0.0, rng.gauss(values[0], values[1]))
+    if kind == "lognormal":
+        median, sigma = values
+        return lambda rng: median * rng.lognormvariate(0, sigma)
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+
+class FakeBackend(CompletionBackend):
+    """
+    Deterministic local stand-in for Cortex. Responses depend only on the
+    prompt (scores are derived from its hash), so caching and parsing behave
+    as in production; latency, concurrency limit and injected failures are
+    configured with the FAKE_LLM_* settings.
+    """
+
+    name = "fake"
+
+    def __init__(
+        self,
+        latency: str = FAKE_LLM_LATENCY,
+        seconds_per_1k_chars: float = FAKE_LLM_SECONDS_PER_1K_CHARS,
+        max_concurrency: int = FAKE_LLM_MAX_CONCURRENCY,
+        error_rate: float = FAKE_LLM_ERROR_RATE,
+        empty_rate: float = FAKE_LLM_EMPTY_RATE,
+        malformed_rate: float = FAKE_LLM_MALFORMED_RATE,
+        response_file: Optional[str] = FAKE_LLM_RESPONSE_FILE,
+        seed: Optional[str] = FAKE_LLM_SEED,
+        prefix_cache: bool = FAKE_LLM_PREFIX_CACHE,
+    ):
+        self.sample_latency = parse_latency(latency)
+        self.seconds_per_1k_chars = seconds_per_1k_chars
+        self.max_concurrency = max(1, max_concurrency)
+        self.error_rate = error_rate
+        self.empty_rate = empty_rate
+        self.malformed_rate = malformed_rate
+        self.template = None
+        if response_file:
+            with open(response_file, encoding="utf-8") as f:
+                self.template = f.read()
+        self.rng = random.Random(seed)
+        self.prefix_cache = prefix_cache
+        self._prefixes: "OrderedDict[str, None]" = OrderedDict()
+        self.prefix_cache_hits = 0
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self.calls = 0
+        self.in_flight = 0
+
+    @staticmethod
+    def _scores(prompt: str) -> dict:
+        digest = hashlib.sha256(prompt.encode("utf-8")).digest()
+        scores = {
+            "code_quality": 20 + digest[0] % 16,
+            "functionality_correctness": 25 + digest[1] % 21,
+            "documentation": 10 + digest[2] % 11,
+        }
+        return {"overall_score": sum(scores.values()), **scores}
+
+    def render(self, prompt: str) -> str:
+        """The response for `prompt`: a template if configured, else one per prompt kind."""
+        scores = self._scores(prompt)
+        if self.template is not None:
+            return self.template.format(prompt_chars=len(prompt), **scores)
+
+        if MAP_PROMPT_MARKER in prompt:
+            return json.dumps({
+                "summary": "Implements part of the requested functionality.",
+                "requirements_met": ["Core logic is present"],
+                "requirements_missing_or_broken": [],
+                "code_quality": ["Consistent naming"],
+                "documentation": ["Few comments"],
+                "file_notes": {},
+            })
+        if REPAIR_PROMPT_MARKER in prompt or EVALUATION_PROMPT_MARKER in prompt:
+            evaluation = {
+                "overall_score": scores["overall_score"],
+                "scores": {name: scores[name] for name in ("code_quality", "functionality_correctness", "documentation")},
+                "report": {
+                    "strengths": ["Submission follows the requested structure"],
+                    "areas_of_improvement": ["Add tests for edge cases"],
+                    "summary": f"Fake evaluation of a {len(prompt)}-character prompt.",
+                },
+            }
+            return "```json\n" + json.dumps(evaluation, indent=2) + "\n```"
+        return (
+            "**Project Title:** Fake Generated Project\n\n"
+            "**1. Project Objective:** Exercise the service without calling Cortex.\n\n"
+            "**2. Expected Features & Functionalities:**\n- Feature one\n- Feature two\n\n"
+            "**3. Constraints & Technical Requirements:**\n- Python 3.9+\n\n"
+            "**4. Success Criteria:**\n- All features are functional\n\n"
+            "**5. Estimated Timeline:**\n- Week 1: Build\n- Week 2: Polish\n"
+        )
+
+    def _uncached_chars(self, prompt: str) -> int:
+        """Characters the provider would have to process, after any cached prefix."""
+        prefix = prompt_prefix(prompt)
+        if not self.prefix_cache or not prefix:
+            return len(prompt)
+        key = hashlib.sha256(prefix.encode("utf-8")).hexdigest()
+        if key in self._prefixes:
+            self._prefixes.move_to_end(key)
+            self.prefix_cache_hits += 1
+            return len(prompt) - len(prefix)
+        self._prefixes[key] = None
+        if len(self._prefixes) > FAKE_LLM_PREFIX_CACHE_ENTRIES:
+            self._prefixes.popitem(last=False)
+        return len(prompt)
+
+    async def _respond(self, prompt: str) -> Optional[str]:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        async with self._semaphore:
+            self.calls += 1
+            self.in_flight += 1
+            try:
+                delay = self.sample_latency(self.rng) + self.seconds_per_1k_chars * self._uncached_chars(prompt) / 1000
+                await asyncio.sleep(delay)
+                roll = self.rng.random()
+                if roll < self.error_rate:
+                    raise FakeBackendError("Injected Cortex failure")
+                roll -= self.error_rate
+                if roll < self.empty_rate:
+                    return None
+                roll -= self.empty_rate
+                if roll < self.malformed_rate:
+                    return "Here is the evaluation: {\"overall_score\": 80, \"scores\": "
+                return self.render(prompt)
+            finally:
+                self.in_flight -= 1
+
+    async def complete(self, prompt: str, model: Optional[str] = None) -> Optional[str]:
+        return await self._respond(prompt)
+
+    async def stream(self, prompt: str, model: Optional[str] = None) -> AsyncIterator[str]:
+        response_text = await self._respond(prompt)
+        if not response_text:
+            return
+        for start in range(0, len(response_text), 20):
+            await asyncio.sleep(FAKE_LLM_STREAM_CHUNK_DELAY)
+            yield response_text[start:start + 20]
+
+    def stats(self) -> dict:
+        return {
+            "calls": self.calls,
+            "in_flight": self.in_flight,
+            "max_concurrency": self.max_concurrency,
+            "prefix_cache_hits": self.prefix_cache_hits,
+        }
+
+
+def create_backend(name: str = LLM_BACKEND, connect: Optional[Callable] = None) -> CompletionBackend:
+    """Build the configured backend; `connect` opens a Snowflake connection."""
+    if name == "fake":
+        logger.warning("Using the fake LLM backend; responses are synthetic")
+        return FakeBackend()
+    if name == "snowflake":
+        # Imported here: cortex.py builds on CompletionBackend
+        from cortex import CortexClient, SnowflakeConnectionPool
+        return CortexClient(SnowflakeConnectionPool(connect))
+    raise ValueError(f"Unknown LLM_BACKEND: {name}")
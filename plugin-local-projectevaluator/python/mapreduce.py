@@ -0,0 +1,193 @@
+"""
+Map-reduce evaluation for submissions larger than one prompt.
+
+The submission is split into chunks of whole files (files from the same
+directory stay together), each chunk is reviewed by its own Cortex call with
+a bounded number running at once, and the per-chunk findings are handed to
+a single reduce call that produces the usual evaluation JSON. Wall-clock
+time grows with chunks / MAPREDUCE_CONCURRENCY rather than with chunks.
+"""
+import asyncio
+import json
+import os
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from evaluation import iter_json_objects
+from ingest import SubmissionFile
+from packing import (
+    CODE_TOKEN_BUDGET,
+    PackedFile,
+    PackedSubmission,
+    estimate_tokens,
+    format_packed_for_llm,
+    is_vendored_or_generated,
+    pack_files,
+    summarize_file,
+)
+from prompts import ASSIGNMENT_SECTION_CACHE_SIZE, LayeredPrompt
+
+
+MAPREDUCE_ENABLED = os.getenv("MAPREDUCE_ENABLED", "true").lower() in ("1", "true", "yes")
+MAPREDUCE_CHUNK_TOKENS = int(os.getenv("MAPREDUCE_CHUNK_TOKENS", str(CODE_TOKEN_BUDGET)))
+MAPREDUCE_TOKEN_BUDGET = int(os.getenv("MAPREDUCE_TOKEN_BUDGET", "200000"))
+MAPREDUCE_CONCURRENCY = int(os.getenv("MAPREDUCE_CONCURRENCY", "4"))
+MAPREDUCE_FINDINGS_MAX_CHARS = int(os.getenv("MAPREDUCE_FINDINGS_MAX_CHARS", "6000"))
+
+
+class MapReduceError(Exception):
+    pass
+
+
+@dataclass
+class ChunkedSubmission:
+    packed: PackedSubmission  # every file selected for review, across all chunks
+    chunks: List[List[PackedFile]] = field(default_factory=list)
+
+    def report(self) -> dict:
+        return {
+            "chunks": len(self.chunks),
+            "files": len(self.packed.files),
+            "summarized": [f.path for f in self.packed.files if f.status == "summarized"],
+            "dropped": self.packed.dropped,
+        }
+
+
+def needs_map_reduce(
+    files: List[SubmissionFile], token_budget: int = CODE_TOKEN_BUDGET, boilerplate: Optional[Dict[str, str]] = None
+) -> bool:
+    """True when the reviewable files do not fit in one evaluation prompt."""
+    if not MAPREDUCE_ENABLED:
+        return False
+    boilerplate = boilerplate or {}
+    total = 0
+    for submission_file in files:
+        if not is_vendored_or_generated(submission_file.path) and submission_file.path not in boilerplate:
+            total += estimate_tokens(submission_file.content) + estimate_tokens(submission_file.path) + 8
+            if total > token_budget:
+                return True
+    return False
+
+
+def split_into_chunks(
+    files: List[SubmissionFile],
+    criteria: str = "",
+    chunk_tokens: int = MAPREDUCE_CHUNK_TOKENS,
+    token_budget: int = MAPREDUCE_TOKEN_BUDGET,
+    skipped: Optional[List[str]] = None,
+    boilerplate: Optional[Dict[str, str]] = None,
+) -> ChunkedSubmission:
+    """
+    Select files with the usual relevance packing over the whole map budget,
+    then fill chunks in directory order so related files are reviewed together.
+    """
+    packed = pack_files(files, criteria, token_budget, skipped, boilerplate)
+    for packed_file in packed.files:
+        # A single file larger than a chunk is reviewed from its summary
+        if packed_file.tokens > chunk_tokens:
+            packed_file.content = summarize_file(packed_file.content, chunk_tokens - 100)
+            packed_file.status = "summarized"
+            packed_file.tokens = estimate_tokens(packed_file.content) + estimate_tokens(packed_file.path) + 8
+
+    chunked = ChunkedSubmission(packed)
+    current, used = [], 0
+    for packed_file in sorted(packed.files, key=lambda f: (os.path.dirname(f.path), f.path)):
+        if current and used + packed_file.tokens > chunk_tokens:
+            chunked.chunks.append(current)
+            current, used = [], 0
+        current.append(packed_file)
+        used += packed_file.tokens
+    if current:
+        chunked.chunks.append(current)
+    return chunked
+
+
+MAP_SYSTEM_SECTION = """
+**Role:** You are one of several reviewers of a student's project submission. Each reviewer reads one part of it; a final reviewer combines everyone's findings into the grade.
+
+**Task:** Review only the code in your part against the **Problem Statement & Criteria**. Report concrete, file-specific findings; do not assign scores.
+
+**OUTPUT (return only this JSON object):**
+```
+{
+  "summary": "<what this part of the project implements>",
+  "requirements_met": ["<requirement, with the file that implements it>"],
+  "requirements_missing_or_broken": ["<requirement or defect, with file name and reason>"],
+  "code_quality": ["<observation on style, structure, error handling, with file name>"],
+  "documentation": ["<observation on README, comments or docstrings>"],
+  "file_notes": {"<path>": "<one or two sentences on what the file does and any problems>"}
+}
+```
+""".strip()
+
+
+@lru_cache(maxsize=ASSIGNMENT_SECTION_CACHE_SIZE)
+def map_assignment_section(criteria: str) -> str:
+    return f"""
+**PROBLEM STATEMENT & CRITERIA**
+============================
+{criteria}
+============================
+""".strip()
+
+
+def build_map_prompt(criteria: str, chunk_code: str, index: int, total: int) -> LayeredPrompt:
+    """Instructions and criteria first, so every part of every submission shares that prefix."""
+    return LayeredPrompt([MAP_SYSTEM_SECTION, map_assignment_section(criteria)], f"""**CODE (PART {index} OF {total})**
+============================
+{chunk_code}
+============================
+""")
+
+
+def parse_findings(response_text: str, paths: List[str]) -> tuple:
+    """(findings text for the reduce prompt, file notes). Non-JSON output is kept as text."""
+    for candidate in iter_json_objects(response_text):
+        try:
+            data = json.loads(candidate)
+        except json.JSONDecodeError:
+            continue
+        if isinstance(data, dict):
+            notes = data.pop("file_notes", None)
+            notes = {path: note for path, note in notes.items() if path in paths} if isinstance(notes, dict) else {}
+            return json.dumps(data, indent=2)[:MAPREDUCE_FINDINGS_MAX_CHARS], notes
+    return response_text.strip()[:MAPREDUCE_FINDINGS_MAX_CHARS], {}
+
+
+async def map_chunks(
+    criteria: str,
+    chunked: ChunkedSubmission,
+    complete: Callable[[str], Awaitable[Optional[str]]],
+    concurrency: int = MAPREDUCE_CONCURRENCY,
+) -> tuple:
+    """
+    Review every chunk, at most `concurrency` at a time. Returns the findings
+    section for the reduce prompt and the per-file notes from all reviewers.
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    total = len(chunked.chunks)
+
+    async def review(index: int, chunk: List[PackedFile]) -> Optional[str]:
+        chunk_code = format_packed_for_llm(PackedSubmission(files=chunk))
+        async with semaphore:
+            return await complete(build_map_prompt(criteria, chunk_code, index, total))
+
+    responses = await asyncio.gather(*(review(i, chunk) for i, chunk in enumerate(chunked.chunks, 1)))
+
+    sections, notes = [], {}
+    for index, (chunk, response_text) in enumerate(zip(chunked.chunks, responses), 1):
+        if not response_text:
+            raise MapReduceError(f"No response from Snowflake Cortex for part {index} of {total}")
+        paths = [f.path for f in chunk]
+        findings, chunk_notes = parse_findings(response_text, paths)
+        notes.update(chunk_notes)
+        sections.append(f"--- FINDINGS FOR PART {index} OF {total} (files: {', '.join(paths)}) ---")
+        sections.append(findings)
+        sections.append("--- END FINDINGS ---\n")
+
+    if chunked.packed.dropped:
+        sections.append("NOTE: The following files were not reviewed (lowest relevance first): " + ', '.join(chunked.packed.dropped[:50]))
+    if chunked.packed.skipped:
+        sections.append("NOTE: The following binary or unreadable files were skipped: " + ', '.join(chunked.packed.skipped[:50]))
+    return "\n".join(sections), notes
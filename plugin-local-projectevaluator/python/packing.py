@@ -0,0 +1,256 @@
+"""
+Relevance-ranked context packing.
+
+Sits between archive extraction and prompt building: every file is
+token-counted and scored for relevance, then files are greedily packed into
+a token budget. Files that do not fit are either summarized (head of the
+file plus an outline of its definitions) or dropped, and the caller gets a
+report of which was which.
+"""
+import math
+import os
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from ingest import IngestResult, SubmissionFile
+
+
+CODE_TOKEN_BUDGET = int(os.getenv("PROMPT_CODE_TOKEN_BUDGET", "12000"))
+SUMMARY_TOKEN_LIMIT = int(os.getenv("PROMPT_SUMMARY_TOKEN_LIMIT", "300"))
+
+# Rough average for source code; good enough for budgeting without a tokenizer
+CHARS_PER_TOKEN = 3.5
+
+ENTRY_POINT_NAMES = {
+    'main.py', 'app.py', '__main__.py', 'manage.py', 'server.py', 'run.py', 'wsgi.py', 'asgi.py',
+    'index.js', 'main.js', 'app.js', 'server.js', 'index.ts', 'main.ts', 'app.ts',
+    'main.java', 'application.java', 'main.go', 'main.rs', 'lib.rs', 'main.c', 'main.cpp',
+    'program.cs', 'index.php', 'index.html', 'main.rb',
+}
+
+SOURCE_EXTENSIONS = {
+    'py', 'js', 'jsx', 'ts', 'tsx', 'java', 'kt', 'c', 'h', 'cpp', 'hpp', 'cc', 'cs', 'go', 'rs',
+    'rb', 'php', 'swift', 'scala', 'r', 'm', 'sql', 'html', 'css', 'scss', 'vue', 'svelte', 'ipynb',
+}
+
+DOC_EXTENSIONS = {'md', 'rst', 'txt'}
+
+CONFIG_NAMES = {
+    'requirements.txt', 'pyproject.toml', 'setup.py', 'setup.cfg', 'package.json', 'pom.xml',
+    'build.gradle', 'cargo.toml', 'go.mod', 'dockerfile', 'makefile', 'docker-compose.yml',
+}
+
+# Kept in line with filters.DEFAULT_IGNORE_PATTERNS: generic names like build/ or vendor/ may be student code
+VENDORED_DIRS = {
+    'node_modules', 'third_party', 'dist', 'target', 'obj',
+    '.git', '.idea', '.vscode', 'venv', '.venv', 'site-packages', 'migrations', 'coverage',
+}
+
+GENERATED_SUFFIXES = ('.min.js', '.min.css', '.map', '.lock', '-lock.json', '.pb.go', '_pb2.py', '.generated.cs')
+
+STOP_WORDS = {
+    'the', 'and', 'for', 'with', 'that', 'this', 'must', 'should', 'will', 'from', 'your', 'have',
+    'using', 'use', 'project', 'student', 'students', 'code', 'file', 'files', 'each', 'into', 'their',
+    'they', 'are', 'can', 'all', 'any', 'not', 'but', 'also', 'more', 'than', 'such', 'which', 'when',
+}
+
+OUTLINE_PATTERN = re.compile(
+    r'^\s*(?:export\s+)?(?:public\s+|private\s+|protected\s+|static\s+|async\s+)*'
+    r'(?:def|class|function|interface|struct|enum|fn|func|impl|module)\b.*$',
+    re.MULTILINE,
+)
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN) if text else 0
+
+
+def criteria_keywords(criteria: str) -> List[str]:
+    """Distinctive lower-case words from the assignment criteria."""
+    words = re.findall(r'[a-zA-Z][a-zA-Z0-9_]{3,}', criteria.lower())
+    seen = []
+    for word in words:
+        if word not in STOP_WORDS and word not in seen:
+            seen.append(word)
+    return seen[:40]
+
+
+def is_vendored_or_generated(path: str) -> bool:
+    lowered = path.lower()
+    parts = lowered.split('/')
+    return any(part in VENDORED_DIRS for part in parts[:-1]) or lowered.endswith(GENERATED_SUFFIXES)
+
+
+def relevance_score(submission_file: SubmissionFile, keywords: List[str]) -> float:
+    path = submission_file.path.lower()
+    name = path.rsplit('/', 1)[-1]
+    extension = name.rsplit('.', 1)[-1] if '.' in name else ''
+    depth = path.count('/')
+
+    if is_vendored_or_generated(path):
+        return -100.0
+
+    score = 0.0
+    if name.startswith('readme'):
+        score += 50
+    if name in ENTRY_POINT_NAMES:
+        score += 40
+    if extension in SOURCE_EXTENSIONS:
+        score += 20
+    elif extension in DOC_EXTENSIONS:
+        score += 5
+    if name in CONFIG_NAMES:
+        score += 10
+    if 'test' in name or '/tests/' in f"/{path}":
+        score += 5
+
+    if keywords:
+        content = submission_file.content.lower()
+        path_hits = sum(1 for keyword in keywords if keyword in path)
+        content_hits = sum(1 for keyword in keywords if keyword in content)
+        score += 10 * path_hits + 15 * min(1.0, content_hits / max(3, len(keywords) / 4))
+
+    # Prefer shallow files, and do not let one huge file outrank several focused ones
+    score -= 2 * depth
+    score -= min(10.0, estimate_tokens(submission_file.content) / 2000)
+    return score
+
+
+def summarize_file(content: str, token_limit: int = SUMMARY_TOKEN_LIMIT) -> str:
+    """Head of the file plus an outline of its class/function definitions."""
+    char_limit = int(token_limit * CHARS_PER_TOKEN)
+    outline = [line.strip() for line in OUTLINE_PATTERN.findall(content)]
+    outline_text = "\n".join(outline)
+    if len(outline_text) > char_limit // 2:
+        outline_text = outline_text[:char_limit // 2].rsplit('\n', 1)[0]
+
+    head_limit = max(0, char_limit - len(outline_text))
+    head = content[:head_limit].rsplit('\n', 1)[0] if len(content) > head_limit else content
+
+    parts = [head, "... [file summarized: remainder omitted] ..."]
+    if outline_text:
+        parts += ["Definitions in this file:", outline_text]
+    return "\n".join(parts)
+
+
+@dataclass
+class PackedFile:
+    path: str
+    content: str
+    status: str  # "included" or "summarized"
+    tokens: int
+
+
+@dataclass
+class PackedSubmission:
+    files: List[PackedFile] = field(default_factory=list)
+    dropped: List[str] = field(default_factory=list)
+    boilerplate: List[str] = field(default_factory=list)  # generated, scaffolding or empty (see analysis.py)
+    skipped: List[str] = field(default_factory=list)
+    token_budget: int = 0
+    tokens_used: int = 0
+    truncated: bool = False  # ingestion stopped early on its byte budget
+
+    def report(self) -> Dict:
+        return {
+            "included": [f.path for f in self.files if f.status == "included"],
+            "summarized": [f.path for f in self.files if f.status == "summarized"],
+            "dropped": self.dropped,
+            "boilerplate": self.boilerplate,
+            "token_budget": self.token_budget,
+            "tokens_used": self.tokens_used,
+        }
+
+
+def pack_files(
+    files: List[SubmissionFile],
+    criteria: str = "",
+    token_budget: int = CODE_TOKEN_BUDGET,
+    skipped: Optional[List[str]] = None,
+    boilerplate: Optional[Dict[str, str]] = None,
+) -> PackedSubmission:
+    """
+    Greedily fill `token_budget` with the most relevant files. A file that
+    does not fit in full is summarized if its summary fits, otherwise dropped.
+    Vendored and generated files are always dropped, and so are the paths in
+    `boilerplate` (from static analysis). The packed files keep their
+    original archive order.
+    """
+    boilerplate = boilerplate or {}
+    keywords = criteria_keywords(criteria)
+    order = {f.path: i for i, f in enumerate(files)}
+    ranked = sorted(files, key=lambda f: relevance_score(f, keywords), reverse=True)
+
+    packed = PackedSubmission(token_budget=token_budget, skipped=list(skipped or []))
+    remaining = token_budget
+    for submission_file in ranked:
+        # Third-party and generated code says nothing about the student's work
+        if is_vendored_or_generated(submission_file.path):
+            packed.dropped.append(submission_file.path)
+            continue
+        if submission_file.path in boilerplate:
+            packed.boilerplate.append(submission_file.path)
+            continue
+
+        # Per-file framing ("--- FILE: ... ---") costs a few tokens too
+        tokens = estimate_tokens(submission_file.content) + estimate_tokens(submission_file.path) + 8
+        if tokens <= remaining:
+            packed.files.append(PackedFile(submission_file.path, submission_file.content, "included", tokens))
+            remaining -= tokens
+            continue
+
+        summary = summarize_file(submission_file.content, min(SUMMARY_TOKEN_LIMIT, remaining))
+        summary_tokens = estimate_tokens(summary) + estimate_tokens(submission_file.path) + 8
+        if summary.strip() and summary_tokens <= remaining and remaining > 50:
+            packed.files.append(PackedFile(submission_file.path, summary, "summarized", summary_tokens))
+            remaining -= summary_tokens
+        else:
+            packed.dropped.append(submission_file.path)
+
+    packed.files.sort(key=lambda f: order[f.path])
+    packed.tokens_used = token_budget - remaining
+    return packed
+
+
+def pack_ingest_result(
+    result: IngestResult,
+    criteria: str = "",
+    token_budget: int = CODE_TOKEN_BUDGET,
+    boilerplate: Optional[Dict[str, str]] = None,
+) -> PackedSubmission:
+    packed = pack_files(result.files, criteria, token_budget, skipped=result.skipped, boilerplate=boilerplate)
+    packed.truncated = result.budget_exhausted
+    return packed
+
+
+def format_packed_for_llm(packed: PackedSubmission) -> str:
+    """Render a packed submission in the `--- FILE: ... ---` layout the prompts expect."""
+    formatted_parts = []
+    for packed_file in packed.files:
+        label = " (SUMMARIZED)" if packed_file.status == "summarized" else ""
+        formatted_parts.append(f"--- FILE: {packed_file.path}{label} ---")
+        formatted_parts.append(packed_file.content)
+        formatted_parts.append("--- END FILE ---\n")
+
+    if packed.dropped:
+        formatted_parts.append(
+            "NOTE: The following files were omitted to fit the review budget (lowest relevance first): "
+            + ', '.join(packed.dropped[:50])
+            + (f" and {len(packed.dropped) - 50} more" if len(packed.dropped) > 50 else "")
+        )
+    if packed.boilerplate:
+        formatted_parts.append(
+            "NOTE: The following generated, scaffolding or empty files were omitted: "
+            + ', '.join(packed.boilerplate[:50])
+            + (f" and {len(packed.boilerplate) - 50} more" if len(packed.boilerplate) > 50 else "")
+        )
+    if packed.skipped:
+        formatted_parts.append(
+            "NOTE: The following binary or unreadable files were skipped: "
+            + ', '.join(packed.skipped[:50])
+            + (f" and {len(packed.skipped) - 50} more" if len(packed.skipped) > 50 else "")
+        )
+    if packed.truncated:
+        formatted_parts.append("NOTE: The submission exceeded the size budget; remaining files were not read.")
+    return "\n".join(formatted_parts)
@@ -0,0 +1,46 @@
+"""
+Layered prompts.
+
+Evaluation and map prompts are assembled from three sections, most stable
+first: static instructions (built once per process), an assignment section
+(built once per criteria and memoized), and the per-submission section. The
+first two form a prefix that is byte-identical for every submission to the
+same assignment, so a batch pays for building it once, and a provider that
+caches prompt prefixes can reuse it across calls.
+
+A `LayeredPrompt` is an ordinary `str` that also records where its shared
+prefix ends. Backends that support prompt caching use that to send the
+prefix as its own message; everything else treats the prompt as plain text.
+"""
+from typing import Sequence
+
+
+SECTION_SEPARATOR = "\n\n"
+
+# Distinct criteria per process worth keeping assembled sections for
+ASSIGNMENT_SECTION_CACHE_SIZE = 256
+
+
+class LayeredPrompt(str):
+    """A prompt whose first `prefix_chars` characters are shared with other prompts."""
+
+    prefix_chars: int
+
+    def __new__(cls, shared_sections: Sequence[str], submission_section: str):
+        prefix = "".join(section + SECTION_SEPARATOR for section in shared_sections if section)
+        prompt = super().__new__(cls, prefix + submission_section)
+        prompt.prefix_chars = len(prefix)
+        return prompt
+
+    @property
+    def prefix(self) -> str:
+        return str.__getitem__(self, slice(0, self.prefix_chars))
+
+    @property
+    def suffix(self) -> str:
+        return str.__getitem__(self, slice(self.prefix_chars, None))
+
+
+def prompt_prefix(prompt: str) -> str:
+    """The cacheable prefix of `prompt` ("" for a plain string)."""
+    return prompt.prefix if isinstance(prompt, LayeredPrompt) else ""
@@ -0,0 +1,332 @@
+"""
+Retries and circuit breakers for calls to Snowflake and GitHub.
+
+`call_with_retries` runs one upstream call, retrying errors that
+`is_retryable` classifies as transient (connection resets, timeouts,
+throttling, 5xx) with full-jitter exponential backoff. Retries stop after
+RETRY_ATTEMPTS, or earlier when the next wait would overrun the request's
+retry budget (RETRY_REQUEST_BUDGET, set per request with `retry_budget()`).
+
+Each upstream has a `CircuitBreaker`. After CIRCUIT_FAILURE_THRESHOLD
+transient failures in a row it opens, and calls fail at once with
+`CircuitOpenError` instead of waiting on a dead upstream. Once
+CIRCUIT_RESET_TIMEOUT has passed, one trial call is let through; its outcome
+closes the circuit again or keeps it open.
+
+Retries wrap single calls, never whole requests: a retried completion resends
+the prompt that was already built, and nothing is extracted twice.
+"""
+import asyncio
+import math
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Awaitable, Callable, Optional, TypeVar
+
+import httpx
+from tenacity import AsyncRetrying, RetryCallState, Retrying, retry_if_exception, wait_random_exponential
+
+from telemetry import CIRCUIT_REJECTED, CIRCUIT_STATE, UPSTREAM_RETRIES, get_logger
+
+try:
+    from snowflake.connector import errors as snowflake_errors
+except ImportError:
+    snowflake_errors = None
+
+
+RETRY_ATTEMPTS = int(os.getenv("RETRY_ATTEMPTS", "3"))
+RETRY_BASE_DELAY = float(os.getenv("RETRY_BASE_DELAY", "0.5"))   # seconds, doubled per attempt
+RETRY_MAX_DELAY = float(os.getenv("RETRY_MAX_DELAY", "10"))      # cap on one wait
+RETRY_REQUEST_BUDGET = float(os.getenv("RETRY_REQUEST_BUDGET", "90"))  # seconds per interactive request
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RESET_TIMEOUT = float(os.getenv("CIRCUIT_RESET_TIMEOUT", "30"))
+
+# A Retry-After from GitHub is honoured up to this many seconds
+MAX_RETRY_AFTER_HINT = 60
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+# Cortex reports throttling and warehouse trouble as ordinary SQL errors
+TRANSIENT_MESSAGE = re.compile(
+    r"too many requests|rate limit|throttl|overloaded|capacity|temporarily unavailable"
+    r"|service unavailable|timed out|timeout|connection reset|try again",
+    re.IGNORECASE,
+)
+
+logger = get_logger("resilience")
+
+T = TypeVar("T")
+
+# Monotonic deadline for retries made by the current request (None: attempts only)
+_deadline: ContextVar[Optional[float]] = ContextVar("retry_deadline", default=None)
+
+
+class CircuitOpenError(Exception):
+    def __init__(self, upstream: str, retry_after: int):
+        super().__init__(f"{upstream} is unavailable; please retry in {retry_after}s.")
+        self.upstream = upstream
+        self.retry_after = retry_after
+
+
+class RetryableStatus(Exception):
+    """An upstream HTTP response worth retrying (429 or 5xx)."""
+
+    retryable = True
+
+    def __init__(self, status_code: int, retry_after: Optional[float] = None):
+        super().__init__(f"Upstream returned HTTP {status_code}")
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+def retry_after_header(response: httpx.Response) -> Optional[float]:
+    try:
+        return float(response.headers["Retry-After"])
+    except (KeyError, ValueError):
+        return None
+
+
+def is_retryable(e: BaseException) -> bool:
+    """Whether `e` is a transient upstream failure that another attempt may fix."""
+    if getattr(e, "retries_exhausted", False):
+        return False  # an inner call already retried; do not multiply attempts
+    flag = getattr(e, "retryable", None)
+    if flag is not None:
+        return bool(flag)
+    if isinstance(e, CircuitOpenError):
+        return False
+    if isinstance(e, (ConnectionError, TimeoutError, httpx.TransportError)):
+        return True
+    if snowflake_errors is not None:
+        transient = (
+            snowflake_errors.OperationalError,
+            snowflake_errors.InterfaceError,
+            snowflake_errors.ServiceUnavailableError,
+            snowflake_errors.GatewayTimeoutError,
+            snowflake_errors.BadGatewayError,
+            snowflake_errors.RequestTimeoutError,
+            snowflake_errors.OtherHTTPRetryableError,
+        )
+        if isinstance(e, transient):
+            return True
+        if isinstance(e, snowflake_errors.DatabaseError):
+            return bool(TRANSIENT_MESSAGE.search(str(e)))
+    return False
+
+
+# =============================================================================
+# RETRY BUDGET
+# =============================================================================
+
+
+@contextmanager
+def retry_budget(seconds: Optional[float] = RETRY_REQUEST_BUDGET):
+    """
+    Upstream calls inside this block stop retrying once `seconds` have
+    passed. Background jobs and batches pass None: attempts alone bound them.
+    """
+    token = _deadline.set(time.monotonic() + seconds if seconds else None)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def budget_remaining() -> Optional[float]:
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+# =============================================================================
+# CIRCUIT BREAKER
+# =============================================================================
+
+
+class CircuitBreaker:
+    """
+    Closed -> open after `failure_threshold` transient failures in a row;
+    open -> half-open after `reset_timeout`, letting one trial call through.
+    Thread-safe: Snowflake calls run on the Cortex thread pool.
+    """
+
+    STATES = {"closed": 0, "half_open": 1, "open": 2}
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+        reset_timeout: float = CIRCUIT_RESET_TIMEOUT,
+    ):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+        CIRCUIT_STATE.labels(name).set(0)
+
+    def _set_state(self, state: str):
+        if state != self.state:
+            logger.warning("Circuit breaker changed state", extra={
+                "upstream": self.name, "from_state": self.state, "to_state": state, "failures": self.failures,
+            })
+        self.state = state
+        CIRCUIT_STATE.labels(self.name).set(self.STATES[state])
+
+    def before_call(self):
+        """Raise CircuitOpenError if the call should not reach the upstream."""
+        with self._lock:
+            if self.state == "open":
+                waited = time.monotonic() - self.opened_at
+                if waited < self.reset_timeout:
+                    CIRCUIT_REJECTED.labels(self.name).inc()
+                    raise CircuitOpenError(self.name, max(1, math.ceil(self.reset_timeout - waited)))
+                self._set_state("half_open")
+                self._trial_in_flight = False
+            if self.state == "half_open":
+                if self._trial_in_flight:
+                    CIRCUIT_REJECTED.labels(self.name).inc()
+                    raise CircuitOpenError(self.name, max(1, math.ceil(self.reset_timeout)))
+                self._trial_in_flight = True
+
+    def record_success(self):
+        """The upstream answered (even with a non-transient error): it is up."""
+        with self._lock:
+            self.failures = 0
+            self._trial_in_flight = False
+            self._set_state("closed")
+
+    def abandon(self):
+        """A call was cancelled: it says nothing about the upstream, but frees a half-open trial."""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_in_flight = False
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+                self._set_state("open")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"state": self.state, "failures": self.failures}
+
+
+# =============================================================================
+# RETRYING CALLS
+# =============================================================================
+
+
+def _wait(retry_state: RetryCallState) -> float:
+    """Full-jitter exponential backoff, or the upstream's Retry-After if longer."""
+    delay = wait_random_exponential(multiplier=RETRY_BASE_DELAY, max=RETRY_MAX_DELAY)(retry_state)
+    hint = getattr(retry_state.outcome.exception(), "retry_after", None)
+    if hint:
+        delay = max(delay, min(float(hint), MAX_RETRY_AFTER_HINT))
+    return delay
+
+
+def _stop(attempts: int):
+    def stop(retry_state: RetryCallState) -> bool:
+        if retry_state.attempt_number >= attempts:
+            return True
+        remaining = budget_remaining()
+        # Tenacity computes the next wait before asking whether to stop
+        return remaining is not None and remaining < (retry_state.upcoming_sleep or 0)
+    return stop
+
+
+def _retry_settings(breaker: CircuitBreaker, operation: str, attempts: int) -> dict:
+    def before_sleep(retry_state: RetryCallState):
+        UPSTREAM_RETRIES.labels(breaker.name).inc()
+        error = retry_state.outcome.exception()
+        logger.warning("Retrying after a transient error", extra={
+            "upstream": breaker.name,
+            "operation": operation,
+            "attempt": retry_state.attempt_number,
+            "delay_s": round(retry_state.upcoming_sleep, 2),
+            "error": f"{type(error).__name__}: {error}",
+        })
+
+    return {
+        "retry": retry_if_exception(is_retryable),
+        "wait": _wait,
+        "stop": _stop(attempts),
+        "before_sleep": before_sleep,
+        "reraise": True,
+    }
+
+
+def record_outcome(breaker: CircuitBreaker, e: BaseException):
+    """Record a call that raised `e` against `breaker`."""
+    if isinstance(e, CircuitOpenError):
+        # Another upstream's breaker refused the call; nothing reached this one
+        breaker.abandon()
+    elif is_retryable(e) or getattr(e, "retries_exhausted", False):
+        # An inner call that ran out of retries is still a transient failure here
+        breaker.record_failure()
+    else:
+        breaker.record_success()
+
+
+def _mark_exhausted(e: BaseException):
+    if is_retryable(e):
+        e.retries_exhausted = True
+
+
+async def call_with_retries(
+    func: Callable[[], Awaitable[T]],
+    breaker: CircuitBreaker,
+    operation: str,
+    attempts: int = RETRY_ATTEMPTS,
+) -> T:
+    """Await `func()` through `breaker`, retrying transient failures."""
+    async def attempt():
+        breaker.before_call()
+        try:
+            result = await func()
+        except asyncio.CancelledError:
+            breaker.abandon()
+            raise
+        except Exception as e:
+            record_outcome(breaker, e)
+            raise
+        breaker.record_success()
+        return result
+
+    try:
+        return await AsyncRetrying(**_retry_settings(breaker, operation, attempts))(attempt)
+    except Exception as e:
+        _mark_exhausted(e)
+        raise
+
+
+def call_with_retries_sync(
+    func: Callable[[], T],
+    breaker: CircuitBreaker,
+    operation: str,
+    attempts: int = RETRY_ATTEMPTS,
+) -> T:
+    """Blocking variant of call_with_retries, for code already on a worker thread."""
+    def attempt():
+        breaker.before_call()
+        try:
+            result = func()
+        except Exception as e:
+            record_outcome(breaker, e)
+            raise
+        breaker.record_success()
+        return result
+
+    try:
+        return Retrying(**_retry_settings(breaker, operation, attempts))(attempt)
+    except Exception as e:
+        _mark_exhausted(e)
+        raise
@@ -0,0 +1,319 @@
+"""
+Cross-submission similarity index.
+
+Every submission to an assignment is fingerprinted from the files already in
+memory for its evaluation, and near-duplicate peers are reported without a
+model call and without comparing it to every other submission:
+
+1. Source files are tokenized with comments dropped, identifiers, numbers and
+   string literals normalized (so renaming variables changes nothing), and
+   hashed as k-grams of tokens. Winnowing keeps the minimum hash of every
+   window of k-grams, the fingerprint set used by MOSS.
+2. The fingerprint set becomes a MinHash signature by one-permutation
+   hashing: one pass over the set, with empty bins filled from their
+   neighbours, instead of one pass per permutation.
+3. The signature is split into LSH bands. Submissions sharing a band bucket
+   are the only candidates; their similarity is estimated from signatures.
+
+Signatures and band buckets are kept per assignment in SQLite, so each
+lookup reads a handful of index rows however many submissions there are.
+"""
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from array import array
+from typing import Iterable, List, Optional
+
+from cache import DATA_DIR
+from ingest import SubmissionFile
+from packing import SOURCE_EXTENSIONS, is_vendored_or_generated
+
+
+SIMILARITY_ENABLED = os.getenv("SIMILARITY_ENABLED", "true").lower() in ("1", "true", "yes")
+SIMILARITY_INDEX_PATH = os.getenv("SIMILARITY_INDEX_PATH", os.path.join(DATA_DIR, "similarity.sqlite3"))
+# Estimated Jaccard similarity of fingerprint sets at which a peer is reported
+SIMILARITY_THRESHOLD = float(os.getenv("SIMILARITY_THRESHOLD", "0.5"))
+SIMILARITY_MAX_PEERS = int(os.getenv("SIMILARITY_MAX_PEERS", "10"))
+SIMILARITY_TTL = float(os.getenv("SIMILARITY_TTL", str(365 * 24 * 3600)))
+KGRAM_TOKENS = int(os.getenv("SIMILARITY_KGRAM_TOKENS", "8"))
+WINNOW_WINDOW = int(os.getenv("SIMILARITY_WINNOW_WINDOW", "4"))
+# 32 bands of 4 rows: pairs above ~0.42 similarity usually share a bucket
+SIGNATURE_SIZE = 128
+LSH_BANDS = 32
+LSH_ROWS = SIGNATURE_SIZE // LSH_BANDS
+
+# Submissions this small match everything; they are neither indexed nor reported
+MIN_FINGERPRINTS = 20
+# Candidates read from the index per lookup, most shared buckets first
+MAX_CANDIDATES = 1000
+
+_MERSENNE = (1 << 61) - 1
+_BASE = 1_000_003
+_MASK64 = (1 << 64) - 1
+# Empty bins borrow the value of the next non-empty bin, shifted out of its range
+_BIN_OFFSET = (1 << 64) // SIGNATURE_SIZE
+
+KEYWORDS = {
+    # Python
+    'and', 'as', 'assert', 'async', 'await', 'break', 'class', 'continue', 'def', 'del', 'elif', 'else',
+    'except', 'finally', 'for', 'from', 'global', 'if', 'import', 'in', 'is', 'lambda', 'nonlocal', 'not',
+    'or', 'pass', 'raise', 'return', 'try', 'while', 'with', 'yield', 'None', 'True', 'False', 'self',
+    # C family, Java, JavaScript, Go, Rust
+    'case', 'catch', 'const', 'default', 'do', 'enum', 'extends', 'function', 'implements', 'instanceof',
+    'interface', 'let', 'new', 'private', 'protected', 'public', 'static', 'struct', 'super', 'switch',
+    'this', 'throw', 'throws', 'typeof', 'var', 'void', 'int', 'long', 'float', 'double', 'char', 'bool',
+    'boolean', 'string', 'null', 'true', 'false', 'undefined', 'func', 'go', 'defer', 'chan', 'map',
+    'range', 'package', 'type', 'fn', 'impl', 'match', 'mut', 'pub', 'use', 'mod', 'trait', 'loop',
+    'export', 'goto', 'unsigned', 'sizeof', 'template', 'typename', 'namespace', 'using', 'virtual',
+    # SQL
+    'select', 'insert', 'update', 'delete', 'where', 'join', 'group', 'order', 'by', 'having', 'create', 'table',
+}
+
+TOKEN_PATTERN = re.compile(
+    r'(?P<comment>/\*.*?\*/|//[^\n]*|#[^\n]*|<!--.*?-->)'
+    r'|(?P<string>"""[\s\S]*?"""|\'\'\'[\s\S]*?\'\'\'|"(?:\\.|[^"\\\n])*"|\'(?:\\.|[^\'\\\n])*\'|`(?:\\.|[^`\\])*`)'
+    r'|(?P<number>\d[\w.]*)'
+    r'|(?P<name>[A-Za-z_$][\w$]*)'
+    r'|(?P<op>\S)',
+    re.DOTALL,
+)
+
+
+def _stable_hash(text: str) -> int:
+    """Token hash that is the same in every process (str hashes are salted per process)."""
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "big") % _MERSENNE
+
+
+_TOKEN_IDS = {kind: _stable_hash(f"<{kind}>") for kind in ("string", "number", "name")}
+_KEYWORD_IDS = {keyword: _stable_hash(keyword) for keyword in KEYWORDS}
+_OP_IDS = {}
+
+
+def _mix64(x: int) -> int:
+    """splitmix64 finalizer: spreads Karp-Rabin hashes evenly over 64 bits."""
+    x = (x ^ (x >> 30)) * 0xBF58476D1CE4E5B9 & _MASK64
+    x = (x ^ (x >> 27)) * 0x94D049BB133111EB & _MASK64
+    return x ^ (x >> 31)
+
+
+def is_fingerprinted(path: str) -> bool:
+    name = path.rsplit('/', 1)[-1].lower()
+    return '.' in name and name.rsplit('.', 1)[-1] in SOURCE_EXTENSIONS and not is_vendored_or_generated(path)
+
+
+def normalized_tokens(content: str) -> List[int]:
+    """Token ids with comments dropped and identifiers, numbers and strings collapsed."""
+    tokens = []
+    for match in TOKEN_PATTERN.finditer(content):
+        kind = match.lastgroup
+        if kind == "comment":
+            continue
+        if kind == "name":
+            tokens.append(_KEYWORD_IDS.get(match.group(), _TOKEN_IDS["name"]))
+        elif kind == "op":
+            op = match.group()
+            token = _OP_IDS.get(op)
+            if token is None:
+                token = _OP_IDS[op] = _stable_hash(op)
+            tokens.append(token)
+        else:
+            tokens.append(_TOKEN_IDS[kind])
+    return tokens
+
+
+def winnow(tokens: List[int], k: int = KGRAM_TOKENS, window: int = WINNOW_WINDOW) -> set:
+    """Minimum k-gram hash of every window of `window` consecutive k-grams."""
+    if len(tokens) < k:
+        return set()
+    high = pow(_BASE, k - 1, _MERSENNE)
+    h = 0
+    for token in tokens[:k]:
+        h = (h * _BASE + token) % _MERSENNE
+    hashes = [h]
+    for i in range(k, len(tokens)):
+        h = ((h - tokens[i - k] * high) * _BASE + tokens[i]) % _MERSENNE
+        hashes.append(h)
+    if len(hashes) <= window:
+        return {min(hashes)}
+    return {min(hashes[i:i + window]) for i in range(len(hashes) - window + 1)}
+
+
+def fingerprint_files(files: Iterable[SubmissionFile]) -> set:
+    """Winnowed fingerprints of a submission's source files (vendored and generated code excluded)."""
+    fingerprints = set()
+    for submission_file in files:
+        if is_fingerprinted(submission_file.path):
+            fingerprints |= winnow(normalized_tokens(submission_file.content))
+    return fingerprints
+
+
+def minhash_signature(fingerprints: set) -> Optional[array]:
+    """One-permutation MinHash of `fingerprints`, densified by rotation; None for an empty set."""
+    if not fingerprints:
+        return None
+    bins = [None] * SIGNATURE_SIZE
+    for fingerprint in fingerprints:
+        mixed = _mix64(fingerprint)
+        index, value = mixed % SIGNATURE_SIZE, mixed // SIGNATURE_SIZE
+        current = bins[index]
+        if current is None or value < current:
+            bins[index] = value
+    if None in bins:
+        filled = list(bins)
+        for i in range(SIGNATURE_SIZE):
+            distance = 0
+            while bins[(i + distance) % SIGNATURE_SIZE] is None:
+                distance += 1
+            filled[i] = bins[(i + distance) % SIGNATURE_SIZE] + distance * _BIN_OFFSET
+        bins = filled
+    return array("Q", bins)
+
+
+def estimated_similarity(a: array, b: array) -> float:
+    return sum(1 for x, y in zip(a, b) if x == y) / SIGNATURE_SIZE
+
+
+def band_keys(signature: array) -> List[int]:
+    """One signed 64-bit bucket key per LSH band (the band number is part of the key)."""
+    keys = []
+    for band in range(LSH_BANDS):
+        rows = signature[band * LSH_ROWS:(band + 1) * LSH_ROWS]
+        digest = hashlib.blake2b(band.to_bytes(2, "big") + rows.tobytes(), digest_size=8).digest()
+        keys.append(int.from_bytes(digest, "big", signed=True))
+    return keys
+
+
+class SimilarityIndex:
+    """
+    Per-assignment MinHash signatures and LSH buckets in SQLite.
+
+    A student's resubmission replaces their previous signature, so peers are
+    always compared with each other's latest submission. Entries older than
+    SIMILARITY_TTL are dropped as new submissions arrive.
+    """
+
+    def __init__(self, path: str = SIMILARITY_INDEX_PATH, ttl: float = SIMILARITY_TTL):
+        self.path = path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS signatures (
+                assignment_id INTEGER NOT NULL,
+                user_id INTEGER NOT NULL,
+                source TEXT NOT NULL,
+                fingerprints INTEGER NOT NULL,
+                signature BLOB NOT NULL,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (assignment_id, user_id)
+            )
+            """
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS signatures_updated_at ON signatures (updated_at)")
+        self._db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS buckets (
+                assignment_id INTEGER NOT NULL,
+                band_key INTEGER NOT NULL,
+                user_id INTEGER NOT NULL,
+                PRIMARY KEY (assignment_id, band_key, user_id)
+            ) WITHOUT ROWID
+            """
+        )
+
+    def check(self, assignment_id: int, user_id: Optional[int], source: str, files: List[SubmissionFile]) -> Optional[dict]:
+        """
+        Report the near-duplicate peers of this submission and, when the
+        student is known, index it. None when it has too little code to compare.
+        """
+        fingerprints = fingerprint_files(files)
+        if len(fingerprints) < MIN_FINGERPRINTS:
+            return None
+        signature = minhash_signature(fingerprints)
+        keys = band_keys(signature)
+
+        with self._lock:
+            peers, candidates = self._query(assignment_id, user_id, signature, keys)
+            if user_id:
+                self._store(assignment_id, user_id, source, len(fingerprints), signature, keys)
+        return {"fingerprints": len(fingerprints), "candidates": candidates, "peers": peers}
+
+    def _query(self, assignment_id: int, user_id: Optional[int], signature: array, keys: List[int]) -> tuple:
+        placeholders = ",".join("?" * len(keys))
+        rows = self._db.execute(
+            f"""
+            SELECT s.user_id, s.source, s.signature
+            FROM (
+                SELECT user_id, COUNT(*) AS shared FROM buckets
+                WHERE assignment_id = ? AND band_key IN ({placeholders}) AND user_id != ?
+                GROUP BY user_id ORDER BY shared DESC LIMIT ?
+            ) AS c
+            JOIN signatures AS s ON s.assignment_id = ? AND s.user_id = c.user_id
+            """,
+            (assignment_id, *keys, user_id or 0, MAX_CANDIDATES, assignment_id),
+        ).fetchall()
+
+        peers = []
+        for peer_id, source, blob in rows:
+            similarity = estimated_similarity(signature, array("Q", blob))
+            if similarity >= SIMILARITY_THRESHOLD:
+                peers.append({"user_id": peer_id, "source": source, "similarity": round(similarity, 3)})
+        peers.sort(key=lambda peer: peer["similarity"], reverse=True)
+        return peers[:SIMILARITY_MAX_PEERS], len(rows)
+
+    def _store(self, assignment_id: int, user_id: int, source: str, fingerprints: int, signature: array, keys: List[int]):
+        now = time.time()
+        self._db.execute("BEGIN")
+        try:
+            self._remove(assignment_id, user_id)
+            self._db.execute(
+                "INSERT INTO signatures (assignment_id, user_id, source, fingerprints, signature, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (assignment_id, user_id, source, fingerprints, signature.tobytes(), now),
+            )
+            self._db.executemany(
+                "INSERT OR IGNORE INTO buckets (assignment_id, band_key, user_id) VALUES (?, ?, ?)",
+                [(assignment_id, key, user_id) for key in keys],
+            )
+            if self.ttl:
+                expired = self._db.execute(
+                    "SELECT assignment_id, user_id FROM signatures WHERE updated_at < ?", (now - self.ttl,)
+                ).fetchall()
+                for row in expired:
+                    self._remove(*row)
+            self._db.execute("COMMIT")
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+
+    def _remove(self, assignment_id: int, user_id: int):
+        row = self._db.execute(
+            "SELECT signature FROM signatures WHERE assignment_id = ? AND user_id = ?", (assignment_id, user_id)
+        ).fetchone()
+        if row is None:
+            return
+        self._db.executemany(
+            "DELETE FROM buckets WHERE assignment_id = ? AND band_key = ? AND user_id = ?",
+            [(assignment_id, key, user_id) for key in band_keys(array("Q", row[0]))],
+        )
+        self._db.execute("DELETE FROM signatures WHERE assignment_id = ? AND user_id = ?", (assignment_id, user_id))
+
+    def stats(self) -> dict:
+        with self._lock:
+            count, assignments = self._db.execute(
+                "SELECT COUNT(*), COUNT(DISTINCT assignment_id) FROM signatures"
+            ).fetchone()
+        return {"submissions": count, "assignments": assignments}
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,280 @@
+"""
+Request tracing, Prometheus metrics and structured logs.
+
+Every HTTP request (and every background job) runs inside a trace carrying a
+request id. Pipeline stages are timed with `span(stage)`; each span feeds the
+`evaluator_stage_seconds` histogram and the trace, which is logged as one
+"Request completed" line and returned in a `Server-Timing` header. Log lines
+are JSON (LOG_FORMAT=json) or key=value text (LOG_FORMAT=text), and always
+carry the current request id.
+"""
+import json
+import logging
+import os
+import re
+import sys
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+
+REQUEST_ID_HEADER = "x-request-id"
+# Incoming ids are echoed back, so only accept short, header-safe ones
+VALID_REQUEST_ID = re.compile(r"[A-Za-z0-9._:-]{1,64}")
+
+METRICS_CONTENT_TYPE = CONTENT_TYPE_LATEST
+
+
+# =============================================================================
+# METRICS
+# =============================================================================
+
+# Stages range from sub-millisecond (prompt build) to minutes (Cortex completions)
+STAGE_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+REQUEST_SECONDS = Histogram(
+    "evaluator_request_seconds", "HTTP request latency", ["method", "route", "status"], buckets=STAGE_BUCKETS
+)
+STAGE_SECONDS = Histogram(
+    "evaluator_stage_seconds", "Time spent in each pipeline stage", ["stage"], buckets=STAGE_BUCKETS
+)
+STAGE_ERRORS = Counter("evaluator_stage_errors_total", "Pipeline stages that raised", ["stage"])
+PROMPT_CHARS = Histogram(
+    "evaluator_prompt_chars", "Size of prompts sent to the model", ["kind"],
+    buckets=(1000, 5000, 10000, 25000, 50000, 100000, 200000, 400000, 800000, 1600000),
+)
+SUBMISSION_FILES = Histogram(
+    "evaluator_submission_files", "Text files read from a submission", ["source"],
+    buckets=(1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000),
+)
+SKIPPED_FILES = Histogram(
+    "evaluator_skipped_files", "Files skipped per submission (binary, ignored or over a limit)", ["source"],
+    buckets=(0, 1, 5, 10, 25, 50, 100, 250, 500, 1000, 5000),
+)
+CACHE_LOOKUPS = Counter("evaluator_cache_lookups_total", "Cache lookups by cache and result", ["cache", "result"])
+ADMISSION_LIMIT = Gauge("evaluator_admission_limit", "Current adaptive limit on in-flight model calls")
+ADMISSION_IN_FLIGHT = Gauge("evaluator_admission_in_flight", "Model calls holding an admission slot")
+ADMISSION_QUEUED = Gauge("evaluator_admission_queued", "Model calls waiting for an admission slot")
+ADMISSION_REJECTED = Counter("evaluator_admission_rejected_total", "Model calls rejected with 429", ["reason"])
+UPSTREAM_RETRIES = Counter("evaluator_upstream_retries_total", "Upstream calls retried after a transient error", ["upstream"])
+CIRCUIT_STATE = Gauge("evaluator_circuit_state", "Circuit breaker state (0 closed, 1 half-open, 2 open)", ["upstream"])
+CIRCUIT_REJECTED = Counter("evaluator_circuit_rejected_total", "Upstream calls failed fast by an open circuit", ["upstream"])
+NEAR_DUPLICATES = Counter(
+    "evaluator_near_duplicate_submissions_total", "Submissions reported with at least one near-duplicate peer", ["source"]
+)
+TEST_RUNS = Counter("evaluator_test_runs_total", "Sandboxed test runs, by whose tests ran and how the run ended", ["source", "outcome"])
+
+
+def metrics_payload() -> bytes:
+    """The Prometheus text exposition of every metric in this process."""
+    return generate_latest()
+
+
+# =============================================================================
+# TRACES
+# =============================================================================
+
+
+@dataclass
+class Trace:
+    request_id: str
+    started: float = field(default_factory=time.perf_counter)
+    spans: List[dict] = field(default_factory=list)
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def stage_totals(self) -> Dict[str, float]:
+        """Milliseconds per stage; concurrent spans of one stage add up."""
+        totals: Dict[str, float] = {}
+        for recorded in self.spans:
+            totals[recorded["stage"]] = round(totals.get(recorded["stage"], 0.0) + recorded["duration_ms"], 1)
+        return totals
+
+    def server_timing(self) -> str:
+        return ", ".join(f"{stage};dur={ms}" for stage, ms in self.stage_totals().items())
+
+
+_current_trace: ContextVar[Optional[Trace]] = ContextVar("evaluator_trace", default=None)
+
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+def current_request_id() -> Optional[str]:
+    current = _current_trace.get()
+    return current.request_id if current else None
+
+
+def request_elapsed() -> float:
+    """Seconds since the current request started (0 outside a request)."""
+    current = _current_trace.get()
+    return current.elapsed() if current else 0.0
+
+
+@contextmanager
+def trace(request_id: Optional[str] = None):
+    """Run the enclosed code as one request: new spans and log lines carry its id."""
+    current = Trace(request_id or new_request_id())
+    token = _current_trace.set(current)
+    try:
+        yield current
+    finally:
+        _current_trace.reset(token)
+
+
+def record_span(stage: str, seconds: float, error: Optional[str] = None, **attributes):
+    """Record a stage that was timed elsewhere (e.g. request body parsing)."""
+    STAGE_SECONDS.labels(stage).observe(seconds)
+    if error:
+        STAGE_ERRORS.labels(stage).inc()
+    current = _current_trace.get()
+    recorded = {"stage": stage, "duration_ms": round(seconds * 1000, 1), **attributes}
+    if error:
+        recorded["error"] = error
+    if current is not None:
+        recorded["start_ms"] = round((time.perf_counter() - seconds - current.started) * 1000, 1)
+        current.spans.append(recorded)
+    logger.debug("Stage finished", extra=recorded)
+
+
+@contextmanager
+def span(stage: str, **attributes):
+    """
+    Time the enclosed block as `stage`. Yields the attribute dict, so counts
+    known only at the end (files read, response size) can be added to it.
+    Works in worker threads started with asyncio.to_thread, which copy the context.
+    """
+    started = time.perf_counter()
+    error = None
+    try:
+        yield attributes
+    except BaseException as e:
+        error = type(e).__name__
+        raise
+    finally:
+        record_span(stage, time.perf_counter() - started, error, **attributes)
+
+
+# =============================================================================
+# STRUCTURED LOGS
+# =============================================================================
+
+# Attributes every LogRecord has; anything else was passed through `extra=`
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "request_id"}
+
+
+class RequestIdFilter(logging.Filter):
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = current_request_id()
+        return True
+
+
+class StructuredFormatter(logging.Formatter):
+    """One line per record: JSON, or `key=value` pairs when `as_json` is False."""
+
+    def __init__(self, as_json: bool = True):
+        super().__init__()
+        self.as_json = as_json
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S") + f".{int(record.msecs):03d}",
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "request_id": getattr(record, "request_id", None),
+            "message": record.getMessage(),
+        }
+        entry.update({key: value for key, value in vars(record).items() if key not in _RECORD_ATTRIBUTES})
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+
+        if self.as_json:
+            return json.dumps(entry, default=str)
+        head = f"{entry.pop('ts')} {entry.pop('level').upper():<7} [{entry.pop('request_id') or '-'}] {entry.pop('message')}"
+        entry.pop("logger")
+        exception = entry.pop("exception", None)
+        line = head + "".join(f" {key}={json.dumps(value, default=str)}" for key, value in entry.items())
+        return line + ("\n" + exception if exception else "")
+
+
+def configure_logging(level: str = LOG_LEVEL, log_format: str = LOG_FORMAT):
+    """Send all `evaluator.*` loggers to stderr in the configured format."""
+    root = logging.getLogger("evaluator")
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    handler = logging.StreamHandler(sys.stderr)
+    handler.addFilter(RequestIdFilter())
+    handler.setFormatter(StructuredFormatter(as_json=log_format != "text"))
+    root.addHandler(handler)
+    root.setLevel(level)
+    root.propagate = False  # uvicorn configures the root logger with its own format
+
+
+def get_logger(name: str) -> logging.Logger:
+    return logging.getLogger(f"evaluator.{name}")
+
+
+configure_logging()
+logger = get_logger("telemetry")
+
+
+# =============================================================================
+# ASGI MIDDLEWARE
+# =============================================================================
+
+
+class RequestTelemetryMiddleware:
+    """
+    Wraps each HTTP request in a trace. Adds `X-Request-ID` (the caller's, if
+    valid, else a new one) and `Server-Timing` to the response, observes the
+    request histogram by route template, and logs a summary line once the
+    response body, including any streamed body, has been sent.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        incoming = dict(scope.get("headers") or []).get(REQUEST_ID_HEADER.encode(), b"").decode("latin-1")
+        status = 500
+        with trace(incoming if VALID_REQUEST_ID.fullmatch(incoming) else None) as current:
+            async def send_with_headers(message):
+                nonlocal status
+                if message["type"] == "http.response.start":
+                    status = message["status"]
+                    headers = list(message.get("headers", []))
+                    headers.append((REQUEST_ID_HEADER.encode(), current.request_id.encode()))
+                    if current.spans:
+                        headers.append((b"server-timing", current.server_timing().encode()))
+                    message = {**message, "headers": headers}
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_with_headers)
+            finally:
+                # The route template keeps label cardinality bounded (no job ids)
+                route = getattr(scope.get("route"), "path", None) or "unmatched"
+                elapsed = current.elapsed()
+                REQUEST_SECONDS.labels(scope["method"], route, str(status)).observe(elapsed)
+                if route != "/metrics":
+                    logger.info("Request completed", extra={
+                        "method": scope["method"],
+                        "path": scope["path"],
+                        "status": status,
+                        "duration_ms": round(elapsed * 1000, 1),
+                        "stages": current.stage_totals(),
+                    })
@@ -0,0 +1,13 @@
+"""
+Shared test setup. Settings are read from the environment when the service
+modules are imported, so they are set here before any test module imports them.
+"""
+import os
+import tempfile
+
+os.environ.setdefault("EVALUATOR_DATA_DIR", tempfile.mkdtemp(prefix="evaluator-tests-"))
+os.environ.setdefault("RETRY_BASE_DELAY", "0.01")
+os.environ.setdefault("RETRY_MAX_DELAY", "0.05")
+os.environ.setdefault("NO_PROXY", "127.0.0.1,localhost")
+os.environ.setdefault("LLM_BACKEND", "fake")
+os.environ.setdefault("FAKE_LLM_LATENCY", "fixed:0")
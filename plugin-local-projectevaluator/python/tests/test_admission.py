@@ -0,0 +1,176 @@
+"""AIMD limit and per-course queues of the admission controller."""
+import asyncio
+
+import pytest
+
+from admission import AdmissionController, AdmissionRejected, admission_scope, course_key
+from resilience import CircuitOpenError
+
+
+def controller(**overrides) -> AdmissionController:
+    settings = dict(max_limit=4, min_limit=1, latency_target=10, decrease_factor=0.5,
+                    queue_size=4, queue_per_key=2, queue_timeout=5, enabled=True)
+    settings.update(overrides)
+    return AdmissionController(**settings)
+
+
+def test_course_key():
+    assert course_key(7, 3) == "course:7"
+    assert course_key(None, 3) == "assignment:3"
+    assert course_key() == "default"
+
+
+def test_failure_decreases_limit_once_per_epoch():
+    async def run():
+        admission = controller()
+        slots = [await admission.acquire("default") for _ in range(3)]
+        # Calls admitted before the first decrease report the same overload
+        for slot in slots:
+            admission.release(slot, False)
+        return admission
+
+    admission = asyncio.run(run())
+    assert admission.limit == 2.0
+    assert admission.in_flight == 0
+
+
+def test_later_failure_decreases_again():
+    async def run():
+        admission = controller()
+        admission.release(await admission.acquire("default"), False)
+        admission.release(await admission.acquire("default"), False)
+        return admission
+
+    assert asyncio.run(run()).limit == 1.0
+
+
+def test_fast_success_increases_additively():
+    async def run():
+        admission = controller()
+        admission.release(await admission.acquire("default"), False)
+        assert admission.limit == 2.0
+        admission.release(await admission.acquire("default"), True)
+        return admission
+
+    assert asyncio.run(run()).limit == 2.5
+
+
+def test_slow_success_counts_as_overload():
+    async def run():
+        admission = controller()
+        slot = await admission.acquire("default")
+        slot.latency = 60
+        admission.release(slot, True)
+        return admission
+
+    assert asyncio.run(run()).limit == 2.0
+
+
+def test_cancelled_call_leaves_limit():
+    async def run():
+        admission = controller()
+        admission.release(await admission.acquire("default"), None)
+        return admission
+
+    assert asyncio.run(run()).limit == 4.0
+
+
+def test_queue_limits_reject():
+    async def run():
+        admission = controller(max_limit=1, queue_size=3, queue_per_key=2)
+        held = await admission.acquire("default")
+        waiting = [
+            asyncio.create_task(admission.acquire(key))
+            for key in ("course:1", "course:1", "course:2")
+        ]
+        await asyncio.sleep(0)
+
+        with pytest.raises(AdmissionRejected) as excinfo:
+            admission.check("course:3")
+        assert "capacity" in str(excinfo.value)
+        assert excinfo.value.retry_after >= 1
+
+        admission.queue_size = 10
+        with pytest.raises(AdmissionRejected) as excinfo:
+            admission.check("course:1")
+        assert "this course" in str(excinfo.value)
+        admission.check("course:2")
+
+        for task in waiting:
+            task.cancel()
+        await asyncio.gather(*waiting, return_exceptions=True)
+        admission.release(held, None)
+        return admission
+
+    admission = asyncio.run(run())
+    assert admission.rejected == 2
+    assert admission.stats()["queued"] == 0
+
+
+def test_queue_timeout_rejects():
+    async def run():
+        admission = controller(max_limit=1, queue_timeout=0.01)
+        await admission.acquire("default")
+        with pytest.raises(AdmissionRejected):
+            await admission.acquire("default")
+        return admission
+
+    assert asyncio.run(run()).stats()["queued"] == 0
+
+
+def test_waiters_are_served_round_robin():
+    order = []
+
+    async def call(admission, key, name):
+        with admission_scope(key):
+            async with admission.slot():
+                order.append(name)
+                await asyncio.sleep(0)
+
+    async def run():
+        admission = controller(max_limit=1, queue_size=10, queue_per_key=10)
+        held = await admission.acquire("default")
+        tasks = [asyncio.create_task(call(admission, key, name)) for key, name in [
+            ("course:1", "a1"), ("course:1", "a2"), ("course:1", "a3"), ("course:2", "b1"), ("course:2", "b2"),
+        ]]
+        await asyncio.sleep(0)
+        admission.release(held, None)
+        await asyncio.gather(*tasks)
+
+    asyncio.run(run())
+    assert order == ["a1", "b1", "a2", "b2", "a3"]
+
+
+def test_disabled_controller_never_waits():
+    async def run():
+        admission = controller(max_limit=1, enabled=False)
+        async with admission.slot():
+            async with admission.slot():
+                return admission.in_flight
+
+    assert asyncio.run(run()) == 0
+
+
+def test_open_circuit_leaves_limit():
+    async def run():
+        admission = controller()
+        for _ in range(3):
+            with pytest.raises(CircuitOpenError):
+                async with admission.slot():
+                    raise CircuitOpenError("snowflake", 30)
+        return admission
+
+    admission = asyncio.run(run())
+    assert admission.limit == 4.0
+    assert admission.in_flight == 0
+
+
+def test_failed_call_in_slot_decreases_limit():
+    async def run():
+        admission = controller()
+        with pytest.raises(ConnectionError):
+            async with admission.slot():
+                raise ConnectionError("reset")
+        return admission
+
+    assert asyncio.run(run()).limit == 2.0
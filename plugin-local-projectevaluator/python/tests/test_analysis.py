@@ -0,0 +1,151 @@
+"""Local static analysis: line counts, complexity and boilerplate detection."""
+import asyncio
+import json
+
+import pytest
+
+from analysis import HIGH_COMPLEXITY, StaticAnalyzer, analyze_file
+from ingest import SubmissionFile
+
+
+PYTHON = '''"""Shopping cart."""
+import math
+
+# Rates are percentages
+RATES = {"std": 20, "text": "# not a comment"}
+
+
+def total(prices, discount=None):
+    """Sum of prices,
+    less the discount."""
+    if not prices:
+        return 0
+    subtotal = sum(p for p in prices if p > 0)
+    if discount and discount < subtotal:
+        subtotal -= discount
+
+    def rounded(value):
+        return math.floor(value) if value > 0 else 0
+    return rounded(subtotal)
+
+
+class Cart:
+    def add(self, item):
+        for existing in self.items:
+            if existing == item:
+                return
+        self.items.append(item)
+'''
+
+
+def branchy(name: str, branches: int) -> str:
+    lines = [f"def {name}(x):"]
+    lines += [f"    if x == {i}:\n        return {i}" for i in range(branches)]
+    return "\n".join(lines) + "\n    return -1\n"
+
+
+def test_python_lines_and_docstrings():
+    metrics = analyze_file("shop/cart.py", PYTHON)
+
+    assert metrics.language == "Python"
+    # Docstrings (1 + 2 lines) and the comment count as documentation
+    assert metrics.comment_lines == 4
+    assert (metrics.code_lines, metrics.blank_lines) == (17, 7)
+    assert not metrics.syntax_error
+
+
+def test_python_complexity_per_function():
+    metrics = analyze_file("cart.py", PYTHON + "\n\n" + branchy("dispatch", HIGH_COMPLEXITY))
+
+    # total: 1 + if, if, and (+ the generator's for/if); rounded: 1 + if; Cart.add: 1 + for, if
+    assert metrics.functions == 4
+    assert metrics.complex_functions == [("dispatch", HIGH_COMPLEXITY + 1)]
+    assert metrics.complexity == (1 + 5) + (1 + 1) + (1 + 2) + (HIGH_COMPLEXITY + 1)
+
+
+def test_unparseable_python_is_flagged():
+    metrics = analyze_file("broken.py", "def f(:\n    if x:\n        pass\n")
+
+    assert metrics.syntax_error
+    # No syntax tree means no function extents; decisions are still counted
+    assert (metrics.functions, metrics.complexity) == (0, 1)
+
+
+def test_other_languages_use_patterns():
+    source = """// Entry point
+function main(args) {
+  if (args.length && args[0] === "x") { return 1; }
+  const s = "if (not code)";
+  return 0;
+}
+"""
+    metrics = analyze_file("src/index.js", source)
+
+    assert (metrics.language, metrics.functions) == ("JavaScript", 1)
+    assert metrics.comment_lines == 1
+    assert metrics.complexity == 1 + 2  # the string literal is not counted
+
+
+def test_unknown_languages_are_not_analyzed():
+    assert analyze_file("data.csv", "a,b\n1,2") is None
+
+
+def test_notebook_code_cells_are_analyzed():
+    notebook = json.dumps({"cells": [
+        {"cell_type": "markdown", "source": ["# Title"]},
+        {"cell_type": "code", "source": ["%matplotlib inline\n", "def f(x):\n", "    return x if x else 0\n"]},
+    ]})
+
+    metrics = analyze_file("analysis.ipynb", notebook)
+
+    assert (metrics.functions, metrics.complexity) == (1, 2)
+    assert not metrics.syntax_error
+
+
+@pytest.mark.parametrize("path, content, reason", [
+    ("api/schema_pb2.py", "# Generated by the protocol buffer compiler.  DO NOT EDIT!\nx = 1\n", "generated"),
+    ("gen/client.go", "// Code generated by protoc-gen-go. DO NOT EDIT.\npackage gen\n", "generated"),
+    ("mysite/wsgi.py", '"""\nWSGI config for mysite project.\n"""\nimport os\n', "scaffold"),
+    ("static/app.js", "var a=1;" * 100, "minified"),
+    ("pkg/__init__.py", "# package\n", "empty"),
+])
+def test_boilerplate_is_detected(path, content, reason):
+    assert analyze_file(path, content).boilerplate == reason
+
+
+def test_mentioning_generation_is_not_boilerplate():
+    source = '"""This module generated the weekly report. DO NOT EDIT lightly."""\n\ndef report():\n    return 1\n'
+    assert analyze_file("report.py", source).boilerplate is None
+
+
+FILES = [
+    SubmissionFile("README.md", "# Shop\n\nRun it.\n"),
+    SubmissionFile("docs/README.md", "# Docs"),
+    SubmissionFile("shop/cart.py", PYTHON),
+    SubmissionFile("shop/rules.py", branchy("classify", HIGH_COMPLEXITY + 2)),
+    SubmissionFile("tests/test_cart.py", "from shop.cart import total\n\ndef test_total():\n    assert total([1]) == 1\n"),
+    SubmissionFile("shop/__init__.py", ""),
+    SubmissionFile("web/app.js", "function start() { return 1; }\n"),
+]
+
+
+@pytest.mark.parametrize("pool_min_bytes", [10**9, 0], ids=["thread", "process pool"])
+def test_submission_report(pool_min_bytes):
+    analyzer = StaticAnalyzer(workers=2, pool_min_bytes=pool_min_bytes, timeout=60)
+    try:
+        report = asyncio.run(analyzer.analyze(FILES))
+    finally:
+        analyzer.shutdown()
+
+    summary = report.report()
+    assert (summary["readme"], report.readme_lines) == ("README.md", 4)
+    assert summary["test_files"] == 1
+    assert summary["boilerplate"] == {"shop/__init__.py": "empty"}
+    assert list(summary["languages"]) == ["Python", "JavaScript"]
+    assert summary["languages"]["Python"]["files"] == 3
+    assert summary["most_complex_functions"] == [{"function": "shop/rules.py:classify", "complexity": HIGH_COMPLEXITY + 3}]
+
+    text = report.format_for_llm()
+    assert text.startswith("--- STATIC ANALYSIS")
+    assert "Most complex functions: shop/rules.py:classify" in text
+    assert "Boilerplate files (generated, scaffolding, minified or empty): 1" in text
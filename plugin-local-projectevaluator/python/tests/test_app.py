@@ -0,0 +1,216 @@
+"""Endpoint behaviour against the fake LLM backend (LLM_BACKEND=fake, see conftest.py)."""
+import hashlib
+import io
+import json
+import os
+import tarfile
+import zipfile
+
+import pytest
+from fastapi.testclient import TestClient
+
+import app
+from documents import DocumentStore, DocumentTooLarge
+from resilience import CircuitBreaker
+
+
+@pytest.fixture
+def client():
+    # Without the context manager the lifespan (pools, job workers) is not started
+    return TestClient(app.app)
+
+
+@pytest.fixture
+def breaker(monkeypatch):
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=30)
+    monkeypatch.setattr(app, "llm_breaker", breaker)
+    return breaker
+
+
+def sse_events(text: str) -> list:
+    events = []
+    for block in text.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+def fake_stream(*chunks, error=None):
+    calls = []
+
+    async def stream(prompt, model=None):
+        calls.append(prompt)
+        for chunk in chunks:
+            yield chunk
+        if error is not None:
+            raise error
+
+    stream.calls = calls
+    return stream
+
+
+def generate(client) -> list:
+    response = client.post("/generate-project/stream", json={"topics": "queues", "complexity": "Easy"})
+    return sse_events(response.text)
+
+
+def test_stream_success_closes_a_half_open_circuit(client, breaker, monkeypatch):
+    monkeypatch.setattr(app.llm_backend, "stream", fake_stream("Project ", "Title"))
+    breaker.record_failure()
+    breaker.opened_at -= 31
+
+    events = generate(client)
+
+    assert [name for name, _ in events] == ["start", "token", "token", "done"]
+    assert breaker.state == "closed"
+
+
+def test_stream_honours_an_open_circuit(client, breaker, monkeypatch):
+    stream = fake_stream("never sent")
+    monkeypatch.setattr(app.llm_backend, "stream", stream)
+    breaker.record_failure()
+
+    events = generate(client)
+
+    assert events[-1][0] == "error"
+    assert events[-1][1]["status_code"] == 503
+    assert events[-1][1]["retry_after"] >= 1
+    assert stream.calls == []
+
+
+def test_stream_failure_before_first_chunk_opens_the_circuit(client, breaker, monkeypatch):
+    monkeypatch.setattr(app.llm_backend, "stream", fake_stream(error=ConnectionError("reset")))
+
+    events = generate(client)
+
+    assert events[-1][0] == "error"
+    assert breaker.state == "open"
+
+
+def test_stream_failure_after_first_chunk_is_not_counted(client, breaker, monkeypatch):
+    monkeypatch.setattr(app.llm_backend, "stream", fake_stream("Project", error=ConnectionError("reset")))
+
+    events = generate(client)
+
+    assert [name for name, _ in events] == ["start", "token", "error"]
+    assert breaker.state == "closed"
+
+
+def zip_bytes(files: dict) -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        for path, content in files.items():
+            archive.writestr(path, content)
+    return buffer.getvalue()
+
+
+def chunked(data: bytes, size: int = 1000):
+    # A generator body is sent without Content-Length, so only the streamed size can be checked
+    for start in range(0, len(data), size):
+        yield data[start:start + size]
+
+
+def test_raw_archive_is_evaluated(client):
+    archive = zip_bytes({"cart.py": "def total(prices):\n    return sum(prices)\n", "README.md": "# Cart"})
+
+    response = client.post(
+        "/evaluate-project/raw",
+        params={"criteria": "Sum a list of prices"},
+        content=archive,
+        headers={"Content-Type": "application/zip"},
+    )
+
+    assert response.status_code == 200, response.text
+    assert "overall_score" in response.json()["evaluation"]
+
+
+def test_raw_archive_over_the_declared_limit_is_refused_before_reading(client, monkeypatch):
+    monkeypatch.setattr(app, "MAX_UPLOAD_BYTES", 100)
+
+    response = client.post(
+        "/evaluate-project/raw", params={"criteria": "c", "filename": "a.zip"}, content=b"x" * 101
+    )
+
+    assert response.status_code == 413
+    assert "100 bytes" in response.json()["detail"]
+
+
+def test_streamed_body_over_the_limit_is_refused(client, monkeypatch):
+    monkeypatch.setattr(app, "MAX_UPLOAD_BYTES", 2500)
+
+    response = client.post(
+        "/evaluate-project/raw", params={"criteria": "c", "filename": "a.zip"}, content=chunked(b"x" * 5000)
+    )
+
+    assert response.status_code == 413
+
+
+def test_raw_archive_needs_a_type_and_a_body(client):
+    unknown = client.post("/evaluate-project/raw", params={"criteria": "c"}, content=b"PK", headers={"Content-Type": "text/plain"})
+    empty = client.post("/evaluate-project/raw", params={"criteria": "c", "filename": "a.zip"}, content=b"")
+
+    assert unknown.status_code == 400
+    assert (empty.status_code, empty.json()["detail"]) == (400, "Request body is empty.")
+
+
+def test_raw_document_is_stored(client):
+    text = b"Lecture notes\n" * 10_000  # past the in-memory spool size
+
+    response = client.post("/documents/raw", params={"filename": "notes.txt"}, content=chunked(text, 64 * 1024))
+
+    assert response.status_code == 200, response.text
+    body = response.json()
+    assert body["size"] == len(text)
+    assert body["document_id"] == hashlib.sha256(text).hexdigest()
+    assert body["text_extracted"]
+
+
+def test_raw_document_over_the_limit_is_refused(client, monkeypatch):
+    monkeypatch.setattr(app, "DOC_MAX_UPLOAD_BYTES", 2500)
+
+    declared = client.post("/documents/raw", params={"filename": "notes.txt"}, content=b"x" * 3000)
+    streamed = client.post("/documents/raw", params={"filename": "notes.txt"}, content=chunked(b"x" * 3000))
+
+    assert declared.status_code == streamed.status_code == 413
+
+
+def test_document_store_stops_at_max_bytes(tmp_path):
+    store = DocumentStore(str(tmp_path / "store"))
+
+    with pytest.raises(DocumentTooLarge):
+        store.put_file(io.BytesIO(b"x" * 5000), "txt", max_bytes=4096)
+    # The partial copy is removed
+    assert os.listdir(tmp_path / "store") == []
+
+    document_id, size = store.put_file(io.BytesIO(b"x" * 4096), "txt", max_bytes=4096)
+    assert (size, document_id) == (4096, hashlib.sha256(b"x" * 4096).hexdigest())
+
+
+@pytest.mark.parametrize("filename, supported", [
+    ("project.zip", True),
+    ("Project.ZIP", True),
+    ("project.tar", True),
+    ("project.tar.gz", True),
+    ("project.TGZ", True),
+    ("project.gz", False),
+    ("project.rar", False),
+    ("", False),
+    (None, False),
+])
+def test_supported_archive_names(filename, supported):
+    assert app.is_supported_archive(filename) is supported
+
+
+def test_uppercase_tgz_is_evaluated(client):
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w:gz") as archive:
+        data = b"def total(prices):\n    return sum(prices)\n"
+        member = tarfile.TarInfo("cart.py")
+        member.size = len(data)
+        archive.addfile(member, io.BytesIO(data))
+
+    response = client.post(
+        "/evaluate-project/raw", params={"criteria": "Sum a list of prices", "filename": "Project.TGZ"}, content=buffer.getvalue()
+    )
+
+    assert response.status_code == 200, response.text
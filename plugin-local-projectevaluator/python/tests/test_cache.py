@@ -0,0 +1,93 @@
+"""The SQLite result cache: TTL and LRU eviction by count and size."""
+import pytest
+
+import cache
+from cache import SQLiteCache, content_key
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache, "time", clock)
+    return clock
+
+
+def make(tmp_path, **limits) -> SQLiteCache:
+    return SQLiteCache(str(tmp_path / "cache.sqlite3"), **limits)
+
+
+def test_round_trip_and_persistence(tmp_path):
+    first = make(tmp_path)
+    first.set("key", {"score": 80, "notes": ["a"]})
+    first.close()
+
+    assert make(tmp_path).get("key") == {"score": 80, "notes": ["a"]}
+    assert make(tmp_path).get("missing") is None
+
+
+def test_entries_expire_after_ttl(tmp_path, clock):
+    entries = make(tmp_path, ttl=60)
+    entries.set("key", 1)
+
+    clock.now += 59
+    assert entries.get("key") == 1
+    clock.now += 2
+    assert entries.get("key") is None
+    assert entries.stats()["entries"] == 0
+
+
+def test_reads_do_not_extend_ttl(tmp_path, clock):
+    entries = make(tmp_path, ttl=60)
+    entries.set("key", 1)
+    for _ in range(3):
+        clock.now += 30
+        entries.get("key")
+    assert entries.get("key") is None
+
+
+def test_least_recently_read_is_evicted_by_count(tmp_path, clock):
+    entries = make(tmp_path, max_entries=2)
+    entries.set("a", 1)
+    clock.now += 1
+    entries.set("b", 2)
+    clock.now += 1
+    entries.get("a")
+    clock.now += 1
+    entries.set("c", 3)
+
+    assert entries.get("a") == 1
+    assert entries.get("b") is None
+    assert entries.get("c") == 3
+
+
+def test_eviction_by_size(tmp_path, clock):
+    entries = make(tmp_path, max_bytes=250)
+    for key in "abc":
+        clock.now += 1
+        entries.set(key, "x" * 98)  # 100 bytes of JSON each
+
+    assert entries.get("a") is None
+    assert entries.get("b") == "x" * 98
+    assert entries.stats() == {"entries": 2, "bytes": 200}
+
+
+def test_replacing_a_key_keeps_one_entry(tmp_path):
+    entries = make(tmp_path, max_entries=5)
+    entries.set("key", 1)
+    entries.set("key", 2)
+    entries.delete("missing")
+    assert entries.get("key") == 2
+    assert entries.stats()["entries"] == 1
+
+
+def test_content_key_is_unambiguous():
+    assert content_key("ab", "c") != content_key("a", "bc")
+    assert content_key("a", "b") == content_key("a", "b")
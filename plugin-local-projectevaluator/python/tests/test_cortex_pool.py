@@ -0,0 +1,162 @@
+"""The Snowflake connection pool, over stand-in connections."""
+import threading
+
+import pytest
+
+from cortex import PoolTimeoutError, SnowflakeConnectionPool
+
+
+class FakeConnection:
+    def __init__(self, number: int):
+        self.number = number
+        self.closed = False
+        self.healthy = True
+        self.checks = 0
+
+    def is_closed(self):
+        return self.closed
+
+    def close(self):
+        self.closed = True
+
+    def cursor(self):
+        connection = self
+
+        class Cursor:
+            def execute(self, sql):
+                connection.checks += 1
+                if not connection.healthy:
+                    raise ConnectionError("session expired")
+
+            def fetchone(self):
+                return (1,)
+
+            def close(self):
+                pass
+
+        return Cursor()
+
+
+class Connector:
+    def __init__(self):
+        self.opened = []
+
+    def __call__(self):
+        connection = FakeConnection(len(self.opened))
+        self.opened.append(connection)
+        return connection
+
+
+def pool(**overrides) -> SnowflakeConnectionPool:
+    settings = dict(min_size=1, max_size=2, acquire_timeout=0.2, idle_timeout=60, health_check_interval=60)
+    settings.update(overrides)
+    return SnowflakeConnectionPool(Connector(), **settings)
+
+
+def test_release_makes_the_connection_reusable():
+    connections = pool()
+    first = connections.acquire()
+    connections.release(first)
+
+    assert connections.acquire() is first
+    assert len(connections._connect.opened) == 1
+
+
+def test_warmest_connection_is_reused_first():
+    connections = pool()
+    a, b = connections.acquire(), connections.acquire()
+    connections.release(a)
+    connections.release(b)
+    assert connections.acquire() is b
+
+
+def test_acquire_times_out_at_max_size():
+    connections = pool(max_size=1)
+    connections.acquire()
+    with pytest.raises(PoolTimeoutError):
+        connections.acquire()
+
+
+def test_waiter_gets_a_released_connection():
+    connections = pool(max_size=1, acquire_timeout=5)
+    held = connections.acquire()
+    got = []
+    waiter = threading.Thread(target=lambda: got.append(connections.acquire()))
+    waiter.start()
+    connections.release(held)
+    waiter.join(5)
+    assert got == [held]
+
+
+def test_failed_caller_discards_its_connection():
+    connections = pool()
+    with pytest.raises(ValueError):
+        with connections.connection() as conn:
+            raise ValueError("bad query")
+    assert conn.closed
+    assert connections.stats()["open"] == 0
+
+
+def test_failed_open_frees_its_slot():
+    connections = pool(max_size=1)
+
+    def refuse():
+        raise ConnectionError("login failed")
+
+    connections._connect = refuse
+    with pytest.raises(ConnectionError):
+        connections.acquire()
+    assert connections.stats()["open"] == 0
+
+
+def test_unhealthy_idle_connection_is_replaced():
+    connections = pool(health_check_interval=0)
+    stale = connections.acquire()
+    connections.release(stale)
+    stale.conn.healthy = False
+
+    fresh = connections.acquire()
+
+    assert fresh is not stale
+    assert stale.conn.closed
+    assert connections.stats()["open"] == 1
+
+
+def test_warm_up_opens_min_size():
+    connections = pool(min_size=2, max_size=4)
+    connections.warm_up()
+    assert connections.stats() == {"open": 2, "idle": 2, "in_use": 0, "max_size": 4}
+
+
+def test_reap_idle_keeps_min_size():
+    connections = pool(min_size=1, max_size=3, idle_timeout=10)
+    held = [connections.acquire() for _ in range(3)]
+    for pooled in held:
+        connections.release(pooled)
+    for pooled in held:
+        pooled.last_used -= 60
+
+    assert connections.reap_idle() == 2
+    assert connections.stats()["open"] == 1
+    assert sum(pooled.conn.closed for pooled in held) == 2
+
+
+def test_reap_idle_leaves_recent_connections():
+    connections = pool(min_size=0)
+    connections.release(connections.acquire())
+    assert connections.reap_idle() == 0
+
+
+def test_close_closes_idle_and_returned_connections():
+    connections = pool()
+    idle, busy = connections.acquire(), connections.acquire()
+    connections.release(idle)
+
+    connections.close()
+    assert idle.conn.closed
+    with pytest.raises(RuntimeError):
+        connections.acquire()
+
+    connections.release(busy)
+    assert busy.conn.closed
+    assert connections.stats()["open"] == 0
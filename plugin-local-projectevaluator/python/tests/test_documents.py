@@ -0,0 +1,86 @@
+"""Process-pool text extraction of reference documents."""
+import asyncio
+import os
+import tempfile
+import time
+
+import pytest
+
+from documents import PDF_AVAILABLE, DocumentExtractionError, DocumentExtractor
+
+
+def make_pdf(pages: int) -> bytes:
+    """A minimal PDF with one line of text per page."""
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>"]
+    kids = " ".join(f"{3 + 2 * i} 0 R" for i in range(pages))
+    objects.append(f"<< /Type /Pages /Kids [{kids}] /Count {pages} >>".encode())
+    font = 3 + 2 * pages
+    for i in range(pages):
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents {4 + 2 * i} 0 R "
+            f"/Resources << /Font << /F1 {font} 0 R >> >> >>".encode()
+        )
+        stream = f"BT /F1 12 Tf 72 720 Td (Lecture notes page {i + 1}) Tj ET"
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream".encode())
+    objects.append(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+
+    out = b"%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n".encode() + body + b"\nendobj\n"
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    out += b"".join(f"{offset:010d} 00000 n \n".encode() for offset in offsets)
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    return out
+
+
+@pytest.fixture
+def extractor():
+    extractor = DocumentExtractor(workers=1, pages_per_task=2, timeout=60)
+    yield extractor
+    extractor.shutdown()
+
+
+@pytest.mark.skipif(not PDF_AVAILABLE, reason="PyPDF2 is not installed")
+def test_pdf_bytes_are_spilled_once(extractor, tmp_path, monkeypatch):
+    monkeypatch.setattr(tempfile, "tempdir", str(tmp_path))
+    data = make_pdf(5)
+    path = tmp_path / "notes.pdf"
+    path.write_bytes(data)
+
+    async def run():
+        return await extractor.extract("pdf", data), await extractor.extract("pdf", str(path))
+
+    from_bytes, from_path = asyncio.run(run())
+
+    assert from_bytes == from_path
+    assert [line for line in from_bytes.splitlines() if line] == [f"Lecture notes page {i}" for i in range(1, 6)]
+    # The temporary copy is gone once the document is extracted
+    assert os.listdir(tmp_path) == ["notes.pdf"]
+
+
+def test_timeout_recycles_the_pool(extractor):
+    extractor.timeout = 0.5
+
+    async def run():
+        executor = extractor.executor
+        loop = asyncio.get_running_loop()
+        stuck = loop.run_in_executor(executor, time.sleep, 60)
+        # Starting the worker can take a while under spawn; wait until it is busy
+        while not getattr(executor, "_processes", None):
+            await asyncio.sleep(0.05)
+        processes = list(executor._processes.values())
+
+        with pytest.raises(DocumentExtractionError, match="timed out"):
+            await extractor.extract("pdf", make_pdf(1))
+        stuck.cancel()
+        return executor, processes
+
+    executor, processes = asyncio.run(run())
+
+    assert extractor._executor is not executor
+    for process in processes:
+        process.join(5)
+        assert not process.is_alive()
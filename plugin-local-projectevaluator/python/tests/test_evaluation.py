@@ -0,0 +1,113 @@
+"""Extraction, validation and repair of the model's evaluation JSON."""
+import asyncio
+import json
+
+import pytest
+
+from evaluation import (
+    EvaluationParseError,
+    JSONObjectScanner,
+    build_repair_prompt,
+    parse_evaluation,
+    parse_or_repair,
+)
+
+
+def evaluation(code_quality=30, functionality_correctness=40, documentation=15, overall_score=None) -> dict:
+    return {
+        "overall_score": overall_score if overall_score is not None else code_quality + functionality_correctness + documentation,
+        "scores": {
+            "code_quality": code_quality,
+            "functionality_correctness": functionality_correctness,
+            "documentation": documentation,
+        },
+        "report": {
+            "strengths": ["Clear structure"],
+            "areas_of_improvement": ["Add tests"],
+            "summary": "A solid project.",
+        },
+    }
+
+
+def test_json_in_prose_and_code_fence():
+    text = "Here is my evaluation:\n```json\n" + json.dumps(evaluation()) + "\n```\nLet me know if you need more."
+    assert parse_evaluation(text)["overall_score"] == 85
+
+
+def test_braces_inside_strings():
+    data = evaluation()
+    data["report"]["summary"] = 'Uses "{" and "}" in f-strings like f"{name}" and \\"{escaped}\\".'
+    assert parse_evaluation(json.dumps(data))["report"]["summary"] == data["report"]["summary"]
+
+
+def test_scanner_across_chunks():
+    text = "prefix " + json.dumps(evaluation()) + " suffix {\"a\": 1}"
+    scanner = JSONObjectScanner()
+    objects = [obj for i in range(0, len(text), 7) for obj in scanner.feed(text[i:i + 7])]
+    assert [json.loads(obj) for obj in objects] == [evaluation(), {"a": 1}]
+
+
+def test_unrelated_objects_are_skipped():
+    text = 'The schema is {"type": "object"}. Result: ' + json.dumps(evaluation())
+    assert parse_evaluation(text)["scores"]["documentation"] == 15
+
+
+def test_overall_score_follows_categories():
+    result = parse_evaluation(json.dumps(evaluation(overall_score=99)))
+    assert result["overall_score"] == 85
+
+
+def test_single_string_bullets_become_lists():
+    data = evaluation()
+    data["report"]["strengths"] = "Readable code"
+    assert parse_evaluation(json.dumps(data))["report"]["strengths"] == ["Readable code"]
+
+
+@pytest.mark.parametrize("scores", [
+    {"code_quality": 36},
+    {"functionality_correctness": 46},
+    {"documentation": -1},
+])
+def test_out_of_range_scores_are_rejected(scores):
+    with pytest.raises(EvaluationParseError, match="schema validation failed"):
+        parse_evaluation(json.dumps(evaluation(**scores)))
+
+
+def test_no_json():
+    with pytest.raises(EvaluationParseError, match="no JSON object"):
+        parse_evaluation("I cannot evaluate this project.")
+
+
+def test_repair_prompt_keeps_the_response():
+    prompt = build_repair_prompt('{"overall_score": 80,', "invalid JSON")
+    assert "invalid JSON" in prompt
+    assert prompt.rstrip().endswith('{"overall_score": 80,')
+
+
+def test_valid_response_needs_no_repair():
+    async def complete(prompt):
+        raise AssertionError("no repair call expected")
+
+    assert asyncio.run(parse_or_repair(json.dumps(evaluation()), complete))["overall_score"] == 85
+
+
+def test_repair_call_fixes_response():
+    prompts = []
+
+    async def complete(prompt):
+        prompts.append(prompt)
+        return json.dumps(evaluation(documentation=10))
+
+    result = asyncio.run(parse_or_repair("Score: 80/100, well done", complete, attempts=1))
+
+    assert result["overall_score"] == 80
+    assert len(prompts) == 1
+    assert "Score: 80/100" in prompts[0]
+
+
+def test_unrepairable_response_raises():
+    async def complete(prompt):
+        return "still not JSON"
+
+    with pytest.raises(EvaluationParseError):
+        asyncio.run(parse_or_repair("not JSON", complete, attempts=2))
@@ -0,0 +1,197 @@
+"""Sandboxed pytest runs. The module is imported whole so pytest does not collect its Test* classes."""
+import asyncio
+import os
+import subprocess
+import time
+
+import pytest
+
+import execution
+from cache import DATA_DIR
+from ingest import SubmissionFile
+
+
+MODULE = SubmissionFile("project/cart.py", "def total(prices):\n    return sum(prices)\n")
+
+
+def run_tests(runner, test_source: str, files=(MODULE,)):
+    tests = SubmissionFile("test_checks.py", test_source)
+    return asyncio.run(runner.run(list(files), tests))
+
+
+def assert_passed(run):
+    assert run.count("passed") == len(run.cases) > 0, run.report()
+
+
+def namespaces_available() -> bool:
+    try:
+        subprocess.run([*execution.UNSHARE, "true"], check=True, capture_output=True, timeout=10)
+        return True
+    except (OSError, subprocess.SubprocessError):
+        return False
+
+
+@pytest.fixture
+def guard_runner(tmp_path):
+    return execution.TestRunner(network_isolation="guard", work_dir=str(tmp_path), timeout=30)
+
+
+def test_write_files_rejects_path_traversal(tmp_path):
+    directory = str(tmp_path / "submission")
+    os.makedirs(directory)
+    files = [
+        SubmissionFile("../escaped.py", "x = 1"),
+        SubmissionFile("a/../../escaped2.py", "x = 1"),
+        SubmissionFile(str(tmp_path / "absolute.py"), "x = 1"),
+        SubmissionFile("pkg/ok.py", "x = 1"),
+    ]
+
+    assert execution._write_files(directory, files) == 1
+    assert sorted(os.listdir(tmp_path)) == ["submission"]
+    assert os.listdir(os.path.join(directory, "pkg")) == ["ok.py"]
+
+
+def test_instructor_tests_import_the_submission(guard_runner):
+    run = run_tests(guard_runner, "from cart import total\n\ndef test_total():\n    assert total([1, 2]) == 3\n\ndef test_wrong():\n    assert total([1]) == 2\n")
+
+    assert run.source == "instructor"
+    assert run.count("passed") == 1
+    assert run.count("failed") == 1
+    assert run.outcome == "failed"
+
+
+def test_rlimits_are_applied(guard_runner):
+    run = run_tests(guard_runner, f"""
+import resource
+
+def test_limits():
+    assert resource.getrlimit(resource.RLIMIT_NOFILE) == ({execution.TEST_MAX_OPEN_FILES}, {execution.TEST_MAX_OPEN_FILES})
+    assert resource.getrlimit(resource.RLIMIT_AS)[0] == {execution.TEST_MEMORY_BYTES}
+    assert resource.getrlimit(resource.RLIMIT_FSIZE)[0] == {execution.TEST_MAX_FILE_BYTES}
+    assert resource.getrlimit(resource.RLIMIT_CPU)[0] == {execution.TEST_CPU_SECONDS}
+    assert resource.getrlimit(resource.RLIMIT_CORE) == (0, 0)
+
+def test_memory_is_capped():
+    try:
+        bytearray({execution.TEST_MEMORY_BYTES * 2})
+    except MemoryError:
+        return
+    raise AssertionError("allocation beyond RLIMIT_AS succeeded")
+""")
+    assert_passed(run)
+
+
+def test_environment_is_scrubbed(guard_runner, monkeypatch):
+    monkeypatch.setenv("SNOWFLAKE_PASSWORD", "hunter2")
+    run = run_tests(guard_runner, """
+import os
+
+def test_environment():
+    assert "SNOWFLAKE_PASSWORD" not in os.environ
+    assert set(os.environ) <= {
+        "PATH", "HOME", "TMPDIR", "LANG", "PYTHONPATH", "PYTHONDONTWRITEBYTECODE", "PYTHONHASHSEED",
+        "PYTEST_DISABLE_PLUGIN_AUTOLOAD", "PYTEST_CURRENT_TEST", "PYTEST_VERSION",
+    }
+    assert os.environ["TMPDIR"].startswith(os.environ["HOME"])
+""")
+    assert_passed(run)
+
+
+def test_guard_blocks_sockets(guard_runner):
+    run = run_tests(guard_runner, """
+import socket
+import pytest
+
+def test_no_connections():
+    with pytest.raises(OSError, match="disabled"):
+        socket.create_connection(("127.0.0.1", 9))
+""")
+    assert_passed(run)
+
+
+def test_timeout_kills_the_process_group(tmp_path):
+    runner = execution.TestRunner(network_isolation="guard", work_dir=str(tmp_path / "work"), timeout=3)
+    os.makedirs(runner.work_dir)
+    pid_file = tmp_path / "child.pid"
+    started = time.monotonic()
+
+    run = run_tests(runner, f"""
+import subprocess, time
+
+def test_hangs():
+    child = subprocess.Popen(["sleep", "300"])
+    with open({str(pid_file)!r}, "w") as handle:
+        handle.write(str(child.pid))
+    time.sleep(300)
+""")
+
+    assert run.timed_out
+    assert run.outcome == "timed_out"
+    assert time.monotonic() - started < 30
+    # The background child went down with the run
+    pid = int(pid_file.read_text())
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline:
+        try:
+            with open(f"/proc/{pid}/stat") as handle:
+                if handle.read().split(")")[-1].split()[0] == "Z":
+                    break
+        except FileNotFoundError:
+            break
+        time.sleep(0.1)
+    else:
+        pytest.fail(f"process {pid} outlived the test run")
+
+
+def test_unknown_isolation_is_refused():
+    runner = execution.TestRunner(network_isolation="none")
+    with pytest.raises(execution.TestRunError, match="unknown"):
+        asyncio.run(runner.run([MODULE], SubmissionFile("test_x.py", "def test_x(): pass")))
+
+
+def test_missing_namespaces_are_refused(monkeypatch):
+    # Fail closed: without namespaces the tests are not run at all
+    monkeypatch.setattr(execution, "UNSHARE", ["false"])
+    runner = execution.TestRunner()
+    with pytest.raises(execution.TestRunError, match="namespaces"):
+        asyncio.run(runner.run([MODULE], SubmissionFile("test_x.py", "def test_x(): pass")))
+
+
+@pytest.mark.skipif(not namespaces_available(), reason="user namespaces are not available here")
+def test_namespace_sandbox(tmp_path):
+    os.makedirs(DATA_DIR, exist_ok=True)
+    secret = os.path.join(DATA_DIR, "secret.txt")
+    with open(secret, "w") as handle:
+        handle.write("token")
+    outside = tmp_path / "outside"
+    outside.mkdir()
+    runner = execution.TestRunner(work_dir=str(tmp_path / "work"), timeout=30)
+    os.makedirs(runner.work_dir)
+
+    run = run_tests(runner, f"""
+import os, socket, tempfile
+import pytest
+
+def test_network_is_unreachable():
+    with pytest.raises(OSError):
+        socket.create_connection(("1.1.1.1", 80), timeout=2)
+
+def test_data_dir_is_hidden():
+    assert not os.path.exists({secret!r})
+
+def test_filesystem_is_read_only():
+    with pytest.raises(OSError):
+        open({str(outside / "written.txt")!r}, "w")
+
+def test_workspace_is_writable():
+    with tempfile.NamedTemporaryFile() as handle:
+        handle.write(b"ok")
+
+def test_service_processes_are_invisible():
+    # Only the sandbox's own processes: unshare's child, the shell it exec'd into, pytest
+    assert len([name for name in os.listdir("/proc") if name.isdigit()]) < 5
+""")
+
+    assert run.network_isolation == "namespace"
+    assert_passed(run)
+    assert os.listdir(outside) == []
@@ -0,0 +1,127 @@
+"""Ignore rules and binary detection for archive members."""
+import io
+import zipfile
+
+import pytest
+
+from filters import IgnoreMatcher, is_binary_name, looks_binary
+from ingest import ingest_archive
+
+
+@pytest.mark.parametrize("path", [
+    "node_modules/react/index.js",
+    "project/node_modules/react/index.js",
+    ".git/HEAD",
+    "src/__pycache__/app.cpython-311.pyc",
+    "package-lock.json",
+    "static/app.min.js",
+    "dist/bundle.js",
+    "api/target/classes/App.txt",
+])
+def test_default_rules_ignore(path):
+    assert IgnoreMatcher().is_ignored(path)
+
+
+@pytest.mark.parametrize("path", [
+    "src/app.py",
+    "README.md",
+    "src/distance.py",       # "dist/" matches directories only
+    "docs/node_modules.md",
+    # Generic directory names that often hold the student's own code
+    "bin/cli.py",
+    "build/build_index.py",
+    "env/settings.py",
+    "out/report.py",
+    "vendor/mylib/parser.py",
+])
+def test_default_rules_keep(path):
+    assert not IgnoreMatcher().is_ignored(path)
+
+
+def test_gitignore_is_scoped_to_its_directory():
+    matcher = IgnoreMatcher(patterns=[])
+    matcher.add_gitignore("web/.gitignore", b"# comment\n*.log\n/config.local.js\ntmp/\n")
+
+    assert matcher.is_ignored("web/debug.log")
+    assert matcher.is_ignored("web/sub/debug.log")
+    assert matcher.is_ignored("web/config.local.js")
+    assert not matcher.is_ignored("web/sub/config.local.js")  # anchored to web/
+    assert matcher.is_ignored("web/tmp/cache.txt")
+    assert not matcher.is_ignored("api/debug.log")
+
+
+def test_last_matching_rule_wins():
+    matcher = IgnoreMatcher(patterns=[])
+    matcher.add_gitignore(".gitignore", b"*.txt\n!keep.txt\n")
+    assert matcher.is_ignored("notes.txt")
+    assert not matcher.is_ignored("keep.txt")
+
+
+def test_no_reinclusion_inside_ignored_directory():
+    matcher = IgnoreMatcher(patterns=[])
+    matcher.add_gitignore(".gitignore", b"logs/\n!logs/keep.txt\n")
+    assert matcher.is_ignored("logs/keep.txt")
+
+
+def test_submission_cannot_override_service_rules():
+    matcher = IgnoreMatcher()
+    matcher.add_gitignore(".gitignore", b"!node_modules/\n")
+    assert matcher.is_ignored("node_modules/lib/index.js")
+
+
+def test_gitignore_can_exclude_generic_directories():
+    matcher = IgnoreMatcher()
+    matcher.add_gitignore(".gitignore", b"build/\nvendor/\n")
+    assert matcher.is_ignored("build/lib/app.py")
+    assert matcher.is_ignored("vendor/autoload.php")
+    assert not matcher.is_ignored("bin/cli.py")
+
+
+def test_gitignore_can_be_disabled():
+    matcher = IgnoreMatcher(patterns=[], honor_gitignore=False)
+    matcher.add_gitignore(".gitignore", b"*.py\n")
+    assert not matcher.is_ignored("app.py")
+
+
+def test_double_star_and_character_class():
+    matcher = IgnoreMatcher(patterns=["docs/**/draft-[0-9].md"])
+    assert matcher.is_ignored("docs/draft-1.md")
+    assert matcher.is_ignored("docs/a/b/draft-2.md")
+    assert not matcher.is_ignored("docs/draft-x.md")
+
+
+def test_binary_names():
+    assert is_binary_name("assets/logo.PNG")
+    assert is_binary_name("model.pkl")
+    assert not is_binary_name("main.py")
+    assert not is_binary_name("Makefile")
+
+
+@pytest.mark.parametrize("head,binary", [
+    (b"\x89PNG\r\n\x1a\n\x00\x00", True),
+    (b"\x7fELF\x02\x01\x01", True),
+    (b"text with a \x00 byte", True),
+    (b"BMI calculator\nweight = 70\n", False),  # "BM" without a NUL is text
+    (b"MZ\x90\x00\x03\x00", True),
+    (b"def main():\n    pass\n", False),
+])
+def test_looks_binary(head, binary):
+    assert looks_binary(head) == binary
+
+
+def test_ingest_applies_rules():
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as zf:
+        # Listed before the .gitignore, which still applies to it
+        zf.writestr("app/secret.env", "TOKEN=1\n")
+        zf.writestr("app/.gitignore", "*.env\n")
+        zf.writestr("app/main.py", "print('hi')\n")
+        zf.writestr("app/node_modules/x/index.js", "module.exports = 1\n")
+        zf.writestr("app/data.txt", b"header\x00\x01binary payload")
+    buffer.seek(0)
+
+    result = ingest_archive("project.zip", buffer)
+
+    assert sorted(f.path for f in result.files) == ["app/.gitignore", "app/main.py"]
+    assert result.ignored == 2
+    assert result.skipped == ["app/data.txt"]  # sniffed as binary
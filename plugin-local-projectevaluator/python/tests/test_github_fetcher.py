@@ -0,0 +1,153 @@
+"""GitHubFetcher against a local stub of the GitHub REST API."""
+import asyncio
+import io
+import json
+import tarfile
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from cache import SQLiteCache
+from github_fetcher import GitHubError, GitHubFetcher, read_repository_tarball
+
+
+SHA = "abc123"
+
+
+def make_tarball(files: dict) -> bytes:
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w:gz") as tar:
+        for path, content in files.items():
+            data = content.encode()
+            info = tarfile.TarInfo(f"octo-demo-{SHA}/{path}")
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+    return buffer.getvalue()
+
+
+class StubGitHub:
+    """Serves canned responses and records every request path."""
+
+    def __init__(self):
+        self.routes = {}      # path -> (status, body bytes, etag)
+        self.failures = {}    # path -> statuses to answer first, one per request
+        self.requests = Counter()
+        self.conditional = Counter()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                stub.requests[self.path] += 1
+                failures = stub.failures.get(self.path)
+                if failures:
+                    self._send(failures.pop(0), b"{}")
+                    return
+                if self.path not in stub.routes:
+                    self._send(404, b'{"message": "Not Found"}')
+                    return
+                status, body, etag = stub.routes[self.path]
+                if etag and self.headers.get("If-None-Match") == etag:
+                    stub.conditional[self.path] += 1
+                    self._send(304, b"", etag)
+                    return
+                self._send(status, body, etag)
+
+            def _send(self, status, body, etag=None):
+                self.send_response(status)
+                if etag:
+                    self.send_header("ETag", etag)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def json(self, path: str, data, etag: str = None):
+        self.routes[path] = (200, json.dumps(data).encode(), etag)
+
+    def raw(self, path: str, body: bytes):
+        self.routes[path] = (200, body, None)
+
+
+@pytest.fixture
+def stub():
+    server = StubGitHub()
+    server.json("/repos/octo/demo", {"full_name": "octo/demo", "description": "Demo"}, etag='"repo-v1"')
+    server.json("/repos/octo/demo/commits?per_page=10", [{"sha": SHA, "commit": {"message": "init"}}], etag='"commits-v1"')
+    server.json("/repos/octo/demo/languages", {"Python": 120}, etag='"languages-v1"')
+    server.raw(f"/repos/octo/demo/tarball/{SHA}", make_tarball({
+        "main.py": "print('hello')\n",
+        "README.md": "# Demo\n",
+        "node_modules/left-pad/index.js": "module.exports = 1\n",
+    }))
+    server.thread.start()
+    yield server
+    server.server.shutdown()
+    server.server.server_close()
+
+
+@pytest.fixture
+def fetcher(stub, tmp_path):
+    fetcher = GitHubFetcher(
+        api_url=stub.url,
+        token=None,
+        etag_cache=SQLiteCache(str(tmp_path / "etags.sqlite3")),
+        tarball_dir=str(tmp_path / "tarballs"),
+    )
+    yield fetcher
+    asyncio.run(fetcher.close())
+
+
+def fetch(fetcher, owner="octo", repo="demo"):
+    async def run():
+        try:
+            return await fetcher.fetch_repository(owner, repo)
+        finally:
+            # Each asyncio.run gets a new loop; the pooled client cannot outlive it
+            await fetcher.close()
+    return asyncio.run(run())
+
+
+def test_fetch_repository_downloads_metadata_and_code(stub, fetcher):
+    repository = fetch(fetcher)
+
+    assert repository.repo_data["full_name"] == "octo/demo"
+    assert repository.sha == SHA
+    assert repository.languages == {"Python": 120}
+    result = read_repository_tarball(repository.tarball_path)
+    assert sorted(f.path for f in result.files) == ["README.md", "main.py"]
+    assert result.ignored == 1
+
+
+def test_refetch_uses_etags_and_cached_tarball(stub, fetcher):
+    first = fetch(fetcher)
+    second = fetch(fetcher)
+
+    assert second.repo_data == first.repo_data
+    assert second.tarball_path == first.tarball_path
+    assert stub.conditional["/repos/octo/demo"] == 1
+    assert stub.conditional["/repos/octo/demo/commits?per_page=10"] == 1
+    assert stub.requests[f"/repos/octo/demo/tarball/{SHA}"] == 1
+
+
+def test_missing_repository_raises_404(stub, fetcher):
+    with pytest.raises(GitHubError) as excinfo:
+        fetch(fetcher, repo="missing")
+    assert excinfo.value.status_code == 404
+
+
+def test_transient_errors_are_retried(stub, fetcher):
+    stub.failures["/repos/octo/demo"] = [503, 502]
+
+    repository = fetch(fetcher)
+
+    assert repository.repo_data["full_name"] == "octo/demo"
+    assert stub.requests["/repos/octo/demo"] == 3
+    assert fetcher.breaker.state == "closed"
@@ -0,0 +1,82 @@
+"""Diffing a resubmission against the student's previous one."""
+import pytest
+
+from cache import SQLiteCache
+from incremental import SubmissionHistory, format_unchanged_for_llm
+from ingest import SubmissionFile
+
+
+FIRST = [
+    SubmissionFile("cart.py", "def total(prices):\n    return sum(prices)\n"),
+    SubmissionFile("README.md", "# Cart"),
+    SubmissionFile("old.py", "x = 1\n"),
+]
+EVALUATION = {"scores": {"functionality": 70, "style": 80}}
+NOTES = {"cart.py": "  Sums prices; no discount handling.  ", "README.md": "Short readme.", "old.py": "Unused."}
+
+
+@pytest.fixture
+def history(tmp_path):
+    return SubmissionHistory(SQLiteCache(str(tmp_path / "history.sqlite3")))
+
+
+def test_first_submission_has_no_diff(history):
+    assert history.diff(7, 42, "criteria-v1", FIRST) is None
+
+
+def test_resubmission_sends_only_changed_files(history):
+    history.record(7, 42, "criteria-v1", FIRST, EVALUATION, NOTES)
+    second = [
+        SubmissionFile("cart.py", "def total(prices, discount=0):\n    return sum(prices) - discount\n"),
+        SubmissionFile("README.md", "# Cart"),
+        SubmissionFile("discount.py", "RATE = 0.1\n"),
+    ]
+
+    diff = history.diff(7, 42, "criteria-v1", second)
+
+    assert [f.path for f in diff.changed] == ["cart.py", "discount.py"]
+    assert diff.unchanged == {"README.md": "Short readme."}
+    assert diff.removed == ["old.py"]
+    assert diff.previous_scores == EVALUATION["scores"]
+    assert diff.report() == {"changed": 2, "unchanged": 1, "removed": 1}
+
+
+def test_other_criteria_or_students_start_over(history):
+    history.record(7, 42, "criteria-v1", FIRST, EVALUATION, NOTES)
+
+    assert history.diff(7, 42, "criteria-v2", FIRST) is None
+    assert history.diff(7, 43, "criteria-v1", FIRST) is None
+    assert history.diff(8, 42, "criteria-v1", FIRST) is None
+
+
+def test_file_without_a_note_is_sent_again(history):
+    history.record(7, 42, "criteria-v1", FIRST, EVALUATION, {"cart.py": "Fine.", "README.md": "   "})
+
+    diff = history.diff(7, 42, "criteria-v1", FIRST)
+
+    assert diff.unchanged == {"cart.py": "Fine."}
+    assert sorted(f.path for f in diff.changed) == ["README.md", "old.py"]
+
+
+def test_notes_carry_over_across_resubmissions(history):
+    history.record(7, 42, "criteria-v1", FIRST, EVALUATION, NOTES)
+    second = FIRST[:2] + [SubmissionFile("new.py", "y = 2\n")]
+    diff = history.diff(7, 42, "criteria-v1", second)
+    # The model only wrote notes for the changed file this time; notes for paths no longer submitted are dropped
+    history.record(7, 42, "criteria-v1", second, EVALUATION, {"new.py": "Adds y.", "old.py": "stale"}, diff)
+
+    third = history.diff(7, 42, "criteria-v1", second)
+
+    assert third.changed == []
+    assert third.unchanged == {"cart.py": "Sums prices; no discount handling.", "README.md": "Short readme.", "new.py": "Adds y."}
+
+
+def test_unchanged_section_of_the_prompt(history):
+    history.record(7, 42, "criteria-v1", FIRST, EVALUATION, NOTES)
+    diff = history.diff(7, 42, "criteria-v1", FIRST[:2])
+
+    text = format_unchanged_for_llm(diff)
+
+    assert "- cart.py: Sums prices; no discount handling." in text
+    assert "Files removed since the previous submission: old.py" in text
+    assert "functionality 70, style 80" in text
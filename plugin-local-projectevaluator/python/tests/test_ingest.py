@@ -0,0 +1,105 @@
+"""Budgets and limits of archive ingestion."""
+import io
+import tarfile
+import zipfile
+
+import pytest
+
+from ingest import ArchiveLimitError, IngestLimits, format_files_for_llm, ingest_archive
+
+
+def make_zip(files: dict) -> io.BytesIO:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as zf:
+        for path, content in files.items():
+            zf.writestr(path, content)
+    buffer.seek(0)
+    return buffer
+
+
+def make_tar_gz(files: dict) -> io.BytesIO:
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w:gz") as tar:
+        for path, content in files.items():
+            data = content.encode() if isinstance(content, str) else content
+            info = tarfile.TarInfo(path)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+    buffer.seek(0)
+    return buffer
+
+
+def paths(result) -> list:
+    return sorted(f.path for f in result.files)
+
+
+def test_reads_text_files_from_zip_and_tar():
+    files = {"main.py": "print('hi')\n", "src/util.py": "X = 1\n", "logo.png": b"\x89PNG\r\n\x1a\n"}
+    for name, archive in (("project.zip", make_zip(files)), ("project.tar.gz", make_tar_gz(files))):
+        result = ingest_archive(name, archive)
+        assert paths(result) == ["main.py", "src/util.py"]
+        assert result.skipped == ["logo.png"]
+
+
+def test_per_file_budget():
+    archive = make_zip({"small.py": "x = 1\n", "big.py": "y = 2\n" * 1000})
+    result = ingest_archive("project.zip", archive, IngestLimits(max_file_bytes=1000))
+    assert paths(result) == ["small.py"]
+    assert result.skipped == ["big.py"]
+
+
+def test_per_file_budget_in_tar_stream():
+    # Large enough to need more than the sniffed head
+    archive = make_tar_gz({"big.txt": "z" * 20000, "small.txt": "ok"})
+    result = ingest_archive("project.tar.gz", archive, IngestLimits(max_file_bytes=10000))
+    assert paths(result) == ["small.txt"]
+    assert result.skipped == ["big.txt"]
+
+
+def test_total_budget_skips_the_rest():
+    files = {f"file{i}.txt": "a" * 3000 for i in range(5)}
+    result = ingest_archive("project.zip", make_zip(files), IngestLimits(max_total_bytes=7000))
+    assert len(result.files) == 2
+    assert result.budget_exhausted
+    assert len(result.skipped) == 3
+    assert "exceeded the size budget" in format_files_for_llm(result)
+
+
+def test_member_limit():
+    files = {f"file{i}.txt": "x" for i in range(6)}
+    with pytest.raises(ArchiveLimitError):
+        ingest_archive("project.zip", make_zip(files), IngestLimits(max_members=5))
+
+
+def test_zip_compression_ratio_guard():
+    data = "a" * (2 * 1024 * 1024)
+    limits = IngestLimits(max_file_bytes=4 * 1024 * 1024)
+    result = ingest_archive("project.zip", make_zip({"bomb.txt": data}), limits)
+    assert result.skipped == ["bomb.txt"]
+
+    limits.max_compression_ratio = 100000
+    result = ingest_archive("project.zip", make_zip({"bomb.txt": data}), limits)
+    assert paths(result) == ["bomb.txt"]
+
+
+def test_tar_compression_ratio_guard():
+    archive = make_tar_gz({"bomb.bin": b"\x00" * (4 * 1024 * 1024), "after.txt": "x"})
+    with pytest.raises(ArchiveLimitError, match="compression ratio"):
+        ingest_archive("project.tar.gz", archive)
+
+
+def test_tar_expanded_size_limit():
+    archive = make_tar_gz({"a.txt": "a" * 5000, "b.txt": "b" * 5000})
+    with pytest.raises(ArchiveLimitError, match="expands"):
+        ingest_archive("project.tar.gz", archive, IngestLimits(max_expanded_bytes=8000))
+
+
+def test_nested_zips_up_to_depth():
+    inner = make_zip({"inner.py": "inner = 1\n"}).getvalue()
+    middle = make_zip({"middle.py": "middle = 1\n", "inner.zip": inner}).getvalue()
+    archive = make_zip({"outer.py": "outer = 1\n", "middle.zip": middle})
+
+    result = ingest_archive("project.zip", archive, IngestLimits(max_nesting_depth=1))
+
+    assert paths(result) == ["middle.zip/middle.py", "outer.py"]
+    assert result.skipped == ["middle.zip/inner.zip"]
@@ -0,0 +1,229 @@
+"""The persistent job queue: running, cancelling and resuming after a restart."""
+import asyncio
+
+import pytest
+
+from jobs import JobQueue, JobStore
+
+
+class HTTPError(Exception):
+    def __init__(self, status_code: int, detail: str):
+        self.status_code = status_code
+        self.detail = detail
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "jobs.sqlite3")
+
+
+async def settle(queue: JobQueue, job_id: str) -> dict:
+    return await queue.wait(job_id, timeout=5)
+
+
+def test_job_runs_and_removes_its_upload(db_path, tmp_path):
+    upload = tmp_path / "upload.zip"
+    upload.write_bytes(b"zip")
+    seen = []
+
+    async def evaluate(params, upload_path):
+        seen.append((params, upload_path))
+        return {"score": params["score"]}
+
+    async def run():
+        queue = JobQueue(JobStore(db_path), {"evaluate": evaluate}, workers=1)
+        await queue.start()
+        job = queue.submit("evaluate", {"score": 80}, str(upload))
+        assert job["status"] == "queued"
+        done = await settle(queue, job["id"])
+        await queue.stop()
+        return done
+
+    job = asyncio.run(run())
+
+    assert job["status"] == "completed"
+    assert job["result"] == {"score": 80}
+    assert job["attempts"] == 1
+    assert seen == [({"score": 80}, str(upload))]
+    assert not upload.exists()
+
+
+def test_handler_errors_fail_the_job(db_path):
+    async def evaluate(params, upload_path):
+        raise HTTPError(422, "not a zip archive")
+
+    async def run():
+        queue = JobQueue(JobStore(db_path), {"evaluate": evaluate}, workers=1)
+        await queue.start()
+        job = await settle(queue, queue.submit("evaluate", {})["id"])
+        await queue.stop()
+        return job
+
+    job = asyncio.run(run())
+
+    assert job["status"] == "failed"
+    assert (job["error"], job["status_code"]) == ("not a zip archive", 422)
+
+
+def test_cancel_stops_a_running_job(db_path):
+    started = []
+
+    async def evaluate(params, upload_path):
+        started.append(True)
+        await asyncio.sleep(60)
+
+    async def run():
+        queue = JobQueue(JobStore(db_path), {"evaluate": evaluate}, workers=1)
+        await queue.start()
+        job_id = queue.submit("evaluate", {})["id"]
+        while not started:
+            await asyncio.sleep(0.01)
+        queue.cancel(job_id)
+        job = await settle(queue, job_id)
+        while job_id in queue._running:
+            await asyncio.sleep(0.01)
+        await queue.stop()
+        return job
+
+    assert asyncio.run(run())["status"] == "cancelled"
+
+
+def test_interrupted_job_is_resumed_after_restart(db_path):
+    async def first_process():
+        running = asyncio.Event()
+
+        async def evaluate(params, upload_path):
+            running.set()
+            await asyncio.sleep(60)
+
+        queue = JobQueue(JobStore(db_path), {"evaluate": evaluate}, workers=1)
+        await queue.start()
+        running_id = queue.submit("evaluate", {"n": 1})["id"]
+        await running.wait()
+        queued_id = queue.submit("evaluate", {"n": 2})["id"]
+        await queue.stop()
+        queue.store.close()
+        return running_id, queued_id
+
+    running_id, queued_id = asyncio.run(first_process())
+
+    async def second_process():
+        async def evaluate(params, upload_path):
+            return {"n": params["n"]}
+
+        queue = JobQueue(JobStore(db_path), {"evaluate": evaluate}, workers=1)
+        interrupted = queue.get(running_id)
+        await queue.start()
+        jobs = [await settle(queue, running_id), await settle(queue, queued_id)]
+        await queue.stop()
+        return interrupted, jobs
+
+    interrupted, (resumed, queued) = asyncio.run(second_process())
+
+    # Shutdown leaves the job 'running' in the store; the next start requeues it
+    assert interrupted["status"] == "running"
+    assert (resumed["status"], resumed["result"], resumed["attempts"]) == ("completed", {"n": 1}, 2)
+    assert (queued["status"], queued["result"], queued["attempts"]) == ("completed", {"n": 2}, 1)
+
+
+def test_unknown_kind_is_rejected(db_path):
+    async def run():
+        queue = JobQueue(JobStore(db_path), {}, workers=1)
+        await queue.start()
+        try:
+            queue.submit("evaluate", {})
+        finally:
+            await queue.stop()
+
+    with pytest.raises(ValueError, match="Unknown job kind"):
+        asyncio.run(run())
+
+
+def test_stop_right_after_cancel_does_not_hang(db_path, tmp_path):
+    upload = tmp_path / "upload.zip"
+    upload.write_bytes(b"zip")
+    started = []
+
+    async def evaluate(params, upload_path):
+        started.append(True)
+        await asyncio.sleep(60)
+
+    async def run():
+        queue = JobQueue(JobStore(db_path), {"evaluate": evaluate}, workers=1)
+        await queue.start()
+        job_id = queue.submit("evaluate", {}, str(upload))["id"]
+        while not started:
+            await asyncio.sleep(0.01)
+        queue.cancel(job_id)
+        await asyncio.wait_for(queue.stop(), timeout=5)
+        return queue.get(job_id)
+
+    assert asyncio.run(run())["status"] == "cancelled"
+    assert not upload.exists()
+
+
+def test_waiters_leave_no_events_behind(db_path):
+    release = []
+
+    async def evaluate(params, upload_path):
+        while not release:
+            await asyncio.sleep(0.01)
+        return {}
+
+    async def run():
+        queue = JobQueue(JobStore(db_path), {"evaluate": evaluate}, workers=1)
+        await queue.start()
+        job_id = queue.submit("evaluate", {})["id"]
+
+        # Long-polls that time out drop their event with them
+        timed_out = await asyncio.gather(*(queue.wait(job_id, timeout=0.05) for _ in range(3)))
+        after_timeouts = dict(queue._done_events), dict(queue._waiters)
+
+        waiters = [asyncio.create_task(queue.wait(job_id, timeout=5)) for _ in range(2)]
+        await asyncio.sleep(0.05)
+        release.append(True)
+        finished = await asyncio.gather(*waiters)
+        after_finish = dict(queue._done_events), dict(queue._waiters)
+        await queue.stop()
+        return timed_out, after_timeouts, finished, after_finish
+
+    timed_out, after_timeouts, finished, after_finish = asyncio.run(run())
+
+    assert [job["status"] for job in timed_out] == ["running"] * 3
+    assert after_timeouts == ({}, {})
+    assert [job["status"] for job in finished] == ["completed"] * 2
+    assert after_finish == ({}, {})
+
+
+def test_job_interrupted_too_often_is_failed(db_path, tmp_path):
+    upload = tmp_path / "upload.zip"
+    upload.write_bytes(b"zip")
+    runs = []
+
+    async def crash_each_time(params, upload_path):
+        runs.append(True)
+        await asyncio.sleep(60)
+
+    async def restart(job_id=None):
+        queue = JobQueue(JobStore(db_path), {"evaluate": crash_each_time}, workers=1, max_attempts=2)
+        await queue.start()
+        if job_id is None:
+            job_id = queue.submit("evaluate", {}, str(upload))["id"]
+        started = len(runs)
+        for _ in range(100):
+            if len(runs) > started or queue.get(job_id)["status"] == "failed":
+                break
+            await asyncio.sleep(0.01)
+        await queue.stop()
+        queue.store.close()
+        return job_id
+
+    job_id = asyncio.run(restart())
+    asyncio.run(restart(job_id))
+    asyncio.run(restart(job_id))
+
+    job = JobStore(db_path).get(job_id)
+    assert len(runs) == 2
+    assert (job["status"], job["attempts"], job["status_code"]) == ("failed", 2, 500)
+    assert "interrupted 2 times" in job["error"]
+    assert not upload.exists()
@@ -0,0 +1,124 @@
+"""Chunking large submissions and merging the per-chunk findings."""
+import asyncio
+import json
+
+import pytest
+
+from ingest import SubmissionFile
+from mapreduce import MapReduceError, build_map_prompt, map_chunks, needs_map_reduce, split_into_chunks
+from packing import estimate_tokens
+
+
+def module(path: str, functions: int = 20) -> SubmissionFile:
+    body = "\n".join(f"def handler_{i}(request):\n    return request.get({i})" for i in range(functions))
+    return SubmissionFile(path, body)
+
+
+FILES = [
+    module("api/routes.py"),
+    module("models/user.py"),
+    module("api/auth.py"),
+    module("models/order.py"),
+    SubmissionFile("README.md", "# Shop"),
+]
+
+
+def findings_for(prompt: str, notes: dict) -> str:
+    return "Findings follow.\n" + json.dumps({"summary": "part", "requirements_met": ["routing"], "file_notes": notes})
+
+
+def test_needs_map_reduce_counts_only_reviewable_files():
+    big = [module("src/a.py", 200), module("node_modules/lib/index.py", 2000)]
+
+    assert needs_map_reduce(big, token_budget=5_000) is False
+    assert needs_map_reduce(big, token_budget=100) is True
+    assert needs_map_reduce(big, token_budget=100, boilerplate={"src/a.py": "generated"}) is False
+
+
+def test_chunks_respect_the_size_and_keep_directories_together():
+    chunk_tokens = max(f.tokens for f in split_into_chunks(FILES, chunk_tokens=10_000).packed.files) * 2 + 10
+
+    chunked = split_into_chunks(FILES, chunk_tokens=chunk_tokens)
+
+    assert [[f.path for f in chunk] for chunk in chunked.chunks] == [
+        ["README.md", "api/auth.py"],
+        ["api/routes.py", "models/order.py"],
+        ["models/user.py"],
+    ]
+    assert all(sum(f.tokens for f in chunk) <= chunk_tokens for chunk in chunked.chunks)
+    assert chunked.report()["chunks"] == 3
+
+
+def test_file_larger_than_a_chunk_is_summarized():
+    chunked = split_into_chunks([module("engine.py", 400)], chunk_tokens=600)
+
+    [[packed_file]] = chunked.chunks
+    assert packed_file.status == "summarized"
+    assert packed_file.tokens <= 600
+    assert chunked.report()["summarized"] == ["engine.py"]
+
+
+def test_map_budget_drops_the_least_relevant_files():
+    chunked = split_into_chunks(FILES, chunk_tokens=10_000, token_budget=estimate_tokens(FILES[0].content) * 2)
+
+    assert chunked.packed.dropped
+    assert len(chunked.packed.files) + len(chunked.packed.dropped) == len(FILES)
+
+
+def test_map_prompts_share_the_criteria_prefix():
+    first = build_map_prompt("Build a shop API", "code one", 1, 2)
+    second = build_map_prompt("Build a shop API", "code two", 2, 2)
+
+    assert first.prefix == second.prefix
+    assert "Build a shop API" in first.prefix
+    assert "PART 2 OF 2" in second.suffix
+
+
+def test_findings_are_merged_in_part_order():
+    chunked = split_into_chunks(FILES, chunk_tokens=1)  # one file per chunk
+    prompts = []
+
+    async def complete(prompt):
+        prompts.append(prompt)
+        part = prompt.suffix.split("PART ")[1].split(" OF")[0]
+        # Reviewers finish out of order, and may note files outside their part
+        await asyncio.sleep(0.01 * (len(chunked.chunks) - int(part)))
+        path = [f.path for f in chunked.chunks[int(part) - 1]][0]
+        return findings_for(prompt, {path: f"note {part}", "elsewhere.py": "ignored"})
+
+    text, notes = asyncio.run(map_chunks("Build a shop API", chunked, complete))
+
+    total = len(chunked.chunks)
+    headers = [line for line in text.splitlines() if line.startswith("--- FINDINGS")]
+    assert headers == [f"--- FINDINGS FOR PART {i} OF {total} (files: {chunk[0].path}) ---" for i, chunk in enumerate(chunked.chunks, 1)]
+    assert notes == {chunk[0].path: f"note {i}" for i, chunk in enumerate(chunked.chunks, 1)}
+    assert "file_notes" not in text
+    assert len(prompts) == total
+
+
+def test_map_calls_are_bounded():
+    chunked = split_into_chunks(FILES, chunk_tokens=1)
+    running, peak = [0], [0]
+
+    async def complete(prompt):
+        running[0] += 1
+        peak[0] = max(peak[0], running[0])
+        await asyncio.sleep(0.02)
+        running[0] -= 1
+        return "plain text findings"
+
+    text, notes = asyncio.run(map_chunks("criteria", chunked, complete, concurrency=2))
+
+    assert peak[0] == 2
+    assert "plain text findings" in text  # non-JSON output is kept as text
+    assert notes == {}
+
+
+def test_missing_response_fails_the_evaluation():
+    chunked = split_into_chunks(FILES, chunk_tokens=1)
+
+    async def complete(prompt):
+        return None if "PART 2 OF" in prompt else "ok"
+
+    with pytest.raises(MapReduceError, match="part 2 of"):
+        asyncio.run(map_chunks("criteria", chunked, complete))
@@ -0,0 +1,106 @@
+"""Relevance-ranked packing of submission files into a token budget."""
+from ingest import SubmissionFile
+from packing import estimate_tokens, format_packed_for_llm, pack_files, summarize_file
+
+
+def source(lines: int, name: str = "helper") -> str:
+    return "\n".join(f"def {name}_{i}(value):\n    return value + {i}" for i in range(lines))
+
+
+def cost(submission_file: SubmissionFile) -> int:
+    return estimate_tokens(submission_file.content) + estimate_tokens(submission_file.path) + 8
+
+
+def test_everything_fits_in_a_large_budget():
+    files = [SubmissionFile("README.md", "# Cart"), SubmissionFile("cart.py", source(3))]
+
+    packed = pack_files(files, token_budget=10_000)
+
+    assert packed.report()["included"] == ["README.md", "cart.py"]
+    assert packed.tokens_used == sum(cost(f) for f in files)
+
+
+def test_budget_is_never_exceeded():
+    files = [SubmissionFile(f"module_{i}.py", source(40)) for i in range(20)]
+
+    packed = pack_files(files, token_budget=2_000)
+
+    assert packed.tokens_used <= 2_000
+    assert sum(f.tokens for f in packed.files) == packed.tokens_used
+    assert packed.dropped
+    assert len(packed.files) + len(packed.dropped) == 20
+
+
+def test_relevant_files_win_the_budget():
+    files = [
+        SubmissionFile("notes/scratch.txt", "nothing interesting " * 40),
+        SubmissionFile("src/inventory.py", source(10, "inventory") + "\n# inventory reorder threshold"),
+    ]
+    budget = cost(files[1]) + 5
+
+    packed = pack_files(files, criteria="Implement inventory reorder thresholds", token_budget=budget)
+
+    assert packed.report()["included"] == ["src/inventory.py"]
+    assert packed.dropped == ["notes/scratch.txt"]
+
+
+def test_oversized_file_is_summarized():
+    big = SubmissionFile("main.py", source(400))
+
+    packed = pack_files([big], token_budget=500)
+
+    [packed_file] = packed.files
+    assert packed_file.status == "summarized"
+    assert packed_file.tokens <= 500
+    assert "Definitions in this file:" in packed_file.content
+
+
+def test_summary_keeps_the_head_and_outline():
+    summary = summarize_file(source(400), token_limit=200)
+
+    assert summary.startswith("def helper_0(value):")
+    assert "remainder omitted" in summary
+    assert estimate_tokens(summary) <= 220
+
+
+def test_vendored_and_boilerplate_files_are_left_out():
+    files = [
+        SubmissionFile("node_modules/left-pad/index.js", "module.exports = 1"),
+        SubmissionFile("static/app.min.js", "var a=1"),
+        SubmissionFile("src/schema_gen.py", "x = 1"),
+        SubmissionFile("cart.py", source(2)),
+    ]
+
+    packed = pack_files(files, token_budget=10_000, boilerplate={"src/schema_gen.py": "generated"})
+
+    assert [f.path for f in packed.files] == ["cart.py"]
+    assert sorted(packed.dropped) == ["node_modules/left-pad/index.js", "static/app.min.js"]
+    assert packed.boilerplate == ["src/schema_gen.py"]
+
+
+def test_packed_files_keep_archive_order():
+    files = [SubmissionFile("z_utils.py", source(2)), SubmissionFile("README.md", "# Shop"), SubmissionFile("main.py", source(2))]
+
+    packed = pack_files(files, token_budget=10_000)
+
+    assert [f.path for f in packed.files] == ["z_utils.py", "README.md", "main.py"]
+
+
+def test_prompt_lists_what_was_left_out():
+    files = [SubmissionFile("main.py", source(2)), SubmissionFile("dist/bundle.js", "x")]
+    packed = pack_files(files, token_budget=10_000, skipped=["logo.png"])
+
+    text = format_packed_for_llm(packed)
+
+    assert "--- FILE: main.py ---" in text
+    assert "dist/bundle.js" in text.split("omitted to fit the review budget")[1]
+    assert "skipped: logo.png" in text
+
+
+def test_code_in_generic_directories_is_reviewed():
+    files = [SubmissionFile(path, source(2)) for path in ("bin/cli.py", "build/build_index.py", "vendor/mylib/parser.py")]
+
+    packed = pack_files(files, token_budget=10_000)
+
+    assert [f.path for f in packed.files] == ["bin/cli.py", "build/build_index.py", "vendor/mylib/parser.py"]
+    assert packed.dropped == []
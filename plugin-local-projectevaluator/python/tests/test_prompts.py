@@ -0,0 +1,136 @@
+"""Layered prompts: a shared instructions-and-criteria prefix per assignment."""
+import asyncio
+import json
+
+import pytest
+
+import app
+import cortex
+from cortex import CortexClient, SnowflakeConnectionPool
+from llm import FakeBackend
+from mapreduce import build_map_prompt
+from prompts import LayeredPrompt, prompt_prefix
+
+
+def test_layered_prompt_is_a_string_with_a_prefix():
+    prompt = LayeredPrompt(["Instructions", "", "Criteria"], "Code")
+
+    assert prompt == "Instructions\n\nCriteria\n\nCode"
+    assert isinstance(prompt, str)
+    assert prompt.prefix == "Instructions\n\nCriteria\n\n"
+    assert prompt.suffix == "Code"
+    assert prompt_prefix(prompt) == prompt.prefix
+    assert prompt_prefix("a plain prompt") == ""
+
+
+def test_string_operations_return_plain_strings():
+    prompt = LayeredPrompt(["Instructions"], "Code")
+    # Anything derived from the prompt is a different prompt and has no known prefix
+    assert prompt_prefix(prompt + " more") == ""
+    assert prompt_prefix(prompt.strip()) == ""
+
+
+def test_evaluation_prompts_for_one_assignment_share_a_prefix():
+    first = app.build_evaluation_prompt("Build a todo API", "--- FILE: a.py ---")
+    second = app.build_evaluation_prompt("Build a todo API", "--- FILE: b.py ---", resubmission=True)
+    other = app.build_evaluation_prompt("Build a chat app", "--- FILE: a.py ---")
+
+    assert first.prefix == second.prefix
+    assert first.prefix.startswith(app.EVALUATION_SYSTEM_SECTION)
+    assert "Build a todo API" in first.prefix
+    assert "a.py" not in first.prefix
+    assert other.prefix != first.prefix
+    # Per-submission instructions stay out of the shared prefix
+    assert app.RESUBMISSION_INSTRUCTION.strip() in second.suffix
+
+
+def test_assignment_section_is_built_once_per_criteria():
+    app.evaluation_assignment_section.cache_clear()
+    for code in ("one", "two", "three"):
+        app.build_evaluation_prompt("Build a todo API", code)
+
+    info = app.evaluation_assignment_section.cache_info()
+    assert (info.misses, info.hits) == (1, 2)
+
+
+def test_fake_backend_reuses_a_cached_prefix():
+    backend = FakeBackend(latency="fixed:0", seconds_per_1k_chars=0, prefix_cache=True, seed="1")
+    prompts = [build_map_prompt("Build a todo API", f"code {i}", i, 3) for i in range(1, 4)]
+
+    uncached = [backend._uncached_chars(prompt) for prompt in prompts]
+
+    assert uncached[0] == len(prompts[0])
+    assert uncached[1:] == [len(prompt.suffix) for prompt in prompts[1:]]
+    assert backend.prefix_cache_hits == 2
+    assert backend._uncached_chars(str(prompts[0])) == len(prompts[0])
+
+
+class RecordingConnection:
+    def __init__(self):
+        self.executed = []
+
+    def is_closed(self):
+        return False
+
+    def close(self):
+        pass
+
+    def cursor(self):
+        connection = self
+
+        class Cursor:
+            def execute(self, sql, params=None):
+                connection.executed.append((sql, params))
+
+            def fetchone(self):
+                sql = connection.executed[-1][0]
+                if "PARSE_JSON" in sql:
+                    return (json.dumps({"choices": [{"messages": "evaluated"}], "usage": {"prompt_tokens": 10}}),)
+                return ("evaluated",)
+
+            def close(self):
+                pass
+
+        return Cursor()
+
+
+@pytest.fixture
+def connection():
+    return RecordingConnection()
+
+
+@pytest.fixture
+def client(connection):
+    client = CortexClient(SnowflakeConnectionPool(lambda: connection, min_size=0, max_size=1, health_check_interval=60))
+    yield client
+    asyncio.run(client.stop())
+
+
+def test_cortex_sends_the_prefix_as_a_system_message(client, connection, monkeypatch):
+    monkeypatch.setattr(cortex, "CORTEX_PROMPT_CACHING", True)
+    prompt = build_map_prompt("Build a todo API", "code", 1, 1)
+
+    assert asyncio.run(client.complete(prompt, "model")) == "evaluated"
+
+    [(sql, (model, messages, options))] = connection.executed
+    assert sql == cortex.COMPLETE_MESSAGES_SQL
+    assert json.loads(messages) == [
+        {"role": "system", "content": prompt.prefix},
+        {"role": "user", "content": prompt.suffix},
+    ]
+
+
+def test_cortex_sends_plain_prompts_unchanged(client, connection, monkeypatch):
+    monkeypatch.setattr(cortex, "CORTEX_PROMPT_CACHING", True)
+
+    assert asyncio.run(client.complete("Generate a project", "model")) == "evaluated"
+    assert connection.executed == [(cortex.COMPLETE_SQL, ("model", "Generate a project"))]
+
+
+def test_cortex_prompt_caching_is_opt_in(client, connection, monkeypatch):
+    monkeypatch.setattr(cortex, "CORTEX_PROMPT_CACHING", False)
+    prompt = build_map_prompt("Build a todo API", "code", 1, 1)
+
+    asyncio.run(client.complete(prompt, "model"))
+
+    assert connection.executed == [(cortex.COMPLETE_SQL, ("model", prompt))]
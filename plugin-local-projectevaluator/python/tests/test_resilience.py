@@ -0,0 +1,182 @@
+"""Retries, retry budgets and circuit breakers."""
+import asyncio
+
+import pytest
+
+from resilience import (
+    CircuitBreaker,
+    CircuitOpenError,
+    RetryableStatus,
+    call_with_retries,
+    call_with_retries_sync,
+    is_retryable,
+    retry_budget,
+)
+
+
+class Flaky:
+    """Fails with `errors`, one per call, then returns "ok"."""
+
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return "ok"
+
+
+def test_transient_errors_are_retried():
+    func = Flaky(ConnectionError("reset"), RetryableStatus(503))
+    breaker = CircuitBreaker("test")
+
+    assert call_with_retries_sync(func, breaker, "op", attempts=3) == "ok"
+    assert func.calls == 3
+    assert breaker.state == "closed"
+    assert breaker.failures == 0
+
+
+def test_other_errors_are_not_retried():
+    func = Flaky(ValueError("bad input"))
+    breaker = CircuitBreaker("test")
+
+    with pytest.raises(ValueError):
+        call_with_retries_sync(func, breaker, "op", attempts=3)
+    assert func.calls == 1
+    # The upstream answered, so it counts as up
+    assert breaker.failures == 0
+
+
+def test_exhausted_retries_are_marked():
+    func = Flaky(*[RetryableStatus(502) for _ in range(3)])
+    breaker = CircuitBreaker("test", failure_threshold=10)
+
+    with pytest.raises(RetryableStatus) as excinfo:
+        call_with_retries_sync(func, breaker, "op", attempts=3)
+    assert func.calls == 3
+    assert excinfo.value.retries_exhausted
+    # An outer retry loop must not multiply the attempts
+    assert not is_retryable(excinfo.value)
+
+
+def test_async_retries():
+    errors = [TimeoutError("slow"), RetryableStatus(429)]
+    calls = []
+
+    async def func():
+        calls.append(1)
+        if errors:
+            raise errors.pop(0)
+        return "ok"
+
+    result = asyncio.run(call_with_retries(func, CircuitBreaker("test"), "op", attempts=3))
+
+    assert result == "ok"
+    assert len(calls) == 3
+
+
+def test_retry_budget_stops_retries():
+    # A Retry-After longer than the remaining budget ends the retries early
+    func = Flaky(*[RetryableStatus(503, retry_after=5) for _ in range(3)])
+
+    with retry_budget(1):
+        with pytest.raises(RetryableStatus):
+            call_with_retries_sync(func, CircuitBreaker("test"), "op", attempts=3)
+    assert func.calls == 1
+
+
+def test_breaker_opens_after_threshold():
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=30)
+
+    with pytest.raises(RetryableStatus):
+        call_with_retries_sync(Flaky(RetryableStatus(503)), breaker, "op", attempts=1)
+    assert breaker.state == "closed"
+    with pytest.raises(RetryableStatus):
+        call_with_retries_sync(Flaky(RetryableStatus(503)), breaker, "op", attempts=1)
+    assert breaker.state == "open"
+
+    func = Flaky()
+    breaker.opened_at -= 10
+    with pytest.raises(CircuitOpenError) as excinfo:
+        call_with_retries_sync(func, breaker, "op")
+    assert excinfo.value.retry_after == 20
+    assert func.calls == 0
+
+
+def test_half_open_allows_one_trial():
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    assert breaker.state == "open"
+
+    breaker.opened_at -= 31  # the reset timeout has passed
+    breaker.before_call()
+    assert breaker.state == "half_open"
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    # A failed trial reopens the circuit; a successful one closes it
+    breaker.record_failure()
+    assert breaker.state == "open"
+    breaker.opened_at -= 31
+    assert call_with_retries_sync(Flaky(), breaker, "op") == "ok"
+    assert breaker.state == "closed"
+
+
+def test_cancelled_trial_frees_half_open():
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    breaker.opened_at -= 31
+
+    async def hang():
+        await asyncio.sleep(10)
+
+    async def run():
+        task = asyncio.create_task(call_with_retries(hang, breaker, "op"))
+        await asyncio.sleep(0)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(run())
+    assert breaker.state == "half_open"
+    breaker.before_call()  # the next trial is let through
+
+
+def nested_call(outer: CircuitBreaker, inner: CircuitBreaker, connect):
+    """A completion (outer breaker) that opens a connection (inner breaker) first."""
+    def complete():
+        call_with_retries_sync(connect, inner, "connect", attempts=2)
+        return "ok"
+    return call_with_retries_sync(complete, outer, "complete", attempts=2)
+
+
+def test_exhausted_inner_retries_count_against_outer_breaker():
+    outer = CircuitBreaker("outer", failure_threshold=3)
+    inner = CircuitBreaker("inner", failure_threshold=100)
+    connect = Flaky(*[ConnectionError("login failed") for _ in range(100)])
+
+    for _ in range(3):
+        with pytest.raises(ConnectionError):
+            nested_call(outer, inner, connect)
+
+    assert outer.state == "open"
+    # The outer call does not retry an error that was already retried
+    assert connect.calls == 6
+
+
+def test_inner_open_circuit_does_not_close_outer_breaker():
+    outer = CircuitBreaker("outer", failure_threshold=1, reset_timeout=30)
+    inner = CircuitBreaker("inner", failure_threshold=1, reset_timeout=30)
+    outer.record_failure()
+    inner.record_failure()
+    outer.opened_at -= 31
+
+    with pytest.raises(CircuitOpenError) as excinfo:
+        nested_call(outer, inner, Flaky())
+
+    assert excinfo.value.upstream == "inner"
+    # Nothing was learnt about the outer upstream; its trial is free again
+    assert outer.state == "half_open"
+    outer.before_call()
@@ -0,0 +1,208 @@
+"""Winnowing fingerprints and the MinHash/LSH near-duplicate index."""
+import pytest
+
+from ingest import SubmissionFile
+from similarity import (
+    SimilarityIndex,
+    estimated_similarity,
+    fingerprint_files,
+    minhash_signature,
+    normalized_tokens,
+)
+
+
+INVENTORY = '''
+import json
+
+
+class Inventory:
+    """Keeps track of items in stock."""
+
+    def __init__(self, path):
+        self.path = path
+        self.items = {}
+
+    def load(self):
+        with open(self.path) as handle:
+            self.items = json.load(handle)
+        return len(self.items)
+
+    def add(self, name, quantity=1):
+        if quantity <= 0:
+            raise ValueError("quantity must be positive")
+        self.items[name] = self.items.get(name, 0) + quantity
+
+    def remove(self, name, quantity=1):
+        current = self.items.get(name, 0)
+        if current < quantity:
+            raise KeyError(name)
+        if current == quantity:
+            del self.items[name]
+        else:
+            self.items[name] = current - quantity
+
+    def report(self):
+        lines = []
+        for name, quantity in sorted(self.items.items()):
+            lines.append(f"{name}: {quantity}")
+        return "\\n".join(lines)
+
+
+def main():
+    inventory = Inventory("stock.json")
+    inventory.load()
+    inventory.add("apples", 3)
+    inventory.remove("pears")
+    print(inventory.report())
+
+
+if __name__ == "__main__":
+    main()
+'''
+
+# The same program with every name changed, comments added and literals edited
+INVENTORY_RENAMED = '''
+import json
+
+
+class Stock:
+    # Our stock class
+    def __init__(self, filename):
+        self.filename = filename
+        self.products = {}
+
+    def load(self):
+        with open(self.filename) as f:
+            self.products = json.load(f)
+        return len(self.products)
+
+    def add(self, product, amount=2):
+        if amount <= 0:
+            raise ValueError("amount has to be positive")
+        self.products[product] = self.products.get(product, 0) + amount
+
+    def remove(self, product, amount=1):
+        have = self.products.get(product, 0)
+        if have < amount:
+            raise KeyError(product)
+        if have == amount:
+            del self.products[product]
+        else:
+            self.products[product] = have - amount
+
+    def report(self):
+        out = []
+        for product, amount in sorted(self.products.items()):
+            out.append(f"{product} -> {amount}")
+        return "\\n".join(out)
+
+
+def main():
+    stock = Stock("data.json")
+    stock.load()
+    stock.add("bananas", 5)
+    stock.remove("kiwis")
+    print(stock.report())
+
+
+if __name__ == "__main__":
+    main()
+'''
+
+MATRIX = '''
+const SIZE = 8;
+
+function identity(n) {
+  const rows = [];
+  for (let i = 0; i < n; i++) {
+    rows.push(Array.from({ length: n }, (_, j) => (i === j ? 1 : 0)));
+  }
+  return rows;
+}
+
+function multiply(a, b) {
+  return a.map((row, i) =>
+    b[0].map((_, j) => row.reduce((sum, value, k) => sum + value * b[k][j], 0))
+  );
+}
+
+function transpose(m) {
+  return m[0].map((_, i) => m.map(row => row[i]));
+}
+
+async function fetchMatrix(url) {
+  const response = await fetch(url);
+  if (!response.ok) {
+    throw new Error(`request failed: ${response.status}`);
+  }
+  return (await response.json()).matrix;
+}
+
+export default { identity, multiply, transpose, fetchMatrix, SIZE };
+'''
+
+
+def files(path: str, content: str) -> list:
+    return [SubmissionFile(path=path, content=content)]
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = SimilarityIndex(str(tmp_path / "similarity.sqlite3"))
+    yield index
+    index.close()
+
+
+def test_tokens_ignore_names_and_comments():
+    assert normalized_tokens("total = price * 2  # tax") == normalized_tokens("x = y * 3")
+
+
+def test_renamed_copy_has_similar_signature():
+    original = minhash_signature(fingerprint_files(files("a.py", INVENTORY)))
+    renamed = minhash_signature(fingerprint_files(files("b.py", INVENTORY_RENAMED)))
+    unrelated = minhash_signature(fingerprint_files(files("c.js", MATRIX)))
+
+    assert estimated_similarity(original, original) == 1.0
+    assert estimated_similarity(original, renamed) >= 0.5
+    assert estimated_similarity(original, unrelated) < 0.2
+
+
+def test_renamed_copy_is_reported(index):
+    first = index.check(1, 101, "upload", files("inventory.py", INVENTORY))
+    assert first["peers"] == []
+
+    second = index.check(1, 102, "github", files("stock.py", INVENTORY_RENAMED))
+    assert [peer["user_id"] for peer in second["peers"]] == [101]
+    assert second["peers"][0]["source"] == "upload"
+
+
+def test_unrelated_submission_is_not_reported(index):
+    index.check(1, 101, "upload", files("inventory.py", INVENTORY))
+    assert index.check(1, 102, "upload", files("matrix.js", MATRIX))["peers"] == []
+
+
+def test_assignments_are_separate(index):
+    index.check(1, 101, "upload", files("inventory.py", INVENTORY))
+    assert index.check(2, 102, "upload", files("stock.py", INVENTORY_RENAMED))["peers"] == []
+
+
+def test_resubmission_replaces_previous_signature(index):
+    index.check(1, 101, "upload", files("inventory.py", INVENTORY))
+    index.check(1, 101, "upload", files("matrix.js", MATRIX))
+
+    assert index.check(1, 102, "upload", files("stock.py", INVENTORY_RENAMED))["peers"] == []
+    assert index.stats() == {"submissions": 2, "assignments": 1}
+
+
+def test_unknown_student_is_compared_but_not_stored(index):
+    index.check(1, 101, "upload", files("inventory.py", INVENTORY))
+
+    result = index.check(1, None, "upload", files("stock.py", INVENTORY_RENAMED))
+
+    assert [peer["user_id"] for peer in result["peers"]] == [101]
+    assert index.stats()["submissions"] == 1
+
+
+def test_tiny_submissions_are_not_compared(index):
+    assert index.check(1, 101, "upload", files("hello.py", "print('hello')\n")) is None
+    assert index.stats()["submissions"] == 0